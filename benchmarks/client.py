@@ -0,0 +1,385 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS.
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the CIS client against a local fake CIS server
+
+A `~cis.fake.FakeCISServer` is started on the local host for each
+catalog size, serving a synthetic catalog over HTTP, and the following
+are measured:
+
+- ``query``: `ChannelList.query` of the whole catalog, without
+  descriptions
+- ``descriptions``: the extra cost per channel of fetching descriptions
+- ``construct``: building a `ChannelList` from JSON records, one
+  `Channel` at a time and in bulk
+- ``sieve``, ``find``: searching a `ChannelList`
+- ``memory``: resident memory per `Channel`
+- ``threads``: a stress test of many concurrent queries, from
+  ``--threads`` threads, half sharing a single session and half with a
+  session each, all sharing one cookie file; the results are checked
+  against the same queries made serially
+
+All results are in seconds (or bytes), so lower is better. Results can
+be saved as a baseline with ``--save``, and compared against a stored
+baseline with ``--compare``, in which case the script exits with a
+non-zero status if any result is slower than the baseline by more than
+``--tolerance``.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+
+from cis import (connect, channel, version)
+from cis.channel import ChannelList
+from cis.fake import (FakeCIS, FakeCISServer)
+from cis.transport import UrllibTransport
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'baselines')
+
+BENCHMARKS = ['query', 'descriptions', 'construct', 'sieve', 'find',
+              'memory', 'threads', 'offline']
+
+
+# -----------------------------------------------------------------------------
+# utilities
+
+def best_of(func, repeat=3):
+    """Run a function ``repeat`` times and return the fastest time
+    """
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def rss():
+    """Return the resident memory of this process, in bytes
+    """
+    try:
+        with open('/proc/self/statm', 'r') as fobj:
+            return int(fobj.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Client(object):
+    """Query a `FakeCISServer` through a new session
+    """
+    def __init__(self, server, workers):
+        self.server = server
+        self.workers = workers
+
+    def session(self, cookiejar=False):
+        return connect.Session(transport=UrllibTransport(
+            auth=False, cookiejar=cookiejar, workers=self.workers))
+
+    def query(self, name, **kwargs):
+        with self.session() as session:
+            return ChannelList.query(name, session=session, **kwargs)
+
+
+# -----------------------------------------------------------------------------
+# benchmarks
+
+def bench_query(client, backend, args):
+    """Time a query for the full catalog, without descriptions
+    """
+    return best_of(lambda: client.query('', descriptions=False,
+                                        page_size=args.page_size),
+                   args.repeat)
+
+
+def bench_descriptions(client, backend, args):
+    """Time the extra cost per channel of fetching descriptions
+    """
+    # query a single system, to keep the number of requests sensible
+    name = backend.channels[0]['name'].split('-', 1)[0]
+    n = len(backend.search(name))
+    without = best_of(lambda: client.query(name, descriptions=False),
+                      args.repeat)
+    with_ = best_of(lambda: client.query(name, descriptions=True),
+                    args.repeat)
+    return (with_ - without) / max(n, 1)
+
+
+def bench_construct(client, backend, args):
+    """Time building a `ChannelList` from records, per channel
+    """
+    records = backend.channels
+    n = len(records)
+    single = best_of(lambda: ChannelList(map(channel.Channel.from_json,
+                                             records)), args.repeat)
+    bulk = best_of(lambda: ChannelList.from_json_records(records),
+                   args.repeat)
+    return {'single': single / n, 'bulk': bulk / n}
+
+
+def bench_sieve(client, backend, args):
+    """Time sieving a `ChannelList` by name and by sample rate
+    """
+    channels = ChannelList.from_json_records(backend.channels)
+    return {
+        'name': best_of(lambda: channels.sieve(name='PSL'), args.repeat),
+        'sample_rate': best_of(lambda: channels.sieve(name='',
+                                                      sample_rate=16384),
+                               args.repeat),
+    }
+
+
+def bench_find(client, backend, args):
+    """Time finding the last `Channel` in a `ChannelList`
+    """
+    channels = ChannelList.from_json_records(backend.channels)
+    last = channels[-1].name
+    return best_of(lambda: channels.find(last), args.repeat)
+
+
+def bench_memory(client, backend, args):
+    """Measure the resident memory used per `Channel`
+    """
+    gc.collect()
+    before = rss()
+    channels = ChannelList.from_json_records(backend.channels)
+    for c in channels:  # parse every name
+        c.signal
+    gc.collect()
+    used = rss() - before
+    del channels
+    return float(used) / len(backend.channels)
+
+
+def bench_threads(client, backend, args):
+    """Stress-test concurrent queries, returning the time per query
+    """
+    import shutil
+    import tempfile
+    from multiprocessing.pool import ThreadPool
+    names = sorted(set(r['name'].split('-', 1)[0] for r in backend.channels))
+    expected = dict((name, [c.name for c in client.query(name)])
+                    for name in names)
+    tmpdir = tempfile.mkdtemp()
+    cookiejar = os.path.join(tmpdir, 'cookies')
+    shared = client.session(cookiejar=cookiejar)
+
+    def run(i):
+        name = names[i % len(names)]
+        if i % 2:
+            result = ChannelList.query(name, session=shared)
+        else:
+            with client.session(cookiejar=cookiejar) as session:
+                result = ChannelList.query(name, session=session)
+        if [c.name for c in result] != expected[name] or not all(
+                c.descriptions is not None for c in result):
+            raise RuntimeError("Concurrent query for %r returned the "
+                               "wrong channels" % name)
+
+    pool = ThreadPool(args.threads)
+    try:
+        nquery = args.threads * 4
+        return best_of(lambda: pool.map(run, range(nquery)),
+                       args.repeat) / nquery
+    finally:
+        pool.close()
+        pool.join()
+        shared.close()
+        shutil.rmtree(tmpdir)
+
+
+def bench_offline(client, backend, args):
+    """Time offline queries, checking they match the same queries online
+    """
+    import shutil
+    import tempfile
+    from cis import catalog
+    names = [r['name'] for r in backend.channels[:3]]
+    queries = ['']
+    for name in names:
+        ifo, rest = name.split(':', 1)
+        system, signal = rest.split('-', 1)
+        subsystem = signal.split('_', 1)[0]
+        queries.extend([name, '%s:%s' % (ifo, system),
+                        '%s:%s*' % (ifo, system),
+                        '%s:%s*%s' % (ifo, system, subsystem),
+                        '%s*%s' % (system, subsystem),
+                        '%s %s' % (subsystem, system)])
+    tmpdir = tempfile.mkdtemp()
+    try:
+        catalog.set_catalog(catalog.Catalog.write(
+            os.path.join(tmpdir, 'catalog'), backend.channels))
+        for query in queries:
+            online = [c.name for c in client.query(query, descriptions=False)]
+            offline = [c.name for c in ChannelList.query(query, offline=True)]
+            if sorted(online) != offline:
+                raise RuntimeError("Offline query for %r returned %d "
+                                   "channels, not %d as online"
+                                   % (query, len(offline), len(online)))
+        return best_of(lambda: [ChannelList.query(q, offline=True) for
+                                q in queries], args.repeat) / len(queries)
+    finally:
+        catalog.get_catalog().close()
+        catalog.set_catalog(None)
+        shutil.rmtree(tmpdir)
+
+
+# -----------------------------------------------------------------------------
+# results
+
+def flatten(results, prefix=''):
+    """Flatten nested `dict` of results into ``{'a.b.c': value}``
+    """
+    out = {}
+    for key, value in results.items():
+        key = prefix and '%s.%s' % (prefix, key) or str(key)
+        if isinstance(value, dict):
+            out.update(flatten(value, key))
+        else:
+            out[key] = value
+    return out
+
+
+def compare(results, baseline, tolerance):
+    """Compare results against a baseline, returning the regressions
+    """
+    new = flatten(results)
+    old = flatten(baseline['results'])
+    regressions = []
+    print("\n%-40s %12s %12s %8s" % ('benchmark', 'baseline', 'this',
+                                      'ratio'))
+    for key in sorted(new):
+        if key not in old or not old[key]:
+            print("%-40s %12s %12.4g %8s" % (key, '-', new[key], '-'))
+            continue
+        ratio = new[key] / old[key]
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(key)
+            flag = ' *'
+        print("%-40s %12.4g %12.4g %8.2f%s" % (key, old[key], new[key],
+                                                ratio, flag))
+    return regressions
+
+
+def baseline_path(name):
+    if os.path.sep in name or name.endswith('.json'):
+        return name
+    return os.path.join(BASELINE_DIR, '%s.json' % name)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-b', '--benchmark', action='append',
+                        choices=BENCHMARKS, default=[],
+                        help='benchmark to run, may be given multiple '
+                             'times, default: all')
+    parser.add_argument('-n', '--size', type=int, action='append',
+                        default=[],
+                        help='number of channels in the catalog, may be '
+                             'given multiple times, default: 1000, 10000')
+    parser.add_argument('-p', '--page-size', type=int, default=None,
+                        help='page size for queries, default: chosen by '
+                             'the client')
+    parser.add_argument('-m', '--max-page-size', type=int, default=1000,
+                        help='largest page size served, default: '
+                             '%(default)s')
+    parser.add_argument('-l', '--latency', type=float, default=0,
+                        help='seconds of latency added to every request, '
+                             'default: %(default)s')
+    parser.add_argument('-z', '--compress', action='store_true',
+                        default=False,
+                        help='serve gzip-compressed replies')
+    parser.add_argument('-j', '--workers', type=int, default=8,
+                        help='number of threads for description requests, '
+                             'default: %(default)s')
+    parser.add_argument('-T', '--threads', type=int, default=16,
+                        help='number of threads for the threads '
+                             'benchmark, default: %(default)s')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='number of times to repeat each timing, the '
+                             'fastest is reported, default: %(default)s')
+    parser.add_argument('-s', '--save', metavar='NAME',
+                        help='save results as a baseline, either a file '
+                             'path or a name in %s' % BASELINE_DIR)
+    parser.add_argument('-c', '--compare', metavar='NAME',
+                        help='compare results against a stored baseline')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='fractional slow-down against the baseline '
+                             'allowed before failing, default: %(default)s')
+    args = parser.parse_args(args)
+    benchmarks = args.benchmark or BENCHMARKS
+    sizes = args.size or [1000, 10000]
+
+    results = {}
+    api_url = channel.CHANNEL_API_URL
+    for size in sizes:
+        print("Catalog of %d channels:" % size)
+        backend = FakeCIS.generate(size, latency=args.latency,
+                                   compress=args.compress,
+                                   max_page_size=args.max_page_size)
+        with FakeCISServer(backend) as server:
+            channel.CHANNEL_API_URL = server.api_url
+            client = Client(server, args.workers)
+            try:
+                for name in benchmarks:
+                    func = globals()['bench_%s' % name]
+                    result = func(client, backend, args)
+                    results.setdefault(name, {})[str(size)] = result
+                    for key, value in sorted(flatten({name: result}).items()):
+                        print("    %-30s %.4g" % (key, value))
+            finally:
+                channel.CHANNEL_API_URL = api_url
+
+    status = 0
+    if args.compare:
+        with open(baseline_path(args.compare), 'r') as fobj:
+            baseline = json.load(fobj)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n%d benchmark(s) slower than baseline by more than "
+                  "%d%%" % (len(regressions), args.tolerance * 100))
+            status = 1
+    if args.save:
+        path = baseline_path(args.save)
+        if not os.path.isdir(os.path.dirname(path) or '.'):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fobj:
+            json.dump({'version': version.__version__,
+                       'python': sys.version.split()[0],
+                       'options': {'latency': args.latency,
+                                   'compress': args.compress,
+                                   'page_size': args.page_size,
+                                   'workers': args.workers,
+                                   'threads': args.threads},
+                       'results': results}, fobj, indent=2, sort_keys=True)
+        print("\nBaseline written to %s" % path)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
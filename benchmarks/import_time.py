@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS.
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Measure the time taken to ``import cis`` in a fresh interpreter
+
+Each trial runs in a new process, so that nothing is cached in
+`sys.modules`. The script also reports whether any of the heavy or
+network-only dependencies were imported as a side effect, and exits
+with a non-zero status if so, or if the median import time exceeds
+``--max-time``.
+"""
+
+from __future__ import print_function
+
+import argparse
+import subprocess
+import sys
+
+# modules that should only be imported when they are first used
+LAZY_MODULES = ['numpy', 'dateutil', 'json', 'urllib2', 'cookielib',
+                'kerberos', 'cis.saml']
+
+TRIAL = """
+import sys, time
+t = time.time()
+import cis
+t = time.time() - t
+sys.stdout.write('%%r %%s\\n' %% (t, ','.join(
+    m for m in %r if m in sys.modules)))
+""" % LAZY_MODULES
+
+
+def run_trial(python):
+    """Import cis in a new interpreter
+
+    Returns
+    -------
+    time : `float`
+        time taken to import cis (seconds)
+    modules : `list` of `str`
+        members of `LAZY_MODULES` that were imported along with cis
+    """
+    out = subprocess.check_output([python, '-c', TRIAL])
+    time_, modules = out.decode('utf-8').splitlines()[-1].split(' ')
+    return float(time_), [m for m in modules.split(',') if m]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--trials', type=int, default=20,
+                        help='number of imports to time, default: %(default)s')
+    parser.add_argument('-p', '--python', default=sys.executable,
+                        help='python interpreter, default: %(default)s')
+    parser.add_argument('-m', '--max-time', type=float, default=None,
+                        help='fail if the median import time (seconds) is '
+                             'longer than this')
+    args = parser.parse_args(args)
+
+    times = []
+    modules = set()
+    for _ in range(args.trials):
+        time_, imported = run_trial(args.python)
+        times.append(time_)
+        modules.update(imported)
+    times.sort()
+    median = times[len(times) // 2]
+
+    print("import cis: min %.2f ms, median %.2f ms, max %.2f ms "
+          "(%d trials)" % (times[0] * 1e3, median * 1e3, times[-1] * 1e3,
+                           args.trials))
+    status = 0
+    if modules:
+        print("Modules imported eagerly: %s" % ', '.join(sorted(modules)))
+        status = 1
+    if args.max_time is not None and median > args.max_time:
+        print("Median import time exceeds %.2f ms" % (args.max_time * 1e3))
+        status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
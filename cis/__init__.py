@@ -36,3 +36,5 @@ __version__ = version.__version__
 
 from .channel import *
 from .description import *
+from .profiling import profile
+from .index import (exists, exists_many)
@@ -0,0 +1,551 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Read-only on-disk catalog of channels, for offline queries
+
+A `Catalog` file holds every channel record from the CIS in a compact
+binary format that is memory-mapped, rather than read, when opened, so
+that any number of processes on one host share a single copy through
+the page cache, and only the pages touched by a query are ever loaded:
+
+>>> from cis.catalog import Catalog
+>>> Catalog.sync('cis.catalog')  # once, with network access
+
+then, on any node:
+
+>>> from cis import (catalog, ChannelList)
+>>> catalog.set_catalog('cis.catalog')
+>>> ChannelList.query('L1:PSL-ISS', offline=True)
+
+The default catalog is set with `set_catalog`, or is read from the
+file named by the ``CIS_CATALOG`` environment variable.
+
+File format
+-----------
+All numbers are little-endian. The file starts with a magic line, then
+a line of JSON giving the number of channels, the offset and length of
+each section (relative to the end of the header, which is padded to a
+multiple of 8 bytes), and the lookup tables of the enumerated columns.
+The sections are:
+
+=================  ========================================================
+``names``          channel names, sorted, each followed by ``\\n``
+``names_offsets``  ``uint64`` offset of each name in ``names``, plus the
+                   length of ``names``
+``sample_rate``    ``float64``, ``NaN`` if unknown
+``datatype``       ``int16`` CIS data type enum, ``-1`` if unknown
+``created``        ``float64`` UNIX time (UTC), ``NaN`` if unknown
+``units``,         ``uint32`` index into a table of the distinct values
+``source``
+``url``,           variable-length strings, with ``<column>_offsets``,
+``displayurl``     stored as for the names
+=================  ========================================================
+"""
+
+import os
+import re
+import json
+import mmap
+import struct
+import datetime
+import threading
+
+from . import (version, timing)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['Catalog', 'set_catalog', 'get_catalog']
+
+_MAGIC = 'CIS-CATALOG 1\n'
+
+# a query word starting with an IFO prefix can only match at the start
+# of a name
+_re_ifo = re.compile(r'[A-Z]\d:')
+
+# variable-length string columns, and enumerated string columns
+_STRINGS = ('names', 'url', 'displayurl')
+_ENUMS = ('units', 'source')
+
+# numpy types of the fixed-width columns
+_ARRAYS = {'sample_rate': '<f8', 'datatype': '<i2', 'created': '<f8',
+           'units': '<u4', 'source': '<u4'}
+
+_CATALOG = None
+_CATALOG_LOCK = threading.Lock()
+
+_OFFSETS = struct.Struct('<QQ')
+_DOUBLE = struct.Struct('<d')
+_INT16 = struct.Struct('<h')
+_UINT32 = struct.Struct('<I')
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_NAN = float('nan')
+
+
+class Catalog(object):
+    """Memory-mapped, read-only catalog of channel records
+
+    Parameters
+    ----------
+    filename : `str`
+        path of a catalog file written by `Catalog.write`
+
+    Notes
+    -----
+    A `Catalog` is safe to query from many threads at once. Nothing is
+    read from the file until it is needed, and `Channel` objects are
+    only built for the rows returned by a query.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fobj:
+            if fobj.readline() != _MAGIC:
+                raise ValueError("%r is not a CIS catalog file" % filename)
+            header = fobj.readline()
+            base = fobj.tell()
+            self._mmap = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        meta = json.loads(header)
+        base += -base % 8
+        self.count = meta['count']
+        self.created = meta['created']
+        # JSON gives unicode, but records hold str, as from the CIS
+        self.tables = dict((key, [_bytes(v) for v in values]) for
+                           key, values in meta['tables'].items())
+        self._sections = dict((key, (base + start, size)) for
+                              key, (start, size) in meta['sections'].items())
+        self._starts = dict((key, start) for
+                            key, (start, _) in self._sections.items())
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Unmap the catalog file
+        """
+        self._mmap.close()
+
+    # ------------------------------------------------------------------------
+    # writing
+
+    @classmethod
+    def write(cls, filename, records, created=None):
+        """Write a catalog file from channel records
+
+        The file is replaced atomically, so that it can be updated
+        while in use; processes that have it open keep the old copy
+        until they re-open it.
+
+        Parameters
+        ----------
+        filename : `str`
+            path of output file
+        records : iterable of `dict`
+            channel records, as returned by the CIS API, or by
+            `Channel.to_json`
+        created : `float`, optional
+            UNIX time at which the records were synced
+
+        Returns
+        -------
+        catalog : `Catalog`
+            the new catalog, opened
+        """
+        from .dates import parse_datetime
+        records = sorted(records, key=lambda r: _bytes(r['name']))
+        count = len(records)
+        sections = []
+
+        def strings(values):
+            values = [_bytes(v or '') + '\n' for v in values]
+            offsets = [0]
+            for v in values:
+                offsets.append(offsets[-1] + len(v))
+            return ''.join(values), _pack('Q', offsets)
+
+        names, offsets = strings(r['name'] for r in records)
+        sections.extend([('names', names), ('names_offsets', offsets)])
+        sections.append(('sample_rate', _pack('d', [
+            _NAN if r.get('datarate') is None else float(r['datarate'])
+            for r in records])))
+        sections.append(('datatype', _pack('h', [
+            -1 if r.get('datatype') is None else int(r['datatype'])
+            for r in records])))
+        sections.append(('created', _pack('d', [
+            _timestamp(parse_datetime(r.get('created')))
+            for r in records])))
+        tables = {}
+        for key in _ENUMS:
+            table = sorted(set(r.get(key) for r in records))
+            codes = dict((v, i) for i, v in enumerate(table))
+            tables[key] = table
+            sections.append((key, _pack('I', [codes[r.get(key)]
+                                              for r in records])))
+        for key in _STRINGS[1:]:
+            blob, offsets = strings(r.get(key) for r in records)
+            sections.extend([(key, blob), ('%s_offsets' % key, offsets)])
+
+        # lay out the sections, each aligned to 8 bytes
+        layout = {}
+        pos = 0
+        for key, data in sections:
+            layout[key] = (pos, len(data))
+            pos += len(data) + (-len(data) % 8)
+        header = json.dumps({'count': count, 'created': created,
+                             'sections': layout, 'tables': tables},
+                            sort_keys=True) + '\n'
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'wb') as fobj:
+            fobj.write(_MAGIC)
+            fobj.write(header)
+            fobj.write('\0' * (-fobj.tell() % 8))
+            for key, data in sections:
+                fobj.write(data)
+                fobj.write('\0' * (-len(data) % 8))
+        os.rename(tmp, filename)
+        return cls(filename)
+
+    @classmethod
+    def sync(cls, filename, session=None, debug=False, timeout=None):
+        """Write a catalog file of every channel in the CIS
+
+        Parameters
+        ----------
+        filename : `str`
+            path of output file
+        session : `~cis.connect.Session`, optional
+            open session to reuse for all HTTP requests
+        debug : `bool`, optional
+            print verbose HTTP connection status for debugging
+        timeout : `float`, optional
+            seconds after which to abandon the sync, default: no limit
+
+        Returns
+        -------
+        catalog : `Catalog`
+            the new catalog, opened
+        """
+        import time
+        from .channel import (ChannelList, MAX_PAGE_SIZE)
+        created = time.time()
+        records = [c.to_json() for c in ChannelList.iterquery(
+            '', descriptions=False, debug=debug, page_size=MAX_PAGE_SIZE,
+            session=session, timeout=timeout)]
+        return cls.write(filename, records, created=created)
+
+    # ------------------------------------------------------------------------
+    # lookup
+
+    def _string(self, key, i):
+        # the offsets of each string column follow the column itself
+        start = self._starts[key]
+        a, b = _OFFSETS.unpack_from(self._mmap,
+                                    self._starts[key + '_offsets'] + 8 * i)
+        return self._mmap[start + a:start + b - 1]
+
+    def name(self, i):
+        """Return the name of the channel in row ``i``
+        """
+        return self._string('names', i)
+
+    def names(self):
+        """Return the names of all channels in this catalog
+
+        Returns
+        -------
+        names : `list` of `str`
+            one name per row, in order
+        """
+        start, size = self._sections['names']
+        return self._mmap[start:start + size].split('\n')[:-1]
+
+    def _bisect(self, name):
+        # index of the first row whose name is not less than ``name``
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _row_at(self, pos):
+        # index of the row whose name contains byte ``pos`` of ``names``
+        start = self._starts['names_offsets']
+        lo, hi = 0, self.count
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if struct.unpack_from('<Q', self._mmap, start + 8 * mid)[0] > pos:
+                hi = mid
+            else:
+                lo = mid
+        return lo
+
+    def find(self, name):
+        """Find the row of the channel with exactly the given name
+
+        Parameters
+        ----------
+        name : `str`
+            full name of channel
+
+        Returns
+        -------
+        row : `int`, `None`
+            index of the matching row, or `None` if not found
+        """
+        name = _bytes(name)
+        i = self._bisect(name)
+        if i < self.count and self.name(i) == name:
+            return i
+        return None
+
+    def search(self, q):
+        """Find the rows of all channels matching a query
+
+        As for the CIS, whitespace-separated words in the query must all
+        appear in a channel's name for it to match, with ``*`` treated
+        as whitespace, as in `~cis.channel.query_url`. A word starting
+        with an IFO prefix (e.g. ``L1:``) can only match at the start
+        of a name, so is found by binary search; otherwise the names
+        are scanned for the longest word, in place in the mapped file.
+
+        Parameters
+        ----------
+        q : `str`
+            query string
+
+        Returns
+        -------
+        rows : `list` of `int`
+            indices of the matching rows, in name order
+        """
+        words = re.sub('[\*\s]', ' ', _bytes(q)).split()
+        if not words:
+            return range(self.count)
+        prefixes = [w for w in words if _re_ifo.match(w)]
+        if prefixes:
+            prefix = max(prefixes, key=len)
+            lo = self._bisect(prefix)
+            hi = self._bisect(prefix + '\xff')
+            candidates = xrange(lo, hi)
+        else:
+            candidates = self._scan(max(words, key=len))
+        return [i for i in candidates if
+                all(w in self.name(i) for w in words)]
+
+    def _scan(self, word):
+        start, size = self._sections['names']
+        end = start + size
+        mm = self._mmap
+        ostart = self._starts['names_offsets']
+        pos = mm.find(word, start, end)
+        while pos != -1:
+            i = self._row_at(pos - start)
+            yield i
+            # skip to the start of the next name
+            nxt = struct.unpack_from('<Q', mm, ostart + 8 * (i + 1))[0]
+            pos = mm.find(word, start + nxt, end)
+
+    def array(self, key):
+        """Return a fixed-width column of this catalog as an array
+
+        The array is a read-only view of the mapped file, so nothing
+        is copied, but it must not be used after the catalog is closed.
+
+        Parameters
+        ----------
+        key : `str`
+            name of column, one of ``'sample_rate'``, ``'datatype'``,
+            ``'created'``, ``'units'``, or ``'source'``; the last two
+            hold indices into the lists in `Catalog.tables`
+
+        Returns
+        -------
+        array : `numpy.ndarray`
+            one element per row, in name order
+
+        Raises
+        ------
+        ValueError
+            if ``key`` is not the name of a fixed-width column
+        """
+        import numpy
+        try:
+            dtype = _ARRAYS[key]
+        except KeyError:
+            raise ValueError("No fixed-width column %r in catalog" % key)
+        return numpy.frombuffer(self._mmap, dtype=dtype, count=self.count,
+                                offset=self._starts[key])
+
+    def record(self, i):
+        """Return the channel record in row ``i``
+
+        Returns
+        -------
+        record : `dict`
+            record using the CIS REST field names, as for
+            `Channel.to_json`, except that ``created`` is a
+            `datetime.datetime`
+        """
+        from .dates import UTC
+        mm = self._mmap
+        starts = self._starts
+        rate, = _DOUBLE.unpack_from(mm, starts['sample_rate'] + 8 * i)
+        dtype, = _INT16.unpack_from(mm, starts['datatype'] + 2 * i)
+        created, = _DOUBLE.unpack_from(mm, starts['created'] + 8 * i)
+        out = {
+            'name': self._string('names', i),
+            'datarate': None if rate != rate else rate,
+            'datatype': None if dtype < 0 else dtype,
+            'created': None if created != created else (
+                _EPOCH + datetime.timedelta(seconds=created)).replace(
+                    tzinfo=UTC),
+        }
+        for key in _ENUMS:
+            code, = _UINT32.unpack_from(mm, starts[key] + 4 * i)
+            out[key] = self.tables[key][code]
+        for key in _STRINGS[1:]:
+            out[key] = self._string(key, i) or None
+        return out
+
+    def channels(self, rows):
+        """Build a `ChannelList` from the given rows
+
+        Parameters
+        ----------
+        rows : iterable of `int`
+            indices of rows to include
+
+        Returns
+        -------
+        channels : `~cis.channel.ChannelList`
+            a new list of channels, in the order of ``rows``
+        """
+        from .channel import ChannelList
+        return ChannelList.from_json_records(map(self.record, rows))
+
+    def query(self, q):
+        """Query this catalog for all channels matching the given name
+
+        Parameters
+        ----------
+        q : `str`
+            name of channel, or part of it, see `Catalog.search`
+
+        Returns
+        -------
+        channels : `~cis.channel.ChannelList`
+            the matching channels, in name order
+        """
+        rows = self.search(q)
+        timing.incr('catalog.rows', len(rows))
+        return self.channels(rows)
+
+    def diff(self, other, fields=None):
+        """Compare this catalog with a later snapshot
+
+        Parameters
+        ----------
+        other : `Catalog`
+            the later catalog
+        fields : `list` of `str`, optional
+            `Channel` attributes to compare, default:
+            `cis.diff.DIFF_FIELDS`; attributes not stored in a catalog
+            (e.g. ``'descriptions'``) are ignored
+
+        Returns
+        -------
+        diff : `~cis.diff.ChannelDiff`
+            the channels added, removed, and changed in ``other``
+
+        See Also
+        --------
+        cis.diff.diff_catalogs
+            for details of how catalogs are compared
+        """
+        from .diff import diff_catalogs
+        return diff_catalogs(self, other, fields=fields)
+
+
+def _bytes(name):
+    if isinstance(name, unicode):
+        return name.encode('utf-8')
+    return name
+
+
+def _pack(fmt, values):
+    return struct.pack('<%d%s' % (len(values), fmt), *values)
+
+
+def _timestamp(date):
+    if date is None:
+        return _NAN
+    if date.tzinfo is not None:
+        date = date.replace(tzinfo=None) - date.utcoffset()
+    return (date - _EPOCH).total_seconds()
+
+
+# -----------------------------------------------------------------------------
+# default catalog
+
+def set_catalog(catalog):
+    """Set the catalog used for offline queries
+
+    Parameters
+    ----------
+    catalog : `Catalog`, `str`, `None`
+        the catalog, or the path of a catalog file, or `None` to unset
+    """
+    global _CATALOG
+    if isinstance(catalog, basestring):
+        catalog = Catalog(catalog)
+    with _CATALOG_LOCK:
+        _CATALOG = catalog
+
+
+def get_catalog():
+    """Return the catalog used for offline queries
+
+    Returns
+    -------
+    catalog : `Catalog`
+        the catalog set with `set_catalog`, or opened from the file
+        named by the ``CIS_CATALOG`` environment variable
+
+    Raises
+    ------
+    ValueError
+        if no catalog has been set
+    """
+    global _CATALOG
+    with _CATALOG_LOCK:
+        if _CATALOG is None and os.getenv('CIS_CATALOG'):
+            _CATALOG = Catalog(os.environ['CIS_CATALOG'])
+        if _CATALOG is None:
+            raise ValueError("No catalog set for offline queries, use "
+                             "cis.catalog.set_catalog, or set the "
+                             "CIS_CATALOG environment variable")
+        return _CATALOG
@@ -21,35 +21,58 @@
 
 import re
 import os
-import numpy
-import json
+import gc
 import datetime
-import dateutil.parser
 import urlparse
 import textwrap
-from urllib2 import HTTPError
+import operator
+from contextlib import contextmanager
 
-from . import (connect, version, description)
+from . import (connect, version, description, timing)
+from .stream import PageReader
+from .dates import (parse_datetime, to_datetime64)
+from .names import (COMPONENTS, split_name, parse_names)
 
 __author__ = "Duncan Macleod <duncan.macleod@ligo.org>"
 __version__ = version.__version__
 
-__all__ = ['Channel', 'ChannelList']
+__all__ = ['Channel', 'ChannelList', 'QueryTimeout']
 
 _re_ifo = re.compile("[A-Z]\d:")
 _re_cchar = re.compile("[-_]")
+_re_url = re.compile("\A[A-Za-z][A-Za-z0-9+.-]*://[^/?#]+/")
 
+# numpy is only imported when a dtype is first needed, so the data types
+# are named here rather than given as numpy types
 DATA_TYPE_ENUM = {0: None,
-                  1: numpy.int16,
-                  2: numpy.int32,
-                  3: numpy.int64,
-                  4: numpy.float32,
-                  5: numpy.double,
-                  6: numpy.complex64,
+                  1: 'int16',
+                  2: 'int32',
+                  3: 'int64',
+                  4: 'float32',
+                  5: 'float64',
+                  6: 'complex64',
                   }
 
+# cache of dtype objects, keyed by the input to `Channel.dtype`; this is
+# not locked, since at worst two threads build (equal) dtypes for a key
+_DTYPE_CACHE = {}
+
+# attributes of a `Channel` that are pickled, see `Channel.__reduce__`;
+# the name components are parsed again when unpickled
+_STATE = ('_name', 'descriptions', '_description', '_sample_rate', '_unit',
+          'frametype', '_dtype', '_model', '_url', '_apiurl', 'cisid',
+          '_created')
+
 CHANNEL_API_URL = 'https://cis.ligo.org/api/channel'
 
+# JSON fields read by `Channel.from_json`, requested by default from the API
+CHANNEL_FIELDS = ('name', 'datarate', 'units', 'datatype', 'displayurl',
+                  'url', 'source', 'created')
+
+# page sizes for queries expected to return few or many results
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 1000
+
 
 class Channel(object):
     """Representation of a LIGO data channel.
@@ -103,6 +126,7 @@ class Channel(object):
         self.apiurl = apiurl
         self.cisid = cisid
         self.created = created
+        timing.incr('objects.Channel')
 
     @property
     def name(self):
@@ -118,7 +142,11 @@ class Channel(object):
     @name.setter
     def name(self, n):
         self._name = n
-        self.parse_name(n)
+        # the name is split now, but the components are only converted
+        # into `Description` objects when first accessed
+        for attr in COMPONENTS:
+            self.__dict__.pop('_%s' % attr, None)
+        self._name_parts = n and split_name(n) or None
 
     @property
     def description(self):
@@ -141,7 +169,7 @@ class Channel(object):
 
         :type: `str`
         """
-        return self._ifo
+        return self._name_part('_ifo')
 
     @property
     def system(self):
@@ -150,7 +178,7 @@ class Channel(object):
 
         :type: `Description`
         """
-        return self._system
+        return self._name_part('_system')
 
     @property
     def subsystem(self):
@@ -159,7 +187,7 @@ class Channel(object):
 
         :type: :class:`~cis.description.Description`
         """
-        return self._subsystem
+        return self._name_part('_subsystem')
 
     @property
     def signal(self):
@@ -168,7 +196,16 @@ class Channel(object):
 
         :type: :class:`~cis.description.Description`
         """
-        return self._signal
+        return self._name_part('_signal')
+
+    def _name_part(self, attr):
+        # name components are parsed on first access if they were
+        # not set when this `Channel` was created
+        try:
+            return self.__dict__[attr]
+        except KeyError:
+            self.parse_name(self.name, parts=self.__dict__.get('_name_parts'))
+            return getattr(self, attr)
 
     @property
     def sample_rate(self):
@@ -180,7 +217,7 @@ class Channel(object):
 
     @sample_rate.setter
     def sample_rate(self, rate):
-        self._sample_rate = float(rate)
+        self._sample_rate = rate if rate is None else float(rate)
 
     @property
     def unit(self):
@@ -220,26 +257,29 @@ class Channel(object):
 
     @dtype.setter
     def dtype(self, type_):
-        if isinstance(type_, int):
-            type_ = DATA_TYPE_ENUM[type_]
-        self._dtype = numpy.dtype(type_)
+        self._dtype = _as_dtype(type_)
 
     @property
     def created(self):
         """Creation datetime for this `Channel`.
 
+        The date is stored as given, and only parsed when first
+        accessed.
+
         :type: :class:`datetime.datetime`
         """
+        if isinstance(self._created, basestring):
+            self._created = parse_datetime(self._created)
         return self._created
 
     @created.setter
     def created(self, date):
-        if date is None:
+        if date is None or isinstance(date, (datetime.datetime,
+                                             basestring)):
             self._created = date
-        elif isinstance(date, datetime.datetime):
-            self._created = datetime
         else:
-            self._created = dateutil.parser.parse(date)
+            raise TypeError("Cannot interpret %r as a creation date"
+                            % (date,))
 
     @property
     def url(self):
@@ -297,6 +337,33 @@ class Channel(object):
         else:
             return repr_
 
+    def __eq__(self, other):
+        # channels are the same if they have the same name, so that
+        # results from different queries can be compared and hashed
+        if not isinstance(other, Channel):
+            return NotImplemented
+        return self.name == other.name
+
+    def __ne__(self, other):
+        if not isinstance(other, Channel):
+            return NotImplemented
+        return self.name != other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __reduce__(self):
+        # pickle as a flat tuple of attributes, restored without going
+        # through the property setters
+        return (_unpickle_channel, (self.__class__, self._state()))
+
+    def _state(self):
+        get = self.__dict__.get
+        descriptions = get('descriptions')
+        if descriptions is not None:
+            descriptions = tuple(descriptions.iteritems())
+        return (get('_name'), descriptions) + tuple(map(get, _STATE[2:]))
+
     @property
     def tex_name(self):
         """Name of this `Channel` in LaTeX printable format
@@ -304,7 +371,9 @@ class Channel(object):
         return str(self).replace("_", r"\_")
 
     @classmethod
-    def query(cls, name, descriptions=True, debug=False):
+    def query(cls, name, descriptions=True, debug=False, page_size=None,
+              fields=CHANNEL_FIELDS, session=None, timeout=None,
+              offline=False):
         """Query the LIGO Channel Information System for the `Channel`
         matching the given name
 
@@ -317,6 +386,19 @@ class Channel(object):
         debug : `bool`, optional
             print verbose HTTP connection status for debugging,
             default: `False`
+        page_size : `int`, optional
+            number of results to request per page, see `ChannelList.query`
+        fields : `list` of `str`, optional
+            names of JSON fields to request, see `ChannelList.query`
+        session : `~cis.connect.Session`, optional
+            open session to reuse for all HTTP requests,
+            default: a new session for each request
+        timeout : `float`, optional
+            seconds after which to abandon the query, see
+            `ChannelList.query`
+        offline : `bool`, optional
+            search the local catalog, rather than the CIS, see
+            `ChannelList.query`
 
         Returns
         -------
@@ -325,7 +407,9 @@ class Channel(object):
              its entry in the CIS
         """
         channellist = ChannelList.query(name, descriptions=descriptions,
-                                        debug=debug)
+                                        debug=debug, page_size=page_size,
+                                        fields=fields, session=session,
+                                        timeout=timeout, offline=offline)
         if len(channellist) == 0:
             raise ValueError("No channels found matching '%s'." % name)
         if len(channellist) > 1:
@@ -359,11 +443,51 @@ class Channel(object):
         return cls(name, sample_rate=sample_rate, unit=unit, dtype=dtype,
                    model=model, url=url, apiurl=apiurl, created=created)
 
-    def parse_name(self, name):
+    def to_json(self):
+        """Format this `Channel` as JSON data
+
+        This is the inverse of `Channel.from_json`.
+
+        Returns
+        -------
+        jdata : `dict`
+            dict of (key, value) pairs using the CIS REST field names
+        """
+        created = self._created
+        if isinstance(created, datetime.datetime):
+            created = created.isoformat()
+        return {
+            'name': self.name,
+            'datarate': self.sample_rate,
+            'units': self.unit,
+            'datatype': _dtype_enum(self.dtype),
+            'displayurl': self.url,
+            'url': self.apiurl,
+            'source': self.model,
+            'created': created,
+        }
+
+    def parse_name(self, name, parts=None):
         """Decompose a `Channel` name string into its components
+
+        Parameters
+        ----------
+        name : `str`
+            name to decompose
+        parts : `tuple`, optional
+            ``(ifo, system, subsystem, signal)`` components of ``name``
+            if already known, e.g. from :func:`cis.names.parse_names`
+
+        Returns
+        -------
+        ifo, system, subsystem, signal : `Description`
+            the name components, each of which is `None` if not present
         """
         if not name:
             return
+        if parts is None:
+            parts = split_name(name)
+        self._name_parts = parts
         # set up Description type cast
         from .description import Description
         def as_description(attr, value):
@@ -375,26 +499,12 @@ class Channel(object):
                 setattr(self, attr, self.descriptions[value])
             else:
                 setattr(self, attr, Description(value))
-        # parse ifo
-        if _re_ifo.match(name):
-            ifo, name = name.split(":", 1)
-            as_description('ifo', ifo)
-        else:
-            self._ifo = None
-        # parse systems
-        tags = _re_cchar.split(name, maxsplit=2)
-        as_description('system', tags[0])
-        if len(tags) > 1:
-            as_description('subsystem', tags[1])
-        else:
-            self._subsystem = None
-        if len(tags) > 2:
-            as_description('signal', tags[2])
-        else:
-            self._signal = None
+        for attr, value in zip(COMPONENTS, parts):
+            as_description(attr, value)
         return self.ifo, self.system, self.subsystem, self.signal
 
-    def get_descriptions(self, url=None, debug=False):
+    def get_descriptions(self, url=None, debug=False, session=None,
+                         timeout=None):
         """Download all the descriptions associated with this
         `Channel`.
 
@@ -406,6 +516,12 @@ class Channel(object):
         debug : `bool`, optional
             print verbose HTTP connection status for debugging,
             default: `False`
+        session : `~cis.connect.Session`, optional
+            open session to reuse for all HTTP requests,
+            default: a new session for each request
+        timeout : `float`, optional
+            seconds to wait on a stalled connection, default: the
+            ``timeout`` of the session
 
         Returns
         -------
@@ -418,17 +534,46 @@ class Channel(object):
         the string name attributes of the host `Channel` will be replaced
         with the corresponding `Description` if possible.
         """
-        from .description import Description
+        from urllib2 import HTTPError
         if url is None:
-            url = os.path.join(self.apiurl, 'descriptions')
+            url = self._descriptions_url()
         try:
-            response = connect.request(url, debug=debug)
-        except HTTPError:
+            response = connect.request(url, debug=debug, session=session,
+                                       timeout=timeout)
+        except HTTPError as e:
+            if e.code != 404:
+                raise
             raise ValueError("No descriptions found at URL '%s'" % url)
+        return self._read_descriptions(response)
+
+    def _descriptions_url(self):
+        return os.path.join(self.apiurl, 'descriptions')
+
+    def _read_descriptions(self, response, cache=None):
+        """Set the descriptions for this `Channel` from an HTTP response
+
+        If a ``cache`` `dict` is given, `Description` objects are reused
+        from it, by URL, and new ones are added to it.
+        """
+        import json
+        from .description import Description
         reply = json.loads(response.read())
+        timing.incr('descriptions.fetched', len(reply))
+        if cache is None:
+            descs = map(Description.from_json, reply)
+        else:
+            descs = []
+            for jdata in reply:
+                key = jdata.get('url') or jdata.get('name')
+                try:
+                    descs.append(cache[key])
+                except KeyError:
+                    cache[key] = Description.from_json(jdata)
+                    descs.append(cache[key])
+                else:
+                    timing.incr('descriptions.reused')
         self.descriptions = description.DescriptionDict(
-                                (d.name, d) for d in
-                                 map(Description.from_json, reply))
+                                (d.name, d) for d in descs)
         for attr in ['ifo', 'system', 'subsystem', 'signal']:
             if attr in self.descriptions:
                 setattr(self, attr, self.descriptions[attr])
@@ -518,8 +663,126 @@ class ChannelList(list):
 
         return self.__class__(c)
 
+    def unique(self, key='name'):
+        """Return a copy of this list without duplicate channels
+
+        Parameters
+        ----------
+        key : `str`, `tuple` of `str`, `callable`, optional
+            attribute(s) of each `Channel` that identify it, or a
+            function returning the identity of a `Channel`,
+            default: ``'name'``, use ``('name', 'cisid')`` to keep
+            distinct channels with the same name
+
+        Returns
+        -------
+        new : `ChannelList`
+            a new list with the first occurrence of each channel,
+            in order
+        """
+        return self.__class__(_unique(self, _key_function(key)))
+
+    def union(self, other, key='name'):
+        """Return the channels in either this list or another
+
+        Parameters
+        ----------
+        other : iterable of `Channel`
+            the other channels
+        key : `str`, `tuple` of `str`, `callable`, optional
+            identity of each `Channel`, see `ChannelList.unique`
+
+        Returns
+        -------
+        new : `ChannelList`
+            a new list with each channel once, in order of first
+            appearance in this list, then in ``other``
+        """
+        from itertools import chain
+        return self.__class__(_unique(chain(self, other),
+                                      _key_function(key)))
+
+    def intersection(self, other, key='name'):
+        """Return the channels in both this list and another
+
+        Parameters
+        ----------
+        other : iterable of `Channel`
+            the other channels
+        key : `str`, `tuple` of `str`, `callable`, optional
+            identity of each `Channel`, see `ChannelList.unique`
+
+        Returns
+        -------
+        new : `ChannelList`
+            a new list with each channel from this list that is also
+            in ``other`` once, in order
+        """
+        key = _key_function(key)
+        keep = set(map(key, other))
+        return self.__class__(c for c in _unique(self, key) if
+                              key(c) in keep)
+
+    def difference(self, other, key='name'):
+        """Return the channels in this list that are not in another
+
+        Parameters
+        ----------
+        other : iterable of `Channel`
+            the other channels
+        key : `str`, `tuple` of `str`, `callable`, optional
+            identity of each `Channel`, see `ChannelList.unique`
+
+        Returns
+        -------
+        new : `ChannelList`
+            a new list with each channel from this list that is not
+            in ``other`` once, in order
+
+        Examples
+        --------
+        To find which channels have been added since an earlier query:
+
+        >>> new = ChannelList.query('L1:PSL').difference(old)
+        """
+        key = _key_function(key)
+        drop = set(map(key, other))
+        return self.__class__(c for c in _unique(self, key) if
+                              key(c) not in drop)
+
+    def diff(self, other, fields=None):
+        """Compare this list of channels with a later snapshot
+
+        Parameters
+        ----------
+        other : iterable of `Channel`
+            the later channels
+        fields : `list` of `str`, optional
+            `Channel` attributes to compare, default:
+            `cis.diff.DIFF_FIELDS`
+
+        Returns
+        -------
+        diff : `~cis.diff.ChannelDiff`
+            the channels added, removed, and changed in ``other``
+
+        Examples
+        --------
+        >>> today = ChannelList.query('L1:PSL')
+        >>> print(yesterday.diff(today))
+
+        See Also
+        --------
+        cis.diff.diff_channels
+            for details of how channels are compared
+        """
+        from .diff import diff_channels
+        return diff_channels(self, other, fields=fields)
+
     @classmethod
-    def query(cls, name, descriptions=True, debug=False):
+    def query(cls, name, descriptions=True, debug=False, page_size=None,
+              fields=CHANNEL_FIELDS, session=None, timeout=None,
+              partial=False, offline=False):
         """Query the LIGO Channel Information System a `ChannelList`
         of entries matching the given name regular expression.
 
@@ -533,37 +796,621 @@ class ChannelList(list):
         debug : `bool`, optional
             print verbose HTTP connection status for debugging,
             default: `False`
+        page_size : `int`, optional
+            number of results to request per page, default: chosen
+            from the expected size of the result, see `auto_page_size`
+        fields : `list` of `str`, optional
+            names of JSON fields to request from the server,
+            default: `CHANNEL_FIELDS`, give `None` to receive all fields
+        session : `~cis.connect.Session`, optional
+            open session to reuse for all HTTP requests,
+            default: a new session for each request
+        timeout : `float`, optional
+            seconds after which to abandon the query, including all page
+            and description requests, default: no limit
+        partial : `bool`, optional
+            if the ``timeout`` expires, return the channels received so
+            far, rather than raising a `QueryTimeout`, default: `False`
+        offline : `bool`, optional
+            search the local, memory-mapped, catalog rather than the
+            CIS, see :mod:`cis.catalog`; no network access is made, so
+            no descriptions are downloaded, default: `False`
 
         Returns
         -------
         `ChannelList`
+
+        Raises
+        ------
+        ValueError
+            if no channel matches ``name``, or a channel has no
+            descriptions
+        urllib2.HTTPError
+            for any other HTTP error status, e.g. if the server is
+            overloaded
+        QueryTimeout
+            if the ``timeout`` expires before the query is complete, and
+            ``partial=False``, the channels received so far are stored
+            as the ``partial`` attribute of the exception
         """
+        if offline:
+            from .catalog import get_catalog
+            return cls(get_catalog().query(name))
         out = cls()
-        url = '%s/?q=%s' % (CHANNEL_API_URL, re.sub('[\*\s]', r'%20', name))
-        more = True
-        while more:
-            try:
-                response = connect.request(url, debug=debug)
-            except HTTPError:
-                raise ValueError("Channel named '%s' not found in Channel "
-                                 "Information System. Please double check "
-                                 "the name and try again." % name)
-            reply = json.loads(response.read())
-            if 'results' in reply:
-                for jdata in reply[u'results']:
-                    c = Channel.from_json(jdata)
-                    if descriptions:
-                        c.get_descriptions(debug=debug)
-                        c.parse_name(c.name)
-                    out.append(c)
-            more = 'next' in reply and reply['next'] is not None
-            if more:
-                url = reply['next']
-            else:
-                break
+        try:
+            for channel in cls.iterquery(name, descriptions=descriptions,
+                                         debug=debug, page_size=page_size,
+                                         fields=fields, session=session,
+                                         timeout=timeout):
+                out.append(channel)
+        except QueryTimeout as e:
+            out.sort(key=lambda c: c.name)
+            if not partial:
+                e.partial = out
+                raise
         out.sort(key=lambda c: c.name)
         return out
 
+    @staticmethod
+    def iterquery(name, descriptions=True, debug=False, page_size=None,
+                  fields=CHANNEL_FIELDS, session=None, timeout=None,
+                  offline=False):
+        """Iterate over the channels in the CIS matching the given name
+        regular expression.
+
+        Each page of results is decoded incrementally as it is
+        downloaded, with every `Channel` yielded as soon as its record
+        has been received, so memory use is bounded by a single record
+        rather than by the size of the page. If ``descriptions=True``,
+        the descriptions for each channel are requested asynchronously
+        through the session transport as soon as the channel is
+        received.
+
+        Parameters
+        ----------
+        name : `str`
+            name of channel, or part of it.
+        descriptions : `bool`
+            download all descriptions from CIS along with each Channel,
+            default: `True`
+        debug : `bool`, optional
+            print verbose HTTP connection status for debugging,
+            default: `False`
+        page_size : `int`, optional
+            number of results to request per page, default: chosen
+            from the expected size of the result, see `auto_page_size`
+        fields : `list` of `str`, optional
+            names of JSON fields to request from the server,
+            default: `CHANNEL_FIELDS`, give `None` to receive all fields
+        session : `~cis.connect.Session`, optional
+            open session to reuse for all HTTP requests,
+            default: a new session for each request
+        timeout : `float`, optional
+            seconds after which to abandon the query, default: no limit;
+            the time spent by the caller between channels counts towards
+            the timeout
+        offline : `bool`, optional
+            search the local catalog, rather than the CIS, see
+            `ChannelList.query`
+
+        Returns
+        -------
+        channels : `generator`
+            iterator of `Channel` objects, in the order returned by the
+            server
+
+        Raises
+        ------
+        ValueError
+            if no channel matches ``name``, or a channel has no
+            descriptions
+        urllib2.HTTPError
+            for any other HTTP error status, e.g. if the server is
+            overloaded
+        QueryTimeout
+            if the ``timeout`` expires, requests that have not yet
+            started are cancelled first
+        """
+        if offline:
+            from .catalog import get_catalog
+            for channel in get_catalog().query(name):
+                yield channel
+            return
+        import time
+        import threading
+        from urllib2 import HTTPError
+        from collections import deque
+        from multiprocessing import TimeoutError
+        from .transport import _is_timeout
+        own_session = session is None
+        if own_session:
+            session = connect.Session(debug=debug)
+
+        # the deadline is enforced by limiting the socket timeout of each
+        # request to the time left, and by checking the clock between
+        # channels
+        deadline = timeout is not None and time.time() + timeout or None
+        cancel = threading.Event()
+
+        def _expired():
+            cancel.set()
+            return QueryTimeout("Query for '%s' did not complete within "
+                                "%s seconds" % (name, timeout))
+
+        def _request_timeout():
+            # socket timeout for the next request, or `None` to use the
+            # timeout of the session
+            if deadline is None:
+                return None
+            left = deadline - time.time()
+            if left <= 0:
+                raise _expired()
+            if session.timeout is None or left < session.timeout:
+                return left
+            return None
+
+        # descriptions are requested asynchronously as each channel is
+        # received, with up to `_maxpending()` requests in flight
+        pending = deque()
+
+        def _maxpending():
+            # keep twice as many requests queued as can run at once, which
+            # for a `LimitedTransport` is its current (adaptive) limit
+            limiter = getattr(session.transport, 'limiter', None)
+            if limiter is not None:
+                return 2 * max(int(limiter.limit), 1)
+            return 2 * getattr(session.transport, 'workers', 1)
+
+        # descriptions shared by many channels are only built once
+        dcache = {}
+
+        # timing record for this query, see `cis.timing`
+        record = timing.enabled() and timing.Timing('query', name) or None
+
+        def _finish(channel, result, reqtimeout):
+            try:
+                with timing.phase('wait', record):
+                    response = result.get(
+                        deadline and max(deadline - time.time(), 0))
+            except HTTPError as e:
+                if e.code != 404:
+                    raise
+                raise ValueError("No descriptions found at URL '%s'"
+                                 % channel._descriptions_url())
+            except TimeoutError:
+                raise _expired()
+            except Exception as e:
+                if reqtimeout is not None and _is_timeout(e):
+                    raise _expired()
+                raise
+            with timing.phase('parse', record):
+                channel._read_descriptions(response, cache=dcache)
+            with timing.phase('parse_name', record):
+                channel.parse_name(channel.name, parts=channel._name_parts)
+            return channel
+
+        def _next(records, reqtimeout):
+            try:
+                with timing.phase('parse', record):
+                    return next(records, None)
+            except Exception as e:
+                if reqtimeout is not None and _is_timeout(e):
+                    raise _expired()
+                raise
+
+        response = None
+        try:
+            url = query_url(name, page_size=page_size, fields=fields)
+            while url:
+                reqtimeout = _request_timeout()
+                try:
+                    with timing.activate(record):
+                        response = session.request(url, timeout=reqtimeout)
+                except HTTPError as e:
+                    if e.code != 404:
+                        raise
+                    raise ValueError("Channel named '%s' not found in "
+                                     "Channel Information System. Please "
+                                     "double check the name and try "
+                                     "again." % name)
+                except Exception as e:
+                    if reqtimeout is not None and _is_timeout(e):
+                        raise _expired()
+                    raise
+                reply = PageReader(response)
+                records = iter(reply)
+                jdata = _next(records, reqtimeout)
+                while jdata is not None:
+                    with timing.phase('construct', record):
+                        c = Channel.from_json(jdata)
+                    if not descriptions:
+                        yield c
+                    else:
+                        desctimeout = _request_timeout()
+                        with timing.activate(record):
+                            result = session.request_async(
+                                c._descriptions_url(), timeout=desctimeout,
+                                cancel=cancel)
+                        pending.append((c, result, desctimeout))
+                    while len(pending) > _maxpending():
+                        yield _finish(*pending.popleft())
+                    if deadline is not None and time.time() > deadline:
+                        raise _expired()
+                    jdata = _next(records, reqtimeout)
+                response.close()
+                url = reply.meta.get('next', None)
+            while pending:
+                yield _finish(*pending.popleft())
+        finally:
+            # if the caller stopped early, cancel any description
+            # requests that have not started, and release the page
+            cancel.set()
+            if response is not None:
+                response.close()
+            if own_session:
+                session.close()
+            if record is not None:
+                record.finish()
+
+    @classmethod
+    def from_json_records(cls, records):
+        """Build a new `ChannelList` from a list of JSON records
+
+        This is a fast alternative to calling `Channel.from_json` for
+        each record: URLs are validated for the whole list at once,
+        `numpy.dtype` objects are shared between channels, and the
+        ``created`` date and the name components are only parsed when
+        first accessed.
+
+        Parameters
+        ----------
+        records : `list` of `dict`
+            list of (key, value) `dict` recovered from CIS REST requests
+
+        Returns
+        -------
+        channels : `ChannelList`
+            a new list with one `Channel` per record, in the input order
+
+        Raises
+        ------
+        ValueError
+            if any of the records contains an invalid URL
+        """
+        records = list(records)
+        # validate all URLs in one pass over the unique values
+        urls = set(r.get(key, None) for r in records
+                   for key in ('displayurl', 'url'))
+        urls.discard(None)
+        for u in urls:
+            if not _re_url.match(u):
+                raise ValueError("Description url '%s' invalid" % u)
+        # split all names in one pass
+        names = parse_names(r.get('name', None) for r in records)
+        # build all channels without going through the property setters
+        new = Channel.__new__
+        out = cls()
+        append = out.append
+        for jdata, parts in zip(records, names):
+            get = jdata.get
+            unit = get('units', None)
+            model = get('source', None)
+            c = new(Channel)
+            c.__dict__.update({
+                '_name': get('name', None),
+                '_name_parts': parts,
+                'descriptions': None,
+                '_description': None,
+                '_sample_rate': _float(get('datarate', None)),
+                '_unit': unit if unit is None else str(unit),
+                'frametype': None,
+                '_dtype': _as_dtype(get('datatype', None)),
+                '_model': model and model.lower() or model,
+                '_url': get('displayurl', None),
+                '_apiurl': get('url', None),
+                'cisid': None,
+                '_created': get('created', None),
+            })
+            append(c)
+        timing.incr('objects.Channel', len(out))
+        return out
+
     @property
     def ifos(self):
         return set([c.ifo for c in self])
+
+    def groupby(self, component):
+        """Group the channels in this list by one of their name components
+
+        Parameters
+        ----------
+        component : `str`
+            name of the component, one of ``'ifo'``, ``'system'``,
+            ``'subsystem'``, or ``'signal'``
+
+        Returns
+        -------
+        groups : `OrderedDict`
+            (`str`, `ChannelList`) pairs, in order of first appearance,
+            with `None` as the key for channels without that component
+
+        Examples
+        --------
+        >>> for system, channels in mylist.groupby('system').iteritems():
+        ...     print(system, len(channels))
+        """
+        table = parse_names(c.name for c in self)
+        groups = table.groupby(component)
+        for key, idx in groups.iteritems():
+            groups[key] = self.__class__(self[i] for i in idx)
+        return groups
+
+    @property
+    def created(self):
+        """Creation times of all channels in this `ChannelList`.
+
+        Dates are converted from their stored form in a single pass,
+        without parsing the `Channel.created` attribute of each member.
+
+        :type: `numpy.ndarray` of `numpy.datetime64`
+        """
+        return to_datetime64([c._created for c in self])
+
+    def write(self, filename, compress=False):
+        """Write this `ChannelList` to a binary file
+
+        The list is stored column-by-column in a `numpy` ``.npz``
+        archive, with each distinct string and `Description` stored
+        only once, see `cis.columnar` for details.
+
+        Parameters
+        ----------
+        filename : `str`, `file`
+            path of output file, or an open file object
+        compress : `bool`, optional
+            compress the archive, default: `False`
+
+        See Also
+        --------
+        ChannelList.read
+            to read the list back
+        """
+        from .columnar import write_channels
+        return write_channels(self, filename, compress=compress)
+
+    @classmethod
+    def read(cls, filename):
+        """Read a `ChannelList` from a file written by `ChannelList.write`
+
+        Parameters
+        ----------
+        filename : `str`, `file`
+            path of input file, or an open file object
+
+        Returns
+        -------
+        channels : `ChannelList`
+            a new list of channels, in the order written
+
+        Raises
+        ------
+        ValueError
+            if the file was not written by `ChannelList.write`
+        """
+        from .columnar import read_channels
+        return read_channels(filename, cls=cls)
+
+    def share(self, directory=None):
+        """Copy this `ChannelList` into shared memory for other processes
+
+        Parameters
+        ----------
+        directory : `str`, optional
+            directory in which to write the shared file, default:
+            ``/dev/shm`` if writable, otherwise the system temporary
+            directory
+
+        Returns
+        -------
+        shared : `~cis.shared.SharedChannelList`
+            a read-only view of the channels, in name order, that can
+            be passed cheaply to `multiprocessing` workers; the shared
+            file is removed when the view is closed
+
+        See Also
+        --------
+        cis.shared
+            for details of how the channels are shared
+        """
+        from .shared import SharedChannelList
+        return SharedChannelList.create(self, directory=directory)
+
+    def __reduce__(self):
+        # pickle members as tuples of attributes (see `Channel.__reduce__`),
+        # which share `Description` and `numpy.dtype` objects through the
+        # pickle memo, and have their names parsed in one pass on load
+        if all(type(c) is Channel for c in self):
+            return (_unpickle_channels,
+                    (self.__class__, [c._state() for c in self]),
+                    self.__dict__ or None)
+        return (self.__class__, (list(self),), self.__dict__ or None)
+
+
+class QueryTimeout(IOError):
+    """Error raised when a query does not complete within its timeout
+
+    Attributes
+    ----------
+    partial : `ChannelList`
+        the channels received before the timeout expired, as set by
+        `ChannelList.query`
+    """
+    def __init__(self, message, partial=None):
+        super(QueryTimeout, self).__init__(message)
+        self.partial = partial if partial is not None else ChannelList()
+
+
+def _key_function(key):
+    # key function for the set operations of `ChannelList`
+    if callable(key):
+        return key
+    if isinstance(key, basestring):
+        return operator.attrgetter(key)
+    return operator.attrgetter(*key)
+
+
+def _unique(channels, key):
+    # the first channel with each key, in order
+    seen = set()
+    add = seen.add
+    for channel in channels:
+        k = key(channel)
+        if k not in seen:
+            add(k)
+            yield channel
+
+
+def _unpickle_channel(cls, state):
+    return _from_states(cls, [state])[0]
+
+
+def _unpickle_channels(cls, states):
+    return cls(_from_states(Channel, states))
+
+
+def _from_states(cls, states):
+    """Build a list of channels from tuples of `_STATE` attributes
+    """
+    from .description import DescriptionDict
+    names = parse_names(state[0] for state in states)
+    new = cls.__new__
+    out = []
+    append = out.append
+    with _gc_paused():
+        for state, parts in zip(states, names):
+            c = new(cls)
+            attrs = c.__dict__ = dict(zip(_STATE, state))
+            attrs['_name_parts'] = parts
+            if state[1] is not None:
+                # filling an empty dict skips the generic (slow) update()
+                ddict = attrs['descriptions'] = DescriptionDict()
+                for key, value in state[1]:
+                    ddict[key] = value
+            append(c)
+    timing.incr('objects.Channel', len(out))
+    return out
+
+
+@contextmanager
+def _gc_paused():
+    """Pause cyclic garbage collection while building many objects
+
+    Each `DescriptionDict` is a cyclic linked list, so building many
+    of them otherwise triggers full collections over the growing heap.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _float(value):
+    return value if value is None else float(value)
+
+
+def _as_dtype(type_):
+    """Convert the given type into a (cached) `numpy.dtype`
+
+    Parameters
+    ----------
+    type_ : `int`, `type`, `str`, `numpy.dtype`
+        CIS data type enum, or anything accepted by `numpy.dtype`
+
+    Returns
+    -------
+    dtype : `numpy.dtype`
+        the matching data type
+    """
+    try:
+        dtype = _DTYPE_CACHE[type_]
+    except KeyError:
+        cache = True
+    except TypeError:  # unhashable input
+        cache = False
+    else:
+        timing.incr('cache.dtype.hit')
+        return dtype
+    timing.incr('cache.dtype.miss')
+    import numpy
+    if isinstance(type_, int):
+        dtype = numpy.dtype(DATA_TYPE_ENUM[type_])
+    else:
+        dtype = numpy.dtype(type_)
+    if cache:
+        _DTYPE_CACHE[type_] = dtype
+    return dtype
+
+
+def _dtype_enum(dtype):
+    """Find the CIS data type enum for the given `numpy.dtype`
+    """
+    for key in sorted(DATA_TYPE_ENUM, reverse=True):
+        if _as_dtype(key) == dtype:
+            return key
+    raise ValueError("No CIS data type matching %r" % dtype)
+
+
+def auto_page_size(name):
+    """Choose a page size for a channel query based on its expected size
+
+    A fully-qualified channel name (e.g. ``'L1:PSL-ISS_PDB_OUT_DQ'``) is
+    expected to match a handful of channels, so a small page keeps the
+    first reply light. A wildcard or partial name may match thousands,
+    so a large page minimises the number of round trips.
+
+    Parameters
+    ----------
+    name : `str`
+        name of channel, or part of it
+
+    Returns
+    -------
+    page_size : `int`
+        number of results to request per page
+    """
+    if re.search('[\*\s]', name) or not _re_ifo.match(name):
+        return MAX_PAGE_SIZE
+    if len(_re_cchar.split(name.split(':', 1)[1])) < 3:
+        return MAX_PAGE_SIZE
+    return MIN_PAGE_SIZE
+
+
+def query_url(name, page_size=None, fields=CHANNEL_FIELDS):
+    """Format the CIS API URL for a channel query
+
+    Parameters
+    ----------
+    name : `str`
+        name of channel, or part of it
+    page_size : `int`, optional
+        number of results per page, default: `auto_page_size`
+    fields : `list` of `str`, optional
+        names of JSON fields to request, default: `CHANNEL_FIELDS`,
+        give `None` to receive all fields
+
+    Returns
+    -------
+    url : `str`
+        full URL for the first page of the query
+    """
+    if page_size is None:
+        page_size = auto_page_size(name)
+    url = '%s/?q=%s&page_size=%d' % (CHANNEL_API_URL,
+                                     re.sub('[\*\s]', r'%20', name),
+                                     int(page_size))
+    if fields:
+        url += '&fields=%s' % ','.join(fields)
+    return url
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Columnar binary serialization of a `~cis.channel.ChannelList`
+
+A `~cis.channel.ChannelList` is written as a `numpy` ``.npz`` archive
+of one array per attribute, rather than one object per channel:
+
+- every string (names, units, URLs, dates, description text, ...) is
+  stored once, in a single table of interned strings, and each string
+  column is an ``int32`` array of indices into that table (``-1`` for
+  `None`)
+- every distinct `~cis.description.Description` is stored once, in a
+  table of descriptions shared by all channels, and each channel's
+  `~cis.description.DescriptionDict` is a run of (key, index) pairs in
+  flat arrays
+- numeric columns are stored as they are, with ``NaN`` or ``-1`` for
+  `None`
+
+This is used by `ChannelList.write <cis.channel.ChannelList.write>` and
+`ChannelList.read <cis.channel.ChannelList.read>`.
+"""
+
+from itertools import izip
+
+from . import (version, timing)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['write_channels', 'read_channels']
+
+FORMAT = 'cis-channellist-1'
+
+# (column name, attribute name) of string columns
+_CHANNEL_STRINGS = [('name', '_name'), ('unit', '_unit'),
+                    ('model', '_model'), ('frametype', 'frametype'),
+                    ('url', '_url'), ('apiurl', '_apiurl'),
+                    ('created', '_created')]
+# name components are stored so that names needn't be parsed on read
+_NAME_PARTS = [('ifo', None), ('system', None), ('subsystem', None),
+               ('signal', None)]
+_DESCRIPTION_STRINGS = [('name', '_name'), ('description', '_description'),
+                        ('text', '_text'), ('editor', '_editor'),
+                        ('apiurl', '_apiurl'), ('modified', '_modified'),
+                        ('created', '_created')]
+
+
+class _StringTable(object):
+    """Table of interned strings
+    """
+    def __init__(self):
+        self.strings = []
+        self._codes = {None: -1}
+
+    def code(self, value):
+        """Return the index of the given value in this table
+
+        Values are stored as `str`, with dates in ISO format, and
+        `None` is given index ``-1``.
+        """
+        try:
+            return self._codes[value]
+        except KeyError:
+            pass
+        if hasattr(value, 'isoformat'):  # unparsed dates are strings
+            string = value.isoformat()
+        elif isinstance(value, unicode):
+            string = value.encode('utf-8')
+        else:
+            string = str(value)
+        code = self._codes.get(string)
+        if code is None:
+            code = self._codes[string] = len(self.strings)
+            self.strings.append(string)
+        self._codes[value] = code
+        return code
+
+
+def write_channels(channels, filename, compress=False):
+    """Write a list of channels to a ``.npz`` file
+
+    Parameters
+    ----------
+    channels : `~cis.channel.ChannelList`
+        list of channels to write
+    filename : `str`, `file`
+        path of output file, or an open file object
+    compress : `bool`, optional
+        compress the archive, making the file smaller, but slower to
+        read, default: `False`
+    """
+    import numpy
+    table = _StringTable()
+    code = table.code
+    descriptions = []
+    dindex = {}
+
+    def dref(desc):
+        # index of a `Description` in the shared table
+        if desc is None:
+            return -1
+        try:
+            return dindex[id(desc)]
+        except KeyError:
+            dindex[id(desc)] = len(descriptions)
+            descriptions.append(desc)
+            return dindex[id(desc)]
+
+    columns = dict((key, []) for key, _ in _CHANNEL_STRINGS + _NAME_PARTS)
+    sample_rate, dtype, cisid, description = [], [], [], []
+    dcount, dkeys, dvalues = [], [], []
+    for channel in channels:
+        attrs = channel.__dict__
+        for key, attr in _CHANNEL_STRINGS:
+            columns[key].append(code(attrs.get(attr)))
+        parts = attrs.get('_name_parts') or (None,) * len(_NAME_PARTS)
+        for (key, _), part in zip(_NAME_PARTS, parts):
+            columns[key].append(code(part))
+        rate = attrs.get('_sample_rate')
+        sample_rate.append(rate is None and numpy.nan or rate)
+        type_ = attrs.get('_dtype')
+        dtype.append(code(type_ is not None and type_.str or None))
+        id_ = attrs.get('cisid')
+        cisid.append(id_ is None and -1 or id_)
+        description.append(dref(attrs.get('_description')))
+        ddict = attrs.get('descriptions')
+        if ddict is None:
+            dcount.append(-1)
+            continue
+        dcount.append(len(ddict))
+        for key, desc in ddict.iteritems():
+            dkeys.append(code(key))
+            dvalues.append(dref(desc))
+
+    arrays = dict(('channel_%s' % key, numpy.array(codes, dtype='int32'))
+                  for key, codes in columns.items())
+    arrays.update({
+        'channel_sample_rate': numpy.array(sample_rate, dtype='float64'),
+        'channel_dtype': numpy.array(dtype, dtype='int32'),
+        'channel_cisid': numpy.array(cisid, dtype='int64'),
+        'channel_description': numpy.array(description, dtype='int32'),
+        'descriptions_count': numpy.array(dcount, dtype='int32'),
+        'descriptions_key': numpy.array(dkeys, dtype='int32'),
+        'descriptions_value': numpy.array(dvalues, dtype='int32'),
+    })
+    for key, attr in _DESCRIPTION_STRINGS:
+        arrays['description_%s' % key] = numpy.array(
+            [code(d.__dict__.get(attr)) for d in descriptions],
+            dtype='int32')
+    arrays['description_cisid'] = numpy.array(
+        [d.cisid is None and -1 or d.cisid for d in descriptions],
+        dtype='int64')
+
+    # all strings are stored null-terminated in a single byte array,
+    # which can be split in one pass on read
+    data = ''.join('%s\0' % s for s in table.strings)
+    if data.count('\0') != len(table.strings):
+        raise ValueError("Cannot write strings containing null bytes")
+    arrays['strings'] = numpy.frombuffer(data or '\0', dtype='uint8')
+    arrays['strings_count'] = numpy.array(len(table.strings), dtype='int64')
+    arrays['format'] = numpy.array(FORMAT)
+
+    save = compress and numpy.savez_compressed or numpy.savez
+    if isinstance(filename, basestring):
+        with open(filename, 'wb') as fobj:
+            save(fobj, **arrays)
+    else:
+        save(filename, **arrays)
+
+
+def read_channels(filename, cls=None):
+    """Read a list of channels from a ``.npz`` file
+
+    Parameters
+    ----------
+    filename : `str`, `file`
+        path of file written by `write_channels`, or an open file object
+    cls : `type`, optional
+        type of list to return, default: `~cis.channel.ChannelList`
+
+    Returns
+    -------
+    channels : `~cis.channel.ChannelList`
+        the list of channels, in the order written
+
+    Raises
+    ------
+    ValueError
+        if the file was not written by `write_channels`
+    """
+    import numpy
+    from .channel import (ChannelList, _gc_paused)
+    if cls is None:
+        cls = ChannelList
+    with numpy.load(filename) as npz:
+        if 'format' not in npz.files or str(npz['format']) != FORMAT:
+            raise ValueError("%r is not a channel list file" % filename)
+        arrays = dict((key, npz[key]) for key in npz.files)
+
+    # nothing built here can be freed until it is returned, so there
+    # is no point in collecting garbage along the way
+    with _gc_paused():
+        return _rebuild(arrays, cls)
+
+
+def _rebuild(arrays, cls):
+    """Build a list of channels from the arrays in a ``.npz`` file
+    """
+    from .channel import (Channel, _as_dtype)
+    from .description import (Description, DescriptionDict)
+    # decode the strings, with `None` last so that code -1 maps to it
+    strings = arrays['strings'].tostring().split('\0')
+    strings[int(arrays['strings_count'])] = None
+
+    def column(key):
+        return map(strings.__getitem__, arrays[key].tolist())
+
+    # rebuild the shared descriptions
+    dcolumns = [(attr, column('description_%s' % key)) for
+                key, attr in _DESCRIPTION_STRINGS]
+    dcisid = [i if i >= 0 else None for i in
+              arrays['description_cisid'].tolist()]
+    new = Description.__new__
+    descriptions = []
+    for i, id_ in enumerate(dcisid):
+        desc = new(Description)
+        desc.__dict__.update((attr, values[i]) for attr, values in dcolumns)
+        desc._cisid = id_
+        descriptions.append(desc)
+    timing.incr('objects.Description', len(descriptions))
+    descriptions.append(None)
+
+    # rebuild the descriptions of each channel
+    dkeys = column('descriptions_key')
+    dvalues = map(descriptions.__getitem__,
+                  arrays['descriptions_value'].tolist())
+    ddicts = []
+    pos = 0
+    for n in arrays['descriptions_count'].tolist():
+        if n < 0:
+            ddicts.append(None)
+            continue
+        # filling an empty dict skips the generic (slow) update()
+        ddict = DescriptionDict()
+        for i in xrange(pos, pos + n):
+            ddict[dkeys[i]] = dvalues[i]
+        ddicts.append(ddict)
+        pos += n
+
+    # rebuild the channels, without going through the property setters
+    parts = [row[1] is not None and row or None for row in
+             zip(*[column('channel_%s' % key) for key, _ in _NAME_PARTS])]
+    dtypes = dict((code, _as_dtype(strings[code]) if code >= 0 else None)
+                  for code in set(arrays['channel_dtype'].tolist()))
+    keys = [attr for _, attr in _CHANNEL_STRINGS] + [
+        '_name_parts', '_sample_rate', '_dtype', 'cisid', '_description',
+        'descriptions']
+    columns = [column('channel_%s' % key) for key, _ in _CHANNEL_STRINGS] + [
+        parts,
+        [None if r != r else r for r in
+         arrays['channel_sample_rate'].tolist()],
+        map(dtypes.__getitem__, arrays['channel_dtype'].tolist()),
+        [i if i >= 0 else None for i in arrays['channel_cisid'].tolist()],
+        map(descriptions.__getitem__,
+            arrays['channel_description'].tolist()),
+        ddicts,
+    ]
+    new = Channel.__new__
+    out = cls()
+    append = out.append
+    for row in izip(*columns):
+        c = new(Channel)
+        c.__dict__ = dict(izip(keys, row))
+        append(c)
+    timing.incr('objects.Channel', len(out))
+    return out
@@ -17,17 +17,34 @@
 # along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
 
 """This module provides LIGO.ORG authenticated HTML queries
+
+Thread safety
+-------------
+The whole request path is safe to use from many threads at once,
+without external locking:
+
+- a `Session` may be shared between threads, and
+  `~cis.channel.ChannelList.query` may be called concurrently, with or
+  without a shared session;
+- `~cis.transport.UrllibTransport` builds a URL opener for each thread,
+  and the Kerberos negotiation state of
+  `~cis.saml.HTTPNegotiateAuthHandler` is kept per thread;
+- the cookie jar is shared, and the `COOKIE_JAR` file is locked (between
+  threads and processes) whenever it is read or written;
+- module-level caches (e.g. of `numpy.dtype` objects) and `cis.timing`
+  hooks and counters are safe to update concurrently.
+
+A `~cis.channel.Channel` may be read from many threads once it has been
+built, but, like any other Python object, should not be modified in one
+thread while being read in another.
 """
 
 import os
-import stat
-import urllib2
+import zlib
 import tempfile
-import cookielib
-
-from .saml import HTTPNegotiateAuthHandler
+from contextlib import contextmanager
 
-from . import version
+from . import (version, timing)
 
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 __credits__ = 'Scott Koranda <scott.koranda@ligo.org>'
@@ -38,8 +55,16 @@ TMPDIR = tempfile.gettempdir()
 COOKIE_JAR = os.path.join(TMPDIR, '%s_cookies' % os.getenv('USER'))
 LIGO_LOGIN_URL = 'login.ligo.org'
 
+# content-encodings accepted from the server, and the number of compressed
+# bytes read from the network for each decompression step
+ACCEPT_ENCODING = 'gzip, deflate'
+CHUNK_SIZE = 65536
 
-def request(url, debug=False):
+# seconds to wait on a stalled connection before giving up on a request
+TIMEOUT = 60
+
+
+def request(url, debug=False, session=None, timeout=None):
     """Request the given URL using LIGO.ORG SAML authentication.
 
     This requires an active Kerberos ticket for the user, to get one:
@@ -54,51 +79,409 @@ def request(url, debug=False):
         URL path for request
     debug : `bool`, optional
         Query in verbose debugging mode, default: `False`
+    session : `Session`, optional
+        open session to make the request with, default: a new
+        `Session` only used for this request
+    timeout : `float`, optional
+        seconds to wait on a stalled connection, default: the
+        ``timeout`` of the session
 
     Returns
     -------
-    response : `str`
-        output of HTTP request
+    response : `file`-like
+        output of HTTP request, transparently decompressed if the
+        server replied with a ``gzip`` or ``deflate`` content-encoding
+
+    Raises
+    ------
+    socket.timeout, urllib2.URLError
+        if the connection stalls for longer than the ``timeout``
+    """
+    if session is not None:
+        return session.request(url, timeout=timeout)
+    session = Session(debug=debug)
+    try:
+        return session.request(url, timeout=timeout)
+    finally:
+        session.close()
+
+
+class Session(object):
+    """Connection state shared between many requests
+
+    A `Session` sends all requests through a single
+    `~cis.transport.Transport`, so that authentication and connections
+    are reused between requests. The default
+    `~cis.transport.UrllibTransport` loads the `COOKIE_JAR` once, so that
+    a LIGO.ORG login is negotiated once for any number of requests,
+    rather than once per request. Requests may be made from multiple
+    threads; the default transport limits the number in flight to
+    match the capacity of the server, see
+    `~cis.transport.LimitedTransport`.
+
+    Parameters
+    ----------
+    debug : `bool`, optional
+        Query in verbose debugging mode, default: `False`
+    transport : `~cis.transport.Transport`, optional
+        transport to send requests through, default: the transport
+        set with `set_transport`, or a new
+        `~cis.transport.UrllibTransport`, see `get_transport`
+    timeout : `float`, optional
+        seconds to wait on a stalled connection for any request,
+        default: `TIMEOUT`, give `None` to wait forever
+
+    Examples
+    --------
+    >>> with Session() as session:
+    ...     for name in names:
+    ...         ChannelList.query(name, session=session)
     """
-    # set debug to 1 to see all HTTP(s) traffic
-    debug = int(debug)
+    def __init__(self, debug=False, transport=None, timeout=TIMEOUT):
+        self.debug = int(debug)
+        self.timeout = timeout
+        self._own_transport = transport is None and _TRANSPORT is None
+        if transport is None:
+            transport = get_transport(debug=debug)
+        self.transport = transport
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, url, timeout=None):
+        """Request the given URL in this session
 
-    # need an instance of HTTPS handler to do HTTPS
-    httpshandler = urllib2.HTTPSHandler(debuglevel=debug)
+        Parameters
+        ----------
+        url : `str`
+            URL path for request
+        timeout : `float`, optional
+            seconds to wait on a stalled connection, default: the
+            ``timeout`` of this session
 
-    # use a cookie jar to store session cookies
-    jar = cookielib.LWPCookieJar()
+        Returns
+        -------
+        response : `file`-like
+            output of HTTP request, see `request` for details
+        """
+        return self._request(url, timing.current(), timeout=timeout)
 
-    # if a cookier jar exists open it and read the cookies
-    # and make sure it has the right permissions
-    if os.path.exists(COOKIE_JAR):
-        os.chmod(COOKIE_JAR, stat.S_IRUSR | stat.S_IWUSR)
+    def _request(self, url, parent=None, timeout=None, cancel=None):
+        if cancel is not None and cancel.is_set():
+            return None
+        if timeout is None:
+            timeout = self.timeout
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if not timing.enabled():
+            return decode_response(self.transport.open(
+                url, headers=headers, timeout=timeout))
+        record = timing.Timing('request', url, parent=parent)
+        try:
+            with timing.activate(record), timing.phase('request'):
+                response = self.transport.open(url, headers=headers,
+                                               timeout=timeout)
+        except Exception as e:
+            record.status = getattr(e, 'code', None)
+            record.finish()
+            raise
+        record.status = getattr(response, 'code', None)
+        return decode_response(timing.TimedResponse(response, record))
 
-        # set ignore_discard so that session cookies are preserved
-        jar.load(COOKIE_JAR, ignore_discard=True)
+    def request_async(self, url, callback=None, timeout=None, cancel=None):
+        """Request the given URL in a background thread
 
-    # create a cookie handler from the cookier jar
-    cookiehandler = urllib2.HTTPCookieProcessor(jar)
-    # need a redirect handler to follow redirects
-    redirecthandler = urllib2.HTTPRedirectHandler()
+        Parameters
+        ----------
+        url : `str`
+            URL path for request
+        callback : `callable`, optional
+            function to call with the response when it is ready
+        timeout : `float`, optional
+            seconds to wait on a stalled connection, default: the
+            ``timeout`` of this session
+        cancel : :class:`threading.Event`, optional
+            event that cancels the request if set before the request
+            has started, in which case the response is `None`
 
-    # need an auth handler that can do negotiation.
-    # input parameter is the Kerberos service principal.
-    principal = 'HTTP@%s' % LIGO_LOGIN_URL
-    authhandler = HTTPNegotiateAuthHandler(service_principal=principal)
+        Returns
+        -------
+        result : :class:`multiprocessing.pool.AsyncResult`
+            handle on the response, call ``result.get()`` to wait for it
+        """
+        return self.transport.pool.apply_async(
+            self._request, (url, timing.current(), timeout, cancel),
+            callback=callback)
 
-    # create the opener.
-    opener = urllib2.build_opener(authhandler, cookiehandler, httpshandler,
-                                  redirecthandler)
+    def close(self):
+        """Close this session
 
-    # prepare the request object
-    req = urllib2.Request(url)
+        The transport is closed as well, unless it was given explicitly
+        or set with `set_transport`.
+        """
+        if self._own_transport:
+            self.transport.close()
 
-    # use the opener and the request object to make the request.
-    response = opener.open(req)
 
-    # save the session cookies to a file so that they can
-    # be used again without having to authenticate
-    jar.save(COOKIE_JAR, ignore_discard=True)
+# -----------------------------------------------------------------------------
+# default transport
+
+_TRANSPORT = None
+
+
+def set_transport(transport):
+    """Set the transport used for all new sessions
+
+    Parameters
+    ----------
+    transport : `~cis.transport.Transport`, `None`
+        the transport to use, or `None` to restore the default of a new
+        `~cis.transport.UrllibTransport` per session
+    """
+    global _TRANSPORT
+    _TRANSPORT = transport
+
+
+def get_transport(debug=False):
+    """Return the transport to use for a new session
+
+    Parameters
+    ----------
+    debug : `bool`, optional
+        Query in verbose debugging mode, default: `False`
+
+    Returns
+    -------
+    transport : `~cis.transport.Transport`
+        the transport set with `set_transport`, or otherwise a new
+        `~cis.transport.UrllibTransport`, wrapped in a
+        `~cis.transport.LimitedTransport` so that concurrent requests
+        adapt to the capacity of the server, and transient errors are
+        retried
+    """
+    if _TRANSPORT is not None:
+        return _TRANSPORT
+    from .transport import (UrllibTransport, LimitedTransport)
+    return LimitedTransport(UrllibTransport(debug=debug), debug=debug)
+
+
+# -----------------------------------------------------------------------------
+# metrics
+
+_METRICS = None
+
+
+def enable_metrics(registry=None):
+    """Start collecting metrics for all requests and queries
+
+    Parameters
+    ----------
+    registry : `~cis.metrics.MetricsRegistry`, optional
+        the registry to collect into, default: the registry already
+        enabled, or a new `~cis.metrics.MetricsRegistry`
+
+    Returns
+    -------
+    registry : `~cis.metrics.MetricsRegistry`
+        the enabled registry, which can be exported in the Prometheus
+        text format
+    """
+    global _METRICS
+    if registry is None and _METRICS is not None:
+        return _METRICS
+    from .metrics import MetricsRegistry
+    disable_metrics()
+    if registry is None:
+        registry = MetricsRegistry()
+    timing.add_hook(registry)
+    timing.add_counter(registry)
+    _METRICS = registry
+    return registry
+
 
+def disable_metrics():
+    """Stop collecting metrics, and any periodic export of them
+
+    Returns
+    -------
+    registry : `~cis.metrics.MetricsRegistry`
+        the registry that was enabled, or `None`
+    """
+    global _METRICS
+    registry, _METRICS = _METRICS, None
+    if registry is not None:
+        registry.stop_export()
+        timing.remove_counter(registry)
+        timing.remove_hook(registry)
+    return registry
+
+
+def get_metrics():
+    """Return the enabled `~cis.metrics.MetricsRegistry`, or `None`
+    """
+    return _METRICS
+
+
+# -----------------------------------------------------------------------------
+# record/replay
+
+@contextmanager
+def record(filename, transport=None, debug=False):
+    """Record all CIS requests made in this context to a cassette file
+
+    Within the context, every new `Session` uses a
+    `~cis.transport.RecordingTransport`, which makes each request
+    through the given ``transport`` and writes the response to
+    ``filename``. The cassette can be replayed with `replay`.
+
+    Parameters
+    ----------
+    filename : `str`
+        path of cassette file to write
+    transport : `~cis.transport.Transport`, optional
+        transport that makes the real requests, default: the transport
+        set by `set_transport`, or a new `~cis.transport.UrllibTransport`
+    debug : `bool`, optional
+        Query in verbose debugging mode, default: `False`
+    """
+    from .transport import RecordingTransport
+    previous = _TRANSPORT
+    recorder = RecordingTransport(
+        filename, transport=transport or get_transport(debug=debug),
+        debug=debug)
+    set_transport(recorder)
+    try:
+        yield recorder
+    finally:
+        set_transport(previous)
+        recorder.close()
+
+
+@contextmanager
+def replay(filename, latency=0, debug=False):
+    """Serve all CIS requests made in this context from a cassette file
+
+    Within the context, every new `Session` uses a
+    `~cis.transport.ReplayTransport`, so that no network access is
+    needed.
+
+    Parameters
+    ----------
+    filename : `str`
+        path of cassette file written by `record`
+    latency : `float`, `callable`, `str`, optional
+        seconds to wait before answering each request, a function
+        returning that number of seconds, or ``'recorded'`` to wait as
+        long as the original request took, default: ``0``
+    debug : `bool`, optional
+        Query in verbose debugging mode, default: `False`
+    """
+    from .transport import ReplayTransport
+    previous = _TRANSPORT
+    player = ReplayTransport(filename, latency=latency, debug=debug)
+    set_transport(player)
+    try:
+        yield player
+    finally:
+        set_transport(previous)
+        player.close()
+
+
+# -----------------------------------------------------------------------------
+# content decoding
+
+def decode_response(response):
+    """Wrap an HTTP response to decompress its content on-the-fly
+
+    Parameters
+    ----------
+    response : `file`-like
+        HTTP response, as returned from :meth:`urllib2.OpenerDirector.open`
+
+    Returns
+    -------
+    response : `file`-like
+        the input ``response`` if not compressed, otherwise a
+        `DecodedResponse` that decompresses as the body is read
+    """
+    encoding = response.info().get('Content-Encoding', '').strip().lower()
+    if encoding in ['gzip', 'x-gzip', 'deflate']:
+        return DecodedResponse(response, encoding)
     return response
+
+
+class DecodedResponse(object):
+    """`file`-like wrapper around a compressed HTTP response
+
+    The body is decompressed incrementally in blocks of `CHUNK_SIZE`
+    bytes as it is read, so the full compressed payload is never held
+    in memory. All other attributes are passed through to the original
+    response.
+
+    Parameters
+    ----------
+    response : `file`-like
+        HTTP response with a compressed body
+    encoding : `str`
+        value of the ``Content-Encoding`` header, one of ``'gzip'``,
+        ``'x-gzip'``, or ``'deflate'``
+    """
+    def __init__(self, response, encoding):
+        self.response = response
+        self.encoding = encoding
+        if encoding == 'deflate':
+            # RFC 2616 deflate is zlib-wrapped, but some servers send
+            # raw deflate streams, so this is decided on the first chunk
+            self._decoder = None
+        else:
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._buffer = ''
+        self._eof = False
+
+    def __getattr__(self, attr):
+        return getattr(self.response, attr)
+
+    def _decompress(self, data):
+        if self._decoder is None:
+            self._decoder = zlib.decompressobj(zlib.MAX_WBITS)
+            try:
+                return self._decoder.decompress(data)
+            except zlib.error:
+                self._decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decoder.decompress(data)
+
+    def _fill(self, size=None):
+        while not self._eof and (size is None or len(self._buffer) < size):
+            data = self.response.read(CHUNK_SIZE)
+            if data:
+                self._buffer += self._decompress(data)
+            else:
+                if self._decoder is not None:
+                    self._buffer += self._decoder.flush()
+                self._eof = True
+
+    def read(self, size=-1):
+        """Read and decompress up to ``size`` bytes from the response
+
+        Parameters
+        ----------
+        size : `int`, optional
+            number of decompressed bytes to return, default: all
+
+        Returns
+        -------
+        data : `str`
+            decompressed content
+        """
+        if size is None or size < 0:
+            self._fill()
+            data, self._buffer = self._buffer, ''
+        else:
+            self._fill(size)
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def close(self):
+        self.response.close()
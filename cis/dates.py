@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Parsing of the timestamps recorded by the CIS
+
+The CIS API reports ``created`` and ``modified`` dates as ISO-8601
+strings. These are stored unparsed by `Channel` and `Description`
+objects, and converted on first access by `parse_datetime`, which
+handles the ISO-8601 format directly and only falls back to
+:func:`dateutil.parser.parse` for anything else.
+"""
+
+import re
+import datetime
+
+from . import version
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['parse_datetime', 'to_datetime64']
+
+_re_iso8601 = re.compile(
+    r'\A(\d{4})-(\d\d)-(\d\d)'
+    r'(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:[.,](\d{1,6})\d*)?)?)?'
+    r'(Z|[+-]\d\d(?::?\d\d)?)?\Z')
+
+_ZERO = datetime.timedelta(0)
+
+
+class FixedOffset(datetime.tzinfo):
+    """Fixed offset in minutes east from UTC
+    """
+    def __init__(self, minutes):
+        self._offset = datetime.timedelta(minutes=minutes)
+        self._minutes = minutes
+
+    def utcoffset(self, dt):
+        return self._offset
+
+    def dst(self, dt):
+        return _ZERO
+
+    def tzname(self, dt):
+        if not self._minutes:
+            return 'UTC'
+        sign = self._minutes < 0 and '-' or '+'
+        return '%s%02d:%02d' % ((sign,) + divmod(abs(self._minutes), 60))
+
+    def __repr__(self):
+        return '<%s(%d)>' % (self.__class__.__name__, self._minutes)
+
+    def __reduce__(self):
+        return (self.__class__, (self._minutes,))
+
+UTC = FixedOffset(0)
+
+
+def _parse_offset(tz):
+    if tz == 'Z':
+        return UTC
+    sign = tz[0] == '-' and -1 or 1
+    tz = tz[1:].replace(':', '')
+    minutes = int(tz[:2]) * 60 + int(tz[2:] or 0)
+    return minutes and FixedOffset(sign * minutes) or UTC
+
+
+def parse_datetime(date):
+    """Parse a date string from the CIS into a `datetime.datetime`
+
+    Parameters
+    ----------
+    date : `str`, `datetime.datetime`, `None`
+        date to parse, either an ISO-8601 formatted `str`, or anything
+        else understood by :func:`dateutil.parser.parse`
+
+    Returns
+    -------
+    datetime : `datetime.datetime`
+        the parsed date, or the input if already a `datetime.datetime`
+        or `None`
+    """
+    if date is None or isinstance(date, datetime.datetime):
+        return date
+    match = _re_iso8601.match(date)
+    if match is None:
+        import dateutil.parser
+        return dateutil.parser.parse(date)
+    (year, month, day, hour, minute, second,
+     fraction, tz) = match.groups()
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+        int(second or 0), fraction and int(fraction.ljust(6, '0')) or 0,
+        tz and _parse_offset(tz) or None)
+
+
+def to_datetime64(dates):
+    """Convert a sequence of dates into a `numpy.datetime64` array
+
+    Timezone-aware dates are converted to UTC, naive dates are assumed
+    to already be in UTC.
+
+    Parameters
+    ----------
+    dates : `list`
+        sequence of `str`, `datetime.datetime`, or `None` (converted to
+        ``NaT``)
+
+    Returns
+    -------
+    array : `numpy.ndarray`
+        array of `numpy.datetime64` with microsecond precision
+    """
+    import numpy
+    values = []
+    append = values.append
+    for date in dates:
+        if date is None:
+            append('NaT')
+            continue
+        if not isinstance(date, datetime.datetime):
+            match = _re_iso8601.match(date)
+            # naive and UTC ISO strings are passed straight to numpy
+            if (match is not None and match.group(8) in (None, 'Z') and
+                    ',' not in date):
+                append(date.rstrip('Z').replace(' ', 'T', 1))
+                continue
+            date = parse_datetime(date)
+        offset = date.utcoffset()
+        if offset is not None:
+            date = date.replace(tzinfo=None) - offset
+        append(date.isoformat())
+    return numpy.array(values, dtype='datetime64[us]')
@@ -30,17 +30,19 @@ from cis import version
 __author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
 __version__ = version.__version__
 
-import urllib2
 import urlparse
 import datetime
-import dateutil.parser
-import json
 import textwrap
 
-from . import connect
+from . import (connect, timing)
+from .dates import parse_datetime
 
 __all__ = ['Description', 'DescriptionDict']
 
+# attributes of a `Description` that are pickled, see `Description.__reduce__`
+_STATE = ('_name', '_description', '_text', '_editor', '_apiurl', '_cisid',
+          '_modified', '_created')
+
 try:
     from collections import OrderedDict
 except ImportError:
@@ -69,6 +71,7 @@ class Description(object):
         self.cisid = cisid
         self.modified = modified
         self.created = created
+        timing.incr('objects.Description')
 
     # ------------------------------------------------------------------------
     # -
@@ -156,16 +159,13 @@ class Description(object):
 
         :type: :class:`datetime.datetime`
         """
+        if isinstance(self._modified, basestring):
+            self._modified = parse_datetime(self._modified)
         return self._modified
 
     @modified.setter
     def modified(self, date):
-        if date is None:
-            self._modified = date
-        elif isinstance(date, datetime.datetime):
-            self._modified = date
-        else:
-            self._modified = dateutil.parser.parse(date)
+        self._modified = _check_date(date)
 
     @property
     def created(self):
@@ -173,22 +173,19 @@ class Description(object):
 
         :type: :class:`datetime.datetime`
         """
+        if isinstance(self._created, basestring):
+            self._created = parse_datetime(self._created)
         return self._created
 
     @created.setter
     def created(self, date):
-        if date is None:
-            self._created = date
-        elif isinstance(date, datetime.datetime):
-            self._created = date
-        else:
-            self._created = dateutil.parser.parse(date)
+        self._created = _check_date(date)
 
     # ------------------------------------------------------------------------
     # Description getters
 
     @classmethod
-    def request(cls, url, debug=False):
+    def request(cls, url, debug=False, session=None):
         """Request information about a `Description` from the CIS
 
         Parameters
@@ -198,15 +195,22 @@ class Description(object):
         debug : `bool`
             print HTTP information for debugging purposes,
             default: `False`
+        session : `~cis.connect.Session`, optional
+            open session to reuse for the HTTP request,
+            default: a new session
 
         Returns
         -------
         description : `Description`
             structured `Description` downloaded from CIS
         """
+        import json
+        import urllib2
         try:
-            response = connect.request(url, debug=debug)
-        except urllib2.HTTPError:
+            response = connect.request(url, debug=debug, session=session)
+        except urllib2.HTTPError as e:
+            if e.code != 404:
+                raise
             raise ValueError("No description found with URL '%s'" % url)
         reply = json.loads(response.read())
         return cls.from_json(reply)
@@ -245,6 +249,26 @@ class Description(object):
         else:
             return '<Description(None)>'
 
+    def __reduce__(self):
+        # pickle as a flat tuple of attributes, restored without going
+        # through the property setters
+        return (_unpickle, (self.__class__, tuple(map(self.__dict__.get,
+                                                         _STATE))))
+
+
+def _unpickle(cls, state):
+    new = cls.__new__(cls)
+    new.__dict__ = dict(zip(_STATE, state))
+    timing.incr('objects.Description')
+    return new
+
+
+def _check_date(date):
+    # dates are stored as given, and parsed when first accessed
+    if date is None or isinstance(date, (datetime.datetime, basestring)):
+        return date
+    raise TypeError("Cannot interpret %r as a date" % (date,))
+
 
 class DescriptionDict(OrderedDict):
     """Container for a set of (name, description) pairs describing
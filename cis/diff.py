@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Compare two snapshots of the Channel Information System
+
+Two `~cis.channel.ChannelList` objects, or two `~cis.catalog.Catalog`
+files, are aligned by channel name, in a single pass over each, to find
+the channels that were added, removed, or changed between them:
+
+>>> diff = yesterday.diff(today)
+>>> print(diff)
++ L1:PSL-ISS_NEW_DQ
+- L1:PSL-ISS_OLD_DQ
+~ L1:PSL-ISS_PD_DQ: sample_rate 2048.0 -> 16384.0
+
+Catalogs are compared column by column in the mapped files, so that
+`Channel` objects are only built for the rows that differ.
+"""
+
+import operator
+
+from . import version
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['ChannelDiff', 'ChannelChange', 'diff_channels', 'diff_catalogs']
+
+# `Channel` attributes compared by default
+DIFF_FIELDS = ('sample_rate', 'unit', 'dtype', 'model', 'descriptions')
+
+# catalog columns holding each `Channel` attribute
+_CATALOG_COLUMNS = {
+    'sample_rate': 'sample_rate',
+    'dtype': 'datatype',
+    'created': 'created',
+    'unit': 'units',
+    'model': 'source',
+    'url': 'displayurl',
+    'apiurl': 'url',
+}
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+
+class ChannelChange(object):
+    """A channel whose attributes differ between two snapshots
+
+    Attributes
+    ----------
+    old : `~cis.channel.Channel`
+        the channel in the earlier snapshot
+    new : `~cis.channel.Channel`
+        the channel in the later snapshot
+    fields : `OrderedDict`
+        ``(old, new)`` values of each attribute that differs, keyed by
+        attribute name
+    """
+    def __init__(self, old, new, fields):
+        self.old = old
+        self.new = new
+        self.fields = fields
+
+    @property
+    def name(self):
+        """Name of the changed channel
+
+        :type: `str`
+        """
+        return self.new.name
+
+    def __str__(self):
+        changes = []
+        for field, (old, new) in self.fields.iteritems():
+            if field == 'descriptions':
+                changes.append('descriptions [%s]'
+                               % ', '.join(_changed_keys(old, new)))
+            else:
+                changes.append('%s %r -> %r' % (field, old, new))
+        return '%s: %s' % (self.name, ', '.join(changes))
+
+    def __repr__(self):
+        return '<%s(%r, %s)>' % (self.__class__.__name__, self.name,
+                                 ', '.join(self.fields))
+
+
+class ChannelDiff(object):
+    """Differences between two snapshots of the CIS
+
+    A `ChannelDiff` is false if the snapshots are the same, and prints
+    as a report with one line per difference.
+
+    Attributes
+    ----------
+    added : `~cis.channel.ChannelList`
+        channels only in the later snapshot
+    removed : `~cis.channel.ChannelList`
+        channels only in the earlier snapshot
+    changed : `list` of `ChannelChange`
+        channels in both snapshots, with different attributes
+    """
+    def __init__(self, added, removed, changed):
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __str__(self):
+        lines = ['+ %s' % c.name for c in self.added]
+        lines.extend('- %s' % c.name for c in self.removed)
+        lines.extend('~ %s' % change for change in self.changed)
+        return '\n'.join(lines)
+
+    def __repr__(self):
+        return '<%s(added=%d, removed=%d, changed=%d)>' % (
+            self.__class__.__name__, len(self.added), len(self.removed),
+            len(self.changed))
+
+
+# -----------------------------------------------------------------------------
+# channel lists
+
+def diff_channels(old, new, fields=None):
+    """Compare two lists of channels
+
+    Channels are matched by name; if a name appears more than once in
+    a list, only its first channel is used.
+
+    Parameters
+    ----------
+    old : iterable of `~cis.channel.Channel`
+        the earlier channels
+    new : iterable of `~cis.channel.Channel`
+        the later channels
+    fields : `list` of `str`, optional
+        `Channel` attributes to compare, default: `DIFF_FIELDS`;
+        ``'descriptions'`` are only compared for channels with
+        descriptions in both lists
+
+    Returns
+    -------
+    diff : `ChannelDiff`
+        the channels added, removed, and changed in ``new``, each in
+        the order of its list
+    """
+    from .channel import (ChannelList, _unique)
+    if fields is None:
+        fields = DIFF_FIELDS
+    name = operator.attrgetter('name')
+    old = [(c.name, c) for c in _unique(old, name)]
+    new = [(c.name, c) for c in _unique(new, name)]
+    previous = dict(old)
+    current = dict(new)
+    values = [(field, _VALUES.get(field, operator.attrgetter(field)))
+              for field in fields]
+    changed = []
+    for key, channel in old:
+        later = current.get(key)
+        if later is None:
+            continue
+        delta = None
+        for field, value in values:
+            a = value(channel)
+            b = value(later)
+            if a != b and not (field == 'descriptions' and
+                               (a is None or b is None)):
+                if delta is None:
+                    delta = OrderedDict()
+                delta[field] = (getattr(channel, field),
+                                getattr(later, field))
+        if delta is not None:
+            changed.append(ChannelChange(channel, later, delta))
+    return ChannelDiff(
+        ChannelList(c for key, c in new if key not in previous),
+        ChannelList(c for key, c in old if key not in current),
+        changed)
+
+
+def _descriptions(channel):
+    # comparable value of the descriptions of a channel
+    descriptions = channel.descriptions
+    if descriptions is None:
+        return None
+    return dict((key, (d.description, d.text)) for
+                key, d in descriptions.iteritems())
+
+
+_VALUES = {'descriptions': _descriptions}
+
+
+def _changed_keys(old, new):
+    old = old or {}
+    new = new or {}
+    return sorted(key for key in set(old) | set(new) if
+                  key not in old or key not in new or
+                  (old[key].description, old[key].text) !=
+                  (new[key].description, new[key].text))
+
+
+# -----------------------------------------------------------------------------
+# catalogs
+
+def diff_catalogs(old, new, fields=None):
+    """Compare two catalog files
+
+    The names of each catalog are read in one pass, and matched by
+    hashing. The stored columns of all matched rows are then compared
+    as arrays, and `Channel` objects are only built for rows that were
+    added, removed, or changed.
+
+    Parameters
+    ----------
+    old : `~cis.catalog.Catalog`
+        the earlier catalog
+    new : `~cis.catalog.Catalog`
+        the later catalog
+    fields : `list` of `str`, optional
+        `Channel` attributes to compare, default: `DIFF_FIELDS`;
+        attributes not stored in a catalog (e.g. ``'descriptions'``)
+        are ignored
+
+    Returns
+    -------
+    diff : `ChannelDiff`
+        the channels added, removed, and changed in ``new``, each in
+        name order
+    """
+    import numpy
+    if fields is None:
+        fields = DIFF_FIELDS
+    fields = [f for f in fields if f in _CATALOG_COLUMNS]
+    current = dict((name, j) for j, name in enumerate(new.names()))
+    rows = [(i, current.get(name, -1)) for
+            i, name in enumerate(old.names())]
+    rows = numpy.array(rows, dtype=int).reshape((len(rows), 2))
+    removed = rows[rows[:, 1] < 0, 0]
+    rows = rows[rows[:, 1] >= 0]
+    added = numpy.ones(len(new), dtype=bool)
+    added[rows[:, 1]] = False
+
+    # compare each column for all matched rows at once
+    differs = OrderedDict()
+    for field in fields:
+        column = _CATALOG_COLUMNS[field]
+        a = _column(old, column, rows[:, 0])
+        b = _column(new, column, rows[:, 1])
+        if a.dtype.kind == 'f':
+            differs[field] = (a != b) & ~(numpy.isnan(a) & numpy.isnan(b))
+        else:
+            differs[field] = a != b
+    if differs:
+        keep = numpy.logical_or.reduce(differs.values())
+        rows = rows[keep]
+        for field in differs:
+            differs[field] = differs[field][keep]
+    else:
+        rows = rows[:0]
+
+    changed = []
+    for k, (a, b) in enumerate(zip(old.channels(rows[:, 0].tolist()),
+                                   new.channels(rows[:, 1].tolist()))):
+        delta = OrderedDict((field, (getattr(a, field), getattr(b, field)))
+                            for field, mask in differs.iteritems()
+                            if mask[k])
+        changed.append(ChannelChange(a, b, delta))
+    return ChannelDiff(new.channels(numpy.nonzero(added)[0].tolist()),
+                       old.channels(removed.tolist()),
+                       changed)
+
+
+def _column(catalog, column, rows):
+    # values of a catalog column for the given rows, as an array
+    import numpy
+    if column in catalog.tables:
+        table = numpy.array(catalog.tables[column], dtype=object)
+        return table[catalog.array(column)[rows]]
+    try:
+        return catalog.array(column)[rows]
+    except ValueError:  # variable-length string column
+        return numpy.array([catalog._string(column, i) for i in rows],
+                           dtype=object)
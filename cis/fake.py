@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""A stand-in for the CIS web API, serving recorded or synthetic JSON
+
+The `FakeCIS` answers the same URLs as the real API:
+
+- ``/api/channel/?q=<query>[&page=N][&page_size=N][&fields=a,b]``
+- ``/api/channel/<id>/``
+- ``/api/channel/<id>/descriptions``
+- ``/api/description/<id>/``
+
+from an in-memory catalog of channel and description records. Use it
+in-process through a `~cis.transport.FakeTransport`, or over a real
+socket on the local host with a `FakeCISServer`.
+"""
+
+import re
+import json
+import random
+import urllib
+import threading
+import urlparse
+
+from . import version
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['FakeCIS', 'FakeCISServer']
+
+CIS_HOST = 'https://cis.ligo.org'
+
+_re_channel = re.compile(r'\A/api/channel/?\Z')
+_re_channel_id = re.compile(r'\A/api/channel/(\d+)/?\Z')
+_re_descriptions = re.compile(r'\A/api/channel/(\d+)/descriptions/?\Z')
+_re_description_id = re.compile(r'\A/api/description/(\d+)/?\Z')
+_re_split = re.compile('[:_-]')
+
+# building blocks for synthetic catalogs
+_IFOS = ['H1', 'L1']
+_SYSTEMS = ['ASC', 'CAL', 'HPI', 'IMC', 'ISI', 'LSC', 'OMC', 'PEM', 'PSL',
+            'SUS', 'TCS']
+_SUBSYSTEMS = ['BS', 'ETMX', 'ETMY', 'HAM1', 'HAM2', 'ISS', 'ITMX', 'ITMY',
+               'MC1', 'PRM', 'SRM', 'FSS', 'DARM', 'MICH', 'PRCL', 'CS']
+_SIGNALS = ['ERR', 'CTRL', 'IN1', 'OUT', 'PDA', 'PDB', 'ODC_CHANNEL',
+            'MASTER', 'DAMP_P', 'DAMP_Y', 'ACC_X', 'ACC_Y', 'ACC_Z', 'MON']
+_SUFFIXES = ['DQ', 'OUT_DQ', 'IN1_DQ', 'OUT16', 'MON']
+_RATES = [16, 256, 512, 1024, 2048, 4096, 16384]
+
+
+class FakeCIS(object):
+    """In-memory emulation of the CIS web API
+
+    Parameters
+    ----------
+    channels : `list` of `dict`
+        channel records, as returned in the ``results`` of a query;
+        ``id``, ``url`` and ``displayurl`` are filled in if missing
+    descriptions : `list` of `dict`, optional
+        description records, as returned by ``/descriptions``;
+        ``id`` and ``url`` are filled in if missing
+    host : `str`, optional
+        scheme and host used when formatting URLs in replies
+    page_size : `int`, optional
+        default number of results per page
+    max_page_size : `int`, optional
+        largest ``page_size`` a client may request
+    latency : `float`, `callable`, optional
+        seconds to wait before answering each request, or a function
+        returning that number of seconds (e.g. to emulate a slow tail)
+    compress : `bool`, optional
+        compress replies with gzip if the client accepts it,
+        default: `False`
+    capacity : `int`, optional
+        largest number of requests handled at once, any more are
+        refused with ``503 SERVICE UNAVAILABLE`` (e.g. to emulate an
+        overloaded server), default: no limit
+    """
+    def __init__(self, channels, descriptions=(), host=CIS_HOST,
+                 page_size=100, max_page_size=1000, latency=0,
+                 compress=False, capacity=None):
+        self.host = host.rstrip('/')
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.latency = latency
+        self.compress = compress
+        self.capacity = capacity
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self.channels = []
+        self.descriptions = {}
+        self._channel_ids = {}
+        self._description_ids = {}
+        self._searches = {}
+        for i, record in enumerate(channels):
+            record = dict(record)
+            record.setdefault('id', i + 1)
+            record.setdefault('url', '%s/api/channel/%d/'
+                                     % (self.host, record['id']))
+            record.setdefault('displayurl', '%s/channel/%d'
+                                            % (self.host, record['id']))
+            self.channels.append(record)
+            self._channel_ids[record['id']] = record
+        for i, record in enumerate(descriptions):
+            record = dict(record)
+            record.setdefault('id', i + 1)
+            record.setdefault('url', '%s/api/description/%d/'
+                                     % (self.host, record['id']))
+            self.descriptions[record['name']] = record
+            self._description_ids[record['id']] = record
+
+    def set_host(self, host):
+        """Change the scheme and host used in the URLs of all records
+
+        Parameters
+        ----------
+        host : `str`
+            new scheme and host, e.g. ``'http://127.0.0.1:8000'``
+        """
+        old = self.host
+        self.host = host.rstrip('/')
+        for record in self.channels + self.descriptions.values():
+            for key in ['url', 'displayurl']:
+                if record.get(key, '').startswith(old):
+                    record[key] = self.host + record[key][len(old):]
+        self._searches = {}
+
+    # ------------------------------------------------------------------------
+    # catalog I/O
+
+    @classmethod
+    def generate(cls, size, seed=0, **kwargs):
+        """Generate a synthetic catalog of channels with descriptions
+
+        Parameters
+        ----------
+        size : `int`
+            number of channels to generate
+        seed : `int`, optional
+            seed for the random number generator, so that catalogs are
+            reproducible
+        **kwargs
+            other keyword arguments are passed to the `FakeCIS`
+            constructor
+
+        Returns
+        -------
+        cis : `FakeCIS`
+            a new fake CIS serving ``size`` unique channels
+        """
+        rng = random.Random(seed)
+        names = set()
+        channels = []
+        while len(channels) < size:
+            name = '%s:%s-%s_%s_%s' % (
+                rng.choice(_IFOS), rng.choice(_SYSTEMS),
+                rng.choice(_SUBSYSTEMS), rng.choice(_SIGNALS),
+                rng.choice(_SUFFIXES))
+            if name in names:
+                name = '%s_%d' % (name, len(channels))
+            names.add(name)
+            channels.append({
+                'name': name,
+                'datarate': rng.choice(_RATES),
+                'units': rng.choice(['counts', 'um', 'V', 'W']),
+                'datatype': rng.choice([2, 4, 4, 4, 5]),
+                'source': '%s%s' % (name[:2], name[3:6]),
+                'created': '2013-%02d-%02dT%02d:%02d:%02dZ' % (
+                    rng.randint(1, 12), rng.randint(1, 28),
+                    rng.randint(0, 23), rng.randint(0, 59),
+                    rng.randint(0, 59)),
+            })
+        components = set(_IFOS + _SYSTEMS + _SUBSYSTEMS + _SIGNALS)
+        for suffix in _SUFFIXES:
+            components.update(suffix.split('_'))
+        descriptions = [{
+            'name': name,
+            'desc': 'Description of %s' % name,
+            'text': None,
+            'editor': 'albert.einstein@LIGO.ORG',
+            'created': '2013-11-07T14:39:30Z',
+            'modified': '2013-11-07T14:39:30Z',
+        } for name in sorted(components)]
+        return cls(channels, descriptions, **kwargs)
+
+    @classmethod
+    def read(cls, filename, **kwargs):
+        """Read a catalog of recorded JSON records from a file
+
+        Parameters
+        ----------
+        filename : `str`
+            path of JSON file containing a ``channels`` list and
+            (optionally) a ``descriptions`` list of records
+        **kwargs
+            other keyword arguments are passed to the `FakeCIS`
+            constructor
+
+        Returns
+        -------
+        cis : `FakeCIS`
+            a new fake CIS serving the recorded catalog
+        """
+        with open(filename, 'r') as fobj:
+            data = json.load(fobj)
+        return cls(data['channels'], data.get('descriptions', []), **kwargs)
+
+    def write(self, filename):
+        """Write the catalog of this `FakeCIS` to a JSON file
+
+        Parameters
+        ----------
+        filename : `str`
+            path of output file
+        """
+        with open(filename, 'w') as fobj:
+            json.dump({'channels': self.channels,
+                       'descriptions': self.descriptions.values()}, fobj)
+
+    # ------------------------------------------------------------------------
+    # request handling
+
+    def handle(self, url, headers=None, timeout=None):
+        """Answer a request for the given URL
+
+        Parameters
+        ----------
+        url : `str`
+            full URL of the request, only the path and query are used
+        headers : `dict`, optional
+            HTTP headers of the request
+        timeout : `float`, optional
+            seconds the client will wait for a reply, if the `latency`
+            is longer than this, `socket.timeout` is raised once the
+            timeout has passed
+
+        Returns
+        -------
+        code : `int`
+            HTTP status code
+        msg : `str`
+            HTTP reason phrase
+        headers : `dict`
+            HTTP headers of the reply
+        body : `str`
+            content of the reply
+        """
+        from .transport import wait
+        with self._lock:
+            self.inflight += 1
+            overloaded = (self.capacity is not None and
+                          self.inflight > self.capacity)
+        try:
+            if overloaded:
+                return 503, 'SERVICE UNAVAILABLE', {
+                    'Content-Type': 'application/json'}, json.dumps(
+                        {'detail': 'Service unavailable'})
+            wait(self.latency, timeout)
+            return self._handle(url, headers)
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+    def _handle(self, url, headers):
+        pieces = urlparse.urlparse(url)
+        query = urlparse.parse_qs(pieces.query, keep_blank_values=True)
+        path = pieces.path
+        match = None
+        for regex, method in [(_re_channel, self._search),
+                              (_re_channel_id, self._channel),
+                              (_re_descriptions, self._channel_descriptions),
+                              (_re_description_id, self._description)]:
+            match = regex.match(path)
+            if match:
+                data = method(query, *match.groups())
+                break
+        else:
+            data = None
+        if data is None:
+            return 404, 'NOT FOUND', {'Content-Type': 'application/json'}, \
+                json.dumps({'detail': 'Not found'})
+        body = json.dumps(data)
+        hdrs = {'Content-Type': 'application/json'}
+        accept = (headers or {}).get('Accept-Encoding', '')
+        if self.compress and 'gzip' in accept:
+            body = _gzip(body)
+            hdrs['Content-Encoding'] = 'gzip'
+        hdrs['Content-Length'] = str(len(body))
+        return 200, 'OK', hdrs, body
+
+    def search(self, q):
+        """Find all channels matching a query string
+
+        As for the CIS, whitespace-separated words in the query must
+        all appear in a channel's name for it to match.
+
+        Parameters
+        ----------
+        q : `str`
+            query string
+
+        Returns
+        -------
+        records : `list` of `dict`
+            matching channel records, in catalog order
+        """
+        try:
+            return self._searches[q]
+        except KeyError:
+            words = q.split()
+            result = [r for r in self.channels if
+                      all(w in r['name'] for w in words)]
+            self._searches = {q: result}  # only cache the latest search
+            return result
+
+    def _search(self, query):
+        q = query.get('q', [''])[0]
+        page = int(query.get('page', [1])[0])
+        size = min(int(query.get('page_size', [self.page_size])[0]),
+                   self.max_page_size)
+        fields = query.get('fields', [None])[0]
+        fields = fields and fields.split(',') or None
+        result = self.search(q)
+        start = (page - 1) * size
+        if page < 1 or (start >= len(result) and page > 1):
+            return None
+        records = result[start:start + size]
+        if fields:
+            records = [dict((k, r[k]) for k in fields if k in r)
+                       for r in records]
+
+        def page_url(n):
+            params = dict((k, v[0]) for k, v in query.items())
+            params['page'] = n
+            return '%s/api/channel/?%s' % (self.host, urllib.urlencode(
+                sorted(params.items())))
+        return {
+            'count': len(result),
+            'next': start + size < len(result) and page_url(page + 1) or None,
+            'previous': page > 1 and page_url(page - 1) or None,
+            'results': records,
+        }
+
+    def _channel(self, query, id_):
+        return self._channel_ids.get(int(id_), None)
+
+    def _channel_descriptions(self, query, id_):
+        try:
+            name = self._channel_ids[int(id_)]['name']
+        except KeyError:
+            return None
+        out = []
+        for part in _re_split.split(name):
+            record = self.descriptions.get(part, None)
+            if record is not None and record not in out:
+                out.append(record)
+        return out
+
+    def _description(self, query, id_):
+        return self._description_ids.get(int(id_), None)
+
+
+class FakeCISServer(object):
+    """Serve a `FakeCIS` over HTTP on the local host
+
+    The server answers requests in a background thread (one thread per
+    connection), so that the client is exercised over a real socket,
+    including HTTP parsing and connection set-up, without any network
+    access or authentication.
+
+    Parameters
+    ----------
+    backend : `FakeCIS`
+        the fake CIS to serve, its `~FakeCIS.host` is reset to the URL
+        of this server
+    host : `str`, optional
+        interface on which to listen, default: ``'127.0.0.1'``
+    port : `int`, optional
+        port on which to listen, default: any free port
+
+    Examples
+    --------
+    To direct channel queries to the fake server, point
+    `cis.channel.CHANNEL_API_URL` at its `api_url`:
+
+    >>> from cis import (connect, channel)
+    >>> from cis.transport import UrllibTransport
+    >>> with FakeCISServer(FakeCIS.generate(10000)) as server:
+    ...     channel.CHANNEL_API_URL = server.api_url
+    ...     transport = UrllibTransport(auth=False, cookiejar=False)
+    ...     with connect.Session(transport=transport) as session:
+    ...         channels = channel.ChannelList.query('H1', session=session)
+    """
+    def __init__(self, backend, host='127.0.0.1', port=0):
+        import BaseHTTPServer
+        import SocketServer
+
+        class Server(SocketServer.ThreadingMixIn,
+                     BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+            request_queue_size = 128
+
+        self.backend = backend
+        self.server = Server((host, port), _handler(backend))
+        self.url = 'http://%s:%d' % self.server.server_address[:2]
+        self.backend.set_host(self.url)
+        self._thread = None
+
+    @property
+    def api_url(self):
+        """URL of the channel API endpoint of this server
+
+        :type: `str`
+        """
+        return '%s/api/channel' % self.url
+
+    def start(self):
+        """Start serving requests in a background thread
+        """
+        import threading
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.server.serve_forever)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests, and close the socket
+        """
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _handler(backend):
+    """Build a request handler class for the given `FakeCIS`
+    """
+    import BaseHTTPServer
+
+    class FakeCISRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            code, msg, hdrs, body = backend.handle(self.path,
+                                                   headers=self.headers)
+            self.send_response(code, msg)
+            for item in hdrs.items():
+                self.send_header(*item)
+            if 'Content-Length' not in hdrs:
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return FakeCISRequestHandler
+
+
+def _gzip(data):
+    import gzip
+    from StringIO import StringIO
+    buf = StringIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as fobj:
+        fobj.write(data)
+    return buf.getvalue()
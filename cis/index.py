@@ -0,0 +1,447 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Local index of channel names, for fast existence checks
+
+An `ExistenceIndex` is built from a sync of the full CIS catalog, and
+written to a single file that can be shipped to any number of nodes:
+
+>>> from cis.index import ExistenceIndex
+>>> ExistenceIndex.sync().write('cis-names.idx')
+
+On each node, `exists` and `exists_many` then answer without any
+network access:
+
+>>> import cis
+>>> cis.index.set_index('cis-names.idx')
+>>> cis.exists('L1:PSL-ISS_PDA_OUT_DQ')
+True
+
+The index holds a Bloom filter of all names, which answers 'no'
+exactly, and 'yes' with a small false-positive rate, and (optionally)
+the exact sorted list of names, which settles every 'yes'. An index
+written without the exact names is much smaller, in which case each
+positive answer from the Bloom filter is checked with the server.
+Names added to the CIS after the index was built are reported as
+missing until the index is rebuilt.
+
+The index to use by default is set with `set_index`, or is read from
+the file named by the ``CIS_INDEX`` environment variable.
+"""
+
+import os
+import math
+import bisect
+import struct
+import hashlib
+import threading
+
+from . import (version, timing)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['BloomFilter', 'ExistenceIndex', 'exists', 'exists_many',
+           'set_index', 'get_index']
+
+# default false-positive rate of the Bloom filter
+FP_RATE = 0.001
+
+# first line of every index file
+_MAGIC = 'CIS-INDEX 1\n'
+
+_INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+class BloomFilter(object):
+    """Compact probabilistic set of strings
+
+    Membership tests never give a false negative, and give a false
+    positive with a probability set by the number of bits and hashes
+    per key, see `BloomFilter.for_size`.
+
+    Parameters
+    ----------
+    nbits : `int`
+        number of bits in the filter
+    nhashes : `int`
+        number of bits set for each key
+    bits : `bytearray`, optional
+        existing contents of the filter, default: empty
+    """
+    def __init__(self, nbits, nhashes, bits=None):
+        self.nbits = int(nbits)
+        self.nhashes = int(nhashes)
+        if bits is None:
+            bits = bytearray((self.nbits + 7) // 8)
+        self.bits = bits
+
+    @classmethod
+    def for_size(cls, n, fp_rate=FP_RATE):
+        """Create an empty filter sized for ``n`` keys
+
+        Parameters
+        ----------
+        n : `int`
+            number of keys that will be added
+        fp_rate : `float`, optional
+            target false-positive rate once ``n`` keys have been added
+
+        Returns
+        -------
+        bloom : `BloomFilter`
+            a new, empty filter
+        """
+        n = max(n, 1)
+        nbits = int(math.ceil(-n * math.log(fp_rate) / math.log(2) ** 2))
+        nhashes = max(int(round(nbits / float(n) * math.log(2))), 1)
+        return cls(nbits, nhashes)
+
+    def _positions(self, key):
+        # double hashing, see Kirsch & Mitzenmacher (2006)
+        h1, h2 = struct.unpack('<QQ', hashlib.md5(_bytes(key)).digest())
+        nbits = self.nbits
+        return [(h1 + i * h2) % nbits for i in xrange(self.nhashes)]
+
+    def add(self, key):
+        """Add a key to this filter
+        """
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class ExistenceIndex(object):
+    """Index of channel names for offline existence checks
+
+    Parameters
+    ----------
+    bloom : `BloomFilter`
+        filter of all names
+    names : `list` of `str`, optional
+        exact sorted list of names, default: `None`, in which case
+        positive answers are uncertain
+    count : `int`, optional
+        number of names in the index
+    created : `float`, optional
+        UNIX time at which the catalog was synced
+
+    Notes
+    -----
+    An index is safe to query from many threads at once.
+    """
+    def __init__(self, bloom, names=None, count=None, created=None):
+        self.bloom = bloom
+        self.names = names
+        self.count = count if count is not None else len(names or ())
+        self.created = created
+
+    @classmethod
+    def build(cls, names, fp_rate=FP_RATE, exact=True, created=None):
+        """Build a new index from a list of names
+
+        Parameters
+        ----------
+        names : iterable of `str`
+            all channel names in the catalog
+        fp_rate : `float`, optional
+            false-positive rate of the Bloom filter
+        exact : `bool`, optional
+            keep the exact sorted list of names, default: `True`
+        created : `float`, optional
+            UNIX time at which the names were synced
+
+        Returns
+        -------
+        index : `ExistenceIndex`
+            a new index
+        """
+        names = sorted(set(map(_bytes, names)))
+        bloom = BloomFilter.for_size(len(names), fp_rate=fp_rate)
+        for name in names:
+            bloom.add(name)
+        return cls(bloom, names=names if exact else None, count=len(names),
+                   created=created)
+
+    @classmethod
+    def sync(cls, fp_rate=FP_RATE, exact=True, session=None, debug=False,
+             timeout=None):
+        """Build a new index from the full catalog in the CIS
+
+        Parameters
+        ----------
+        fp_rate : `float`, optional
+            false-positive rate of the Bloom filter
+        exact : `bool`, optional
+            keep the exact sorted list of names, default: `True`
+        session : `~cis.connect.Session`, optional
+            open session to reuse for all HTTP requests
+        debug : `bool`, optional
+            print verbose HTTP connection status for debugging
+        timeout : `float`, optional
+            seconds after which to abandon the sync, default: no limit
+
+        Returns
+        -------
+        index : `ExistenceIndex`
+            a new index of every channel in the CIS
+        """
+        import time
+        from .channel import (ChannelList, MAX_PAGE_SIZE)
+        created = time.time()
+        names = (c.name for c in ChannelList.iterquery(
+            '', descriptions=False, debug=debug, page_size=MAX_PAGE_SIZE,
+            fields=('name',), session=session, timeout=timeout))
+        return cls.build(names, fp_rate=fp_rate, exact=exact,
+                         created=created)
+
+    # ------------------------------------------------------------------------
+    # lookup
+
+    def lookup(self, name):
+        """Look up a name in this index
+
+        Parameters
+        ----------
+        name : `str`
+            full name of channel
+
+        Returns
+        -------
+        found : `bool`, `None`
+            `False` if the name is not in the index, `True` if it is,
+            or `None` if the index cannot tell (a positive answer from
+            the Bloom filter, with no exact names to settle it)
+        """
+        name = _bytes(name)
+        if name not in self.bloom:
+            return False
+        if self.names is None:
+            return None
+        i = bisect.bisect_left(self.names, name)
+        return i < len(self.names) and self.names[i] == name
+
+    # ------------------------------------------------------------------------
+    # I/O
+
+    def write(self, filename, exact=None):
+        """Write this index to a file
+
+        The file is replaced atomically, so that it can be updated
+        while in use.
+
+        Parameters
+        ----------
+        filename : `str`
+            path of output file
+        exact : `bool`, optional
+            write the exact list of names, default: `True` if this
+            index has them
+        """
+        if exact is None:
+            exact = self.names is not None
+        elif exact and self.names is None:
+            raise ValueError("This index does not hold the exact names")
+        header = {'nbits': self.bloom.nbits, 'nhashes': self.bloom.nhashes,
+                  'count': self.count, 'created': self.created,
+                  'exact': bool(exact)}
+        import json
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'wb') as fobj:
+            fobj.write(_MAGIC)
+            fobj.write(json.dumps(header, sort_keys=True) + '\n')
+            fobj.write(bytes(self.bloom.bits))
+            if exact:
+                fobj.write('\n'.join(self.names))
+        os.rename(tmp, filename)
+
+    @classmethod
+    def read(cls, filename, exact=True):
+        """Read an index from a file written by `ExistenceIndex.write`
+
+        Parameters
+        ----------
+        filename : `str`
+            path of index file
+        exact : `bool`, optional
+            load the exact list of names, if the file has them,
+            default: `True`; give `False` to save memory, at the cost
+            of checking positive answers with the server
+
+        Returns
+        -------
+        index : `ExistenceIndex`
+            the index read from the file
+        """
+        import json
+        with open(filename, 'rb') as fobj:
+            if fobj.readline() != _MAGIC:
+                raise ValueError("%r is not a CIS index file" % filename)
+            header = json.loads(fobj.readline())
+            bits = bytearray(fobj.read((header['nbits'] + 7) // 8))
+            names = None
+            if exact and header['exact']:
+                names = fobj.read().split('\n')
+                if names == ['']:
+                    names = []
+        return cls(BloomFilter(header['nbits'], header['nhashes'], bits),
+                   names=names, count=header['count'],
+                   created=header['created'])
+
+
+def _bytes(name):
+    if isinstance(name, unicode):
+        return name.encode('utf-8')
+    return name
+
+
+# -----------------------------------------------------------------------------
+# default index
+
+def set_index(index):
+    """Set the index used by `exists` and `exists_many`
+
+    Parameters
+    ----------
+    index : `ExistenceIndex`, `str`, `None`
+        the index, or the path of an index file, or `None` to always
+        query the server
+    """
+    global _INDEX
+    if isinstance(index, basestring):
+        index = ExistenceIndex.read(index)
+    with _INDEX_LOCK:
+        _INDEX = index
+
+
+def get_index():
+    """Return the index used by `exists` and `exists_many`
+
+    Returns
+    -------
+    index : `ExistenceIndex`, `None`
+        the index set with `set_index`, or read from the file named
+        by the ``CIS_INDEX`` environment variable, or `None`
+    """
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None and os.getenv('CIS_INDEX'):
+            _INDEX = ExistenceIndex.read(os.environ['CIS_INDEX'])
+        return _INDEX
+
+
+# -----------------------------------------------------------------------------
+# existence checks
+
+def exists(name, index=None, session=None, debug=False, timeout=None):
+    """Determine whether a channel exists in the CIS
+
+    The answer is taken from the ``index`` where possible, and the
+    server is only queried if the index cannot tell.
+
+    Parameters
+    ----------
+    name : `str`
+        full name of channel
+    index : `ExistenceIndex`, optional
+        index to look up, default: `get_index`
+    session : `~cis.connect.Session`, optional
+        open session to reuse for any HTTP requests
+    debug : `bool`, optional
+        print verbose HTTP connection status for debugging
+    timeout : `float`, optional
+        seconds after which to abandon a query of the server
+
+    Returns
+    -------
+    exists : `bool`
+        `True` if a channel with exactly this name exists
+    """
+    return exists_many([name], index=index, session=session, debug=debug,
+                       timeout=timeout)[0]
+
+
+def exists_many(names, index=None, session=None, debug=False, timeout=None):
+    """Determine whether each of many channels exists in the CIS
+
+    Parameters
+    ----------
+    names : iterable of `str`
+        full names of channels
+    index : `ExistenceIndex`, optional
+        index to look up, default: `get_index`
+    session : `~cis.connect.Session`, optional
+        open session to reuse for any HTTP requests, default: a single
+        new session for all requests
+    debug : `bool`, optional
+        print verbose HTTP connection status for debugging
+    timeout : `float`, optional
+        seconds after which to abandon each query of the server
+
+    Returns
+    -------
+    exists : `list` of `bool`
+        `True` for each name with a channel of exactly that name, in
+        the order given
+    """
+    from . import connect
+    if index is None:
+        index = get_index()
+    names = list(names)
+    out = [None] * len(names)
+    if index is not None:
+        for i, name in enumerate(names):
+            out[i] = index.lookup(name)
+        timing.incr('index.lookup', len(names))
+    uncertain = [i for i, found in enumerate(out) if found is None]
+    if not uncertain:
+        return out
+    timing.incr('index.fallback', len(uncertain))
+    own_session = session is None
+    if own_session:
+        session = connect.Session(debug=debug)
+    try:
+        for i in uncertain:
+            out[i] = _query_exists(names[i], session, timeout)
+    finally:
+        if own_session:
+            session.close()
+    return out
+
+
+def _query_exists(name, session, timeout):
+    """Query the server for a channel with exactly the given name
+    """
+    from .channel import ChannelList
+    try:
+        for channel in ChannelList.iterquery(
+                name, descriptions=False, fields=('name',),
+                session=session, timeout=timeout):
+            if channel.name == name:
+                return True
+    except ValueError:  # 404, no matches
+        pass
+    return False
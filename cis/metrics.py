@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Metrics of CIS client activity for long-running services
+
+A `MetricsRegistry` accumulates counters and latency histograms for
+all requests and queries for as long as it is enabled, and renders
+them in the `Prometheus <https://prometheus.io>`_ text exposition
+format. The registry for a process is managed by `cis.connect`:
+
+>>> from cis import connect
+>>> registry = connect.enable_metrics()
+>>> registry.start_export(60, filename='/var/lib/node_exporter/cis.prom')
+
+The following metrics are exported:
+
+=================================  ==========================================
+``cis_request_duration_seconds``   histogram of request latency, by endpoint
+``cis_requests_total``             requests, by endpoint and HTTP status
+``cis_request_errors_total``       failed requests, by endpoint and status
+``cis_auth_retries_total``         Kerberos negotiations (401 retries)
+``cis_redirects_total``            HTTP redirects followed
+``cis_received_bytes_total``       bytes received, before decompression
+``cis_sent_bytes_total``           bytes sent
+``cis_query_duration_seconds``     histogram of `ChannelList.query` latency
+``cis_cache_hits_total``           cache hits, by cache
+``cis_cache_misses_total``         cache misses, by cache
+``cis_events_total``               all other `cis.timing` counters, by name
+=================================  ==========================================
+"""
+
+import os
+import bisect
+import threading
+
+from . import (version, timing)
+from .profiling import endpoint
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['MetricsRegistry', 'Histogram']
+
+# default histogram buckets (seconds), spanning a fast local reply to a
+# stalled connection
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+
+
+class Histogram(object):
+    """Cumulative histogram of observations
+
+    Parameters
+    ----------
+    buckets : `tuple` of `float`
+        upper bounds of the buckets, in increasing order, an implicit
+        ``+Inf`` bucket is added
+
+    Attributes
+    ----------
+    counts : `list` of `int`
+        number of observations in each bucket (not cumulative), the
+        last being the ``+Inf`` bucket
+    sum : `float`
+        sum of all observations
+    count : `int`
+        number of observations
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        """Add an observation to this histogram
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile from this histogram
+
+        The result is the upper bound of the bucket containing the
+        quantile, so is an over-estimate by at most one bucket width.
+
+        Parameters
+        ----------
+        q : `float`
+            quantile to estimate, in the interval [0, 1]
+
+        Returns
+        -------
+        value : `float`
+            estimated quantile, `None` if no values have been observed
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        total = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            if total >= target:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry(object):
+    """Registry of metrics for CIS requests and queries
+
+    The registry is a hook for `cis.timing.add_hook`, and a counter
+    sink for `cis.timing.add_counter`; use
+    `cis.connect.enable_metrics` to register it.
+
+    Parameters
+    ----------
+    buckets : `tuple` of `float`, optional
+        upper bounds of histogram buckets (seconds)
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.request_latency = {}
+        self.query_latency = Histogram(buckets)
+        self.requests = {}
+        self.errors = {}
+        self.totals = dict.fromkeys(timing.COUNTERS, 0)
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._export = None
+
+    # hook for `cis.timing.add_hook`
+    def __call__(self, record):
+        with self._lock:
+            if record.kind == 'query':
+                self.query_latency.observe(record.elapsed)
+                return
+            key = endpoint(record.label)
+            try:
+                hist = self.request_latency[key]
+            except KeyError:
+                hist = self.request_latency[key] = Histogram(self.buckets)
+            hist.observe(record.elapsed)
+            status = (key, str(record.status))
+            self.requests[status] = self.requests.get(status, 0) + 1
+            if record.status is None or record.status >= 400:
+                self.errors[status] = self.errors.get(status, 0) + 1
+            for attr in timing.COUNTERS:
+                self.totals[attr] += getattr(record, attr)
+
+    # sink for `cis.timing.add_counter`
+    def incr(self, key, n=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    # ------------------------------------------------------------------------
+    # export
+
+    def render(self):
+        """Format all metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        text : `str`
+            the metrics, one sample per line
+        """
+        out = []
+        with self._lock:
+            _histogram(out, 'cis_request_duration_seconds',
+                       'Latency of CIS HTTP requests.',
+                       [({'endpoint': key}, hist) for key, hist in
+                        sorted(self.request_latency.items())])
+            _counter(out, 'cis_requests_total', 'CIS HTTP requests.',
+                     [({'endpoint': e, 'code': c}, n) for (e, c), n in
+                      sorted(self.requests.items())])
+            _counter(out, 'cis_request_errors_total',
+                     'Failed CIS HTTP requests.',
+                     [({'endpoint': e, 'code': c}, n) for (e, c), n in
+                      sorted(self.errors.items())])
+            for attr, name, help_ in [
+                    ('auth_retries', 'cis_auth_retries_total',
+                     'Kerberos negotiations in response to a 401.'),
+                    ('redirects', 'cis_redirects_total',
+                     'HTTP redirects followed.'),
+                    ('bytes', 'cis_received_bytes_total',
+                     'Bytes received, before decompression.'),
+                    ('bytes_sent', 'cis_sent_bytes_total', 'Bytes sent.')]:
+                _counter(out, name, help_, [({}, self.totals[attr])])
+            _histogram(out, 'cis_query_duration_seconds',
+                       'Latency of CIS channel queries.',
+                       [({}, self.query_latency)])
+            hits, misses, events = [], [], []
+            for key, n in sorted(self.counters.items()):
+                parts = key.split('.')
+                if parts[0] == 'cache' and parts[-1] == 'hit':
+                    hits.append(({'cache': '.'.join(parts[1:-1])}, n))
+                elif parts[0] == 'cache' and parts[-1] == 'miss':
+                    misses.append(({'cache': '.'.join(parts[1:-1])}, n))
+                else:
+                    events.append(({'name': key}, n))
+            _counter(out, 'cis_cache_hits_total', 'Cache hits.', hits)
+            _counter(out, 'cis_cache_misses_total', 'Cache misses.', misses)
+            _counter(out, 'cis_events_total', 'Other CIS client events.',
+                     events)
+        return '\n'.join(out) + '\n'
+
+    def write(self, filename):
+        """Write all metrics to a file in the Prometheus text format
+
+        The file is replaced atomically, as required by the textfile
+        collector of the Prometheus node exporter.
+
+        Parameters
+        ----------
+        filename : `str`
+            path of output file
+        """
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'w') as fobj:
+            fobj.write(self.render())
+        os.rename(tmp, filename)
+
+    def export(self, filename=None, callback=None):
+        """Export all metrics to a file and/or a callback
+
+        Parameters
+        ----------
+        filename : `str`, optional
+            path of file to write, see `write`
+        callback : `callable`, optional
+            function to call with the rendered text
+        """
+        if filename:
+            self.write(filename)
+        if callback is not None:
+            callback(self.render())
+
+    def start_export(self, interval, filename=None, callback=None):
+        """Export metrics periodically in a background thread
+
+        Parameters
+        ----------
+        interval : `float`
+            number of seconds between exports
+        filename : `str`, optional
+            path of file to write, see `write`
+        callback : `callable`, optional
+            function to call with the rendered text
+        """
+        self.stop_export()
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.export(filename=filename, callback=callback)
+        thread = threading.Thread(target=run, name='cis-metrics-export')
+        thread.daemon = True
+        thread.start()
+        self._export = (stop, thread)
+
+    def stop_export(self):
+        """Stop a periodic export started with `start_export`
+        """
+        if self._export is not None:
+            stop, thread = self._export
+            stop.set()
+            thread.join()
+            self._export = None
+
+
+# -----------------------------------------------------------------------------
+# text format
+
+def _labels(labels, extra=None):
+    items = sorted(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', r'\\').replace('"', r'\"')
+                     .replace('\n', r'\n')) for k, v in items)
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _counter(out, name, help_, samples):
+    out.append('# HELP %s %s' % (name, help_))
+    out.append('# TYPE %s counter' % name)
+    for labels, value in samples:
+        out.append('%s%s %s' % (name, _labels(labels), _number(value)))
+
+
+def _histogram(out, name, help_, samples):
+    out.append('# HELP %s %s' % (name, help_))
+    out.append('# TYPE %s histogram' % name)
+    for labels, hist in samples:
+        total = 0
+        for bound, n in zip(hist.buckets + (float('inf'),), hist.counts):
+            total += n
+            out.append('%s_bucket%s %d' % (
+                name, _labels(labels, ('le', _number(bound))), total))
+        out.append('%s_sum%s %s' % (name, _labels(labels),
+                                    _number(hist.sum)))
+        out.append('%s_count%s %d' % (name, _labels(labels), hist.count))
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Decomposition of channel names into their components
+
+Each channel name follows the convention
+
+.. code::
+
+    {IFO}:{SYSTEM}-{SUBSYSTEM}_{SIGNAL}
+
+where the interferometer prefix is optional, and the system,
+sub-system and signal are separated by either of ``-`` or ``_``.
+`split_name` decomposes a single name, while `parse_names` decomposes
+any number of names in a single pass of the same compiled pattern.
+"""
+
+import re
+
+from . import version
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['split_name', 'parse_names', 'ChannelNameTable']
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+COMPONENTS = ('ifo', 'system', 'subsystem', 'signal')
+
+# the separators are captured so that an empty component (e.g. 'PSL-')
+# can be told apart from a missing one (e.g. 'PSL')
+_NAME_PATTERN = (r'(?:([A-Z]\d):)?([^-_\n]*)(?:([-_])([^-_\n]*))?'
+                 r'(?:([-_])([^\n]*))?')
+_re_name = re.compile(r'\A%s\Z' % _NAME_PATTERN)
+_re_names = re.compile(r'^%s$' % _NAME_PATTERN, re.M)
+
+
+def _components(groups):
+    ifo, system, sep1, subsystem, sep2, signal = groups
+    return (ifo or None, system,
+            subsystem if sep1 else None,
+            signal if sep2 else None)
+
+
+def split_name(name):
+    """Decompose a channel name into its components
+
+    Parameters
+    ----------
+    name : `str`
+        name of channel
+
+    Returns
+    -------
+    ifo, system, subsystem, signal : `str`
+        the components of the name, each of which is `None` if not
+        present in the name
+    """
+    return _components(_re_name.match(name).groups())
+
+
+def parse_names(names):
+    """Decompose many channel names into columns of components
+
+    All names are matched in a single pass over their concatenation,
+    and each distinct component string is only stored once.
+
+    Parameters
+    ----------
+    names : `list` of `str`
+        channel names to parse
+
+    Returns
+    -------
+    table : `ChannelNameTable`
+        columns of name components, one row per input name
+    """
+    names = list(names)
+    rows = [None] * len(names)
+    valid = [i for i, name in enumerate(names) if name]
+    matches = valid and _re_names.findall(
+        '\n'.join([names[i] for i in valid])) or []
+    if len(matches) != len(valid):
+        raise ValueError("Cannot parse channel names containing newlines")
+    strings = {None: None}
+    intern_ = strings.setdefault
+    for i, (ifo, system, sep1, subsystem, sep2, signal) in zip(valid,
+                                                                matches):
+        rows[i] = (intern_(ifo, ifo) if ifo else None,
+                   intern_(system, system),
+                   intern_(subsystem, subsystem) if sep1 else None,
+                   intern_(signal, signal) if sep2 else None)
+    return ChannelNameTable(rows)
+
+
+class ChannelNameTable(object):
+    """Table of channel name components
+
+    Each of the `COMPONENTS` is available as a column attribute holding
+    a `numpy.ndarray` of (interned) `str`, with `None` for components
+    missing from a name. Indexing or iterating over the table gives
+    the ``(ifo, system, subsystem, signal)`` row for each name.
+
+    Parameters
+    ----------
+    rows : `list` of `tuple`
+        ``(ifo, system, subsystem, signal)`` for each name, or `None`
+        for an empty name
+    """
+    def __init__(self, rows):
+        self._rows = rows
+        self._columns = {}
+
+    def _column(self, component):
+        # columns are only built when first requested
+        try:
+            return self._columns[component]
+        except KeyError:
+            import numpy
+            idx = COMPONENTS.index(component)
+            array = numpy.empty(len(self._rows), dtype=object)
+            array[:] = [row and row[idx] for row in self._rows]
+            self._columns[component] = array
+            return array
+
+    @property
+    def ifo(self):
+        """Interferometer prefix of each name
+
+        :type: `numpy.ndarray`
+        """
+        return self._column('ifo')
+
+    @property
+    def system(self):
+        """System component of each name
+
+        :type: `numpy.ndarray`
+        """
+        return self._column('system')
+
+    @property
+    def subsystem(self):
+        """Sub-system component of each name
+
+        :type: `numpy.ndarray`
+        """
+        return self._column('subsystem')
+
+    @property
+    def signal(self):
+        """Signal component of each name, including any trailing parts
+
+        :type: `numpy.ndarray`
+        """
+        return self._column('signal')
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        return self._rows[i]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def groupby(self, component):
+        """Group the rows of this table by the value of a component
+
+        Parameters
+        ----------
+        component : `str`
+            name of the component, one of `COMPONENTS`
+
+        Returns
+        -------
+        groups : `OrderedDict`
+            (value, index array) pairs, in order of first appearance
+        """
+        if component not in COMPONENTS:
+            raise ValueError("Unrecognised name component %r, choose from "
+                             "%s" % (component, ', '.join(COMPONENTS)))
+        import numpy
+        idx = COMPONENTS.index(component)
+        groups = OrderedDict()
+        for i, row in enumerate(self._rows):
+            groups.setdefault(row and row[idx], []).append(i)
+        for key in groups:
+            groups[key] = numpy.array(groups[key], dtype=int)
+        return groups
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Profile all CIS activity within a block of code
+
+>>> import cis
+>>> with cis.profile() as p:
+...     channels = cis.ChannelList.query('L1:PSL-ISS')
+>>> print(p.report())
+
+This is built on the hooks and counters of `cis.timing`.
+"""
+
+import os
+import re
+import threading
+import time
+
+from . import (version, timing)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['Profile', 'profile']
+
+_re_id = re.compile(r'/\d+(?=/|\Z)')
+
+
+def endpoint(url):
+    """Format the API endpoint of a URL, with any IDs replaced
+
+    Examples
+    --------
+    >>> endpoint('https://cis.ligo.org/api/channel/1234/descriptions')
+    '/api/channel/<id>/descriptions'
+    """
+    path = url.split('://', 1)[-1]
+    path = '/' + path.split('/', 1)[-1] if '/' in path else '/'
+    path = path.split('?', 1)[0]
+    return _re_id.sub('/<id>', path)
+
+
+class Profile(object):
+    """Aggregate of all CIS activity within a `profile` context
+
+    Attributes
+    ----------
+    endpoints : `dict`
+        (endpoint, count) pairs of HTTP requests made to each API
+        endpoint, see `endpoint`
+    counters : `dict`
+        (key, count) pairs of all counters incremented with
+        `cis.timing.incr`, including:
+
+        - ``objects.Channel``, ``objects.Description``: number of
+          objects constructed
+        - ``cache.<name>.hit``, ``cache.<name>.miss``: cache lookups
+        - ``descriptions.fetched``: description records received
+        - ``descriptions.reused``: description records for which an
+          existing `~cis.description.Description` was reused
+    summary : `~cis.timing.TimingSummary`
+        per-phase timing of all requests and queries
+    wall : `float`
+        wall-clock seconds spent in the context
+    cpu : `float`
+        process CPU seconds (user plus system) spent in the context
+    """
+    def __init__(self):
+        self.endpoints = {}
+        self.counters = {}
+        self.summary = timing.TimingSummary()
+        self.wall = None
+        self.cpu = None
+        self._lock = threading.Lock()
+
+    # hook for `cis.timing.add_hook`
+    def __call__(self, record):
+        self.summary(record)
+        if record.kind == 'request':
+            key = endpoint(record.label)
+            with self._lock:
+                self.endpoints[key] = self.endpoints.get(key, 0) + 1
+
+    # sink for `cis.timing.add_counter`
+    def incr(self, key, n=1):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def as_dict(self):
+        """Format this profile as a `dict`
+        """
+        phases, cpu, counters = self.summary.totals()
+        out = {'wall': self.wall, 'cpu': self.cpu,
+               'requests': dict(self.endpoints),
+               'counters': dict(self.counters),
+               'phases': dict(phases), 'phases_cpu': dict(cpu)}
+        out.update(counters)
+        return out
+
+    def report(self):
+        """Format a concise report of this profile
+
+        Returns
+        -------
+        report : `str`
+            multi-line report
+        """
+        lines = []
+        if self.wall is not None:
+            lines.append('wall %.4f s, cpu %.4f s' % (self.wall, self.cpu))
+        lines.append(str(self.summary))
+        if self.endpoints:
+            lines.append('requests by endpoint:')
+            for key, n in sorted(self.endpoints.items()):
+                lines.append('    %-40s %8d' % (key, n))
+        if self.counters:
+            lines.append('counters:')
+            for key, n in sorted(self.counters.items()):
+                lines.append('    %-40s %8d' % (key, n))
+        return '\n'.join(lines)
+
+    __str__ = report
+
+
+class profile(object):
+    """Context manager that profiles all CIS activity in its block
+
+    Returns
+    -------
+    profile : `Profile`
+        record of activity, complete once the context exits
+
+    Examples
+    --------
+    >>> with profile() as p:
+    ...     channels = ChannelList.query('L1:PSL-ISS')
+    >>> p.counters['objects.Channel']
+    """
+    def __init__(self):
+        self.profile = Profile()
+
+    def __enter__(self):
+        self._start = time.time(), _cpu()
+        timing.add_hook(self.profile)
+        timing.add_counter(self.profile)
+        return self.profile
+
+    def __exit__(self, *exc):
+        timing.remove_counter(self.profile)
+        timing.remove_hook(self.profile)
+        self.profile.wall = time.time() - self._start[0]
+        self.profile.cpu = _cpu() - self._start[1]
+
+
+def _cpu():
+    times = os.times()
+    return times[0] + times[1]
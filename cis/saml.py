@@ -6,8 +6,11 @@ interoperate with the @LIGO.ORG infrastructure.
 
 import re
 import urllib2
+import threading
 import exceptions
 
+from . import timing
+
 class LIGOSAMLClientException(exceptions.Exception):
     """
     """
@@ -23,7 +26,7 @@ Scientific Linux the name of the package to install is 'python-kerberos'.
 """
     raise LIGOSAMLClientException, msg
 
-class HTTPNegotiateAuthHandler(urllib2.BaseHandler):
+class HTTPNegotiateAuthHandler(urllib2.BaseHandler, object):
     """
     This class uses an existing Kerberos ticket to authenticate
     via HTTP Negotiate Authentication. An instance of this class
@@ -33,6 +36,10 @@ class HTTPNegotiateAuthHandler(urllib2.BaseHandler):
     Modified from source found at
 
     http://selenic.com/pipermail/mercurial/2008-June/019776.html
+
+    The negotiation state (`retried` and `context`) is kept separately
+    for each thread, so that a single handler, and hence a single
+    opener, can be used from many threads at once.
     """
 
     rx = re.compile('(?:.*,)*\s*Negotiate\s*([^,]*),?', re.I)
@@ -44,10 +51,30 @@ class HTTPNegotiateAuthHandler(urllib2.BaseHandler):
         host against which the client authenticates. It 
         should usually be the string 'HTTP@login.ligo.org'.
         """
-        self.retried = 0
-        self.context = None
+        self._local = threading.local()
         self.service_principal = service_principal
 
+    @property
+    def retried(self):
+        """Number of negotiation attempts for the current request, in
+        the current thread
+        """
+        return getattr(self._local, 'retried', 0)
+
+    @retried.setter
+    def retried(self, n):
+        self._local.retried = n
+
+    @property
+    def context(self):
+        """Kerberos client context of the current thread
+        """
+        return getattr(self._local, 'context', None)
+
+    @context.setter
+    def context(self, ctx):
+        self._local.context = ctx
+
     def negotiate_value(self, headers):
         authreq = headers.get('www-authenticate', None)
 
@@ -94,14 +121,18 @@ class HTTPNegotiateAuthHandler(urllib2.BaseHandler):
     def clean_context(self):
         if self.context is not None:
             kerberos.authGSSClientClean(self.context)
+            self.context = None
 
     def http_error_401(self, req, fp, code, msg, headers):
         try:
-            neg_hdr = self.generate_request_header(req, headers)
+            with timing.phase('auth'):
+                neg_hdr = self.generate_request_header(req, headers)
 
             if neg_hdr is None:
                 return None
 
+            timing.count('auth_retries')
+
             req.add_unredirected_header('Authorization', neg_hdr)
             resp = self.parent.open(req)
 
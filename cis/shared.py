@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Read-only views of a `~cis.channel.ChannelList` shared between processes
+
+A `SharedChannelList` holds its channels in a `~cis.catalog.Catalog`
+file on a memory-backed filesystem (``/dev/shm``, where available), that
+every process maps into memory rather than reading. Pickling the view
+only stores the path of that file, so handing it to `multiprocessing`
+workers is cheap, and all of them read the same pages of memory, rather
+than each holding a private copy of the list:
+
+>>> from multiprocessing import Pool
+>>> with channels.share() as shared:
+...     results = Pool(8).map(work, [(shared, i) for i in range(8)])
+
+`Channel` objects are only built for the rows that a worker touches.
+"""
+
+import os
+import re
+import tempfile
+
+from . import version
+from .catalog import Catalog
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['SharedChannelList']
+
+SHM_DIR = '/dev/shm'
+
+# number of rows built at once when iterating over a view
+_BATCH = 1024
+
+# characters that make a name a regular expression, rather than a literal
+_re_special = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+class SharedChannelList(object):
+    """Read-only view of a `~cis.channel.ChannelList` in shared memory
+
+    Parameters
+    ----------
+    filename : `str`
+        path of the file holding the channels, as written by
+        `SharedChannelList.create`
+
+    Notes
+    -----
+    Channels are held in name order, without their descriptions. The
+    view supports `len`, indexing, iteration, ``in``, and the `find`
+    and `sieve` methods of a `~cis.channel.ChannelList`, each of which
+    builds new `Channel` objects for the rows it returns.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.catalog = Catalog(filename)
+        self._owner = None
+
+    @classmethod
+    def create(cls, channels, directory=None):
+        """Copy a list of channels into a new shared file
+
+        The file is removed when the returned view is closed, so the
+        view should be kept open until all processes have opened it.
+
+        Parameters
+        ----------
+        channels : iterable of `~cis.channel.Channel`
+            channels to share
+        directory : `str`, optional
+            directory in which to write the file, default: ``/dev/shm``
+            if writable, otherwise the system temporary directory
+
+        Returns
+        -------
+        shared : `SharedChannelList`
+            the new view, which owns the shared file
+        """
+        if directory is None:
+            directory = _shm_dir()
+        fd, filename = tempfile.mkstemp(prefix='cis-', suffix='.catalog',
+                                        dir=directory)
+        os.close(fd)
+        try:
+            Catalog.write(filename, [c.to_json() for c in channels]).close()
+        except Exception:
+            os.unlink(filename)
+            raise
+        new = cls(filename)
+        # only the creating process removes the file, not forked children
+        new._owner = os.getpid()
+        return new
+
+    def close(self):
+        """Unmap the shared file, and remove it if this view created it
+
+        Processes that have already opened the file can keep using it.
+        """
+        self.catalog.close()
+        self._remove()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self._remove()
+
+    def _remove(self):
+        # remove the shared file, if this process created it; `__init__`
+        # may not have finished, and the file may already be gone
+        if getattr(self, '_owner', None) == os.getpid():
+            self._owner = None
+            try:
+                os.unlink(self.filename)
+            except OSError:
+                pass
+
+    def __reduce__(self):
+        # unpickling opens the same file again
+        return (self.__class__, (self.filename,))
+
+    def __repr__(self):
+        return '<%s(%d channels, %r)>' % (self.__class__.__name__,
+                                          len(self), self.filename)
+
+    # ------------------------------------------------------------------------
+    # sequence methods
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.catalog.channels(range(*key.indices(len(self))))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("%s index out of range"
+                             % self.__class__.__name__)
+        return self.catalog.channels([key])[0]
+
+    def __iter__(self):
+        count = len(self)
+        for start in xrange(0, count, _BATCH):
+            for channel in self.catalog.channels(
+                    xrange(start, min(start + _BATCH, count))):
+                yield channel
+
+    def __contains__(self, channel):
+        return self.catalog.find(str(channel)) is not None
+
+    # ------------------------------------------------------------------------
+    # ChannelList methods
+
+    def find(self, name):
+        """Find the position of the `Channel` with the given name
+
+        Parameters
+        ----------
+        name : `str`
+            name of the `Channel` to find
+
+        Returns
+        -------
+        idx : `int`
+            position of the `Channel` in this view
+
+        Raises
+        ------
+        ValueError
+            if no such channel exists
+        """
+        row = self.catalog.find(name)
+        if row is None:
+            raise ValueError(name)
+        return row
+
+    def sieve(self, name=None, sample_rate=None, sample_range=None,
+              exact_match=False):
+        """Find all `Channel`\_s in this view that match the given criteria
+
+        The sample rates are filtered in place in shared memory, and
+        names are only matched for the rows that remain.
+
+        Parameters
+        ----------
+        name : `str`, or regular expression
+            any part of the channel name against which to match
+            (or full name if `exact_match=True` is given)
+        sample_rate : `float`
+            rate (number of samples per second) to match exactly
+        sample_range : 2-`tuple`
+            `[low, high]` closed interval or rates to match within
+        exact_match : `bool`
+            return channels matching `name` exactly, default: `False`
+
+        Returns
+        -------
+        new : `~cis.channel.ChannelList`
+            a new (private) list containing the matching channels
+        """
+        import numpy
+        catalog = self.catalog
+        pattern = None
+        if (exact_match and isinstance(name, basestring) and
+                not _re_special.search(name)):
+            # a literal name is found by binary search
+            row = catalog.find(name)
+            rows = numpy.array([] if row is None else [row], dtype=int)
+        else:
+            if name is not None:
+                pattern = _compile(name, exact_match)
+            rows = numpy.arange(len(catalog))
+        if sample_rate is not None or sample_range is not None:
+            rates = catalog.array('sample_rate')[rows]
+            keep = numpy.ones(len(rates), dtype=bool)
+            if sample_rate is not None:
+                keep &= rates == sample_rate
+            if sample_range is not None:
+                keep &= ((rates >= sample_range[0]) &
+                         (rates <= sample_range[1]))
+            rows = rows[keep]
+        rows = rows.tolist()
+        if pattern is not None:
+            search = pattern.search
+            rows = [i for i in rows if search(catalog.name(i)) is not None]
+        return catalog.channels(rows)
+
+
+def _compile(name, exact_match):
+    # compile a name regex as for `ChannelList.sieve`
+    if isinstance(name, re._pattern_type):
+        flags = name.flags
+        name = name.pattern
+    else:
+        flags = 0
+    if exact_match:
+        name = name.startswith('\\A') and name or r"\A%s" % name
+        name = name.endswith('\\Z') and name or r"%s\Z" % name
+    return re.compile(name, flags=flags)
+
+
+def _shm_dir():
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        return SHM_DIR
+    return tempfile.gettempdir()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Incremental decoding of paginated JSON replies from the CIS API
+
+Each page of a CIS API query is a JSON object of the form
+
+.. code:: json
+
+   {"count": 2, "next": null, "previous": null,
+    "results": [{...}, {...}]}
+
+The `PageReader` decodes such a page as it is read from the network,
+yielding each member of the ``results`` array as soon as it has been
+received, so that only one record (plus a read buffer) is held in memory
+at any time.
+"""
+
+import re
+
+from . import version
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['PageReader']
+
+CHUNK_SIZE = 65536
+
+_re_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class PageReader(object):
+    """Incremental reader for one page of a CIS API reply
+
+    Iterating over a `PageReader` yields each member of the ``results``
+    array in turn. All other top-level members of the page (e.g.
+    ``count`` and ``next``) are stored in the `meta` `dict` as they are
+    read; these are only guaranteed to be complete once iteration has
+    finished.
+
+    Parameters
+    ----------
+    fobj : `file`-like
+        open stream of JSON data, e.g. an HTTP response
+    key : `str`, optional
+        name of the array member to iterate over, default: ``'results'``
+    chunk_size : `int`, optional
+        number of bytes to read from ``fobj`` at a time
+
+    Examples
+    --------
+    >>> reader = PageReader(connect.request(url))
+    >>> for jdata in reader:
+    ...     print(jdata['name'])
+    >>> reader.meta['next']
+    """
+    def __init__(self, fobj, key='results', chunk_size=CHUNK_SIZE):
+        self.fobj = fobj
+        self.key = key
+        self.chunk_size = chunk_size
+        import json
+        self.meta = {}
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    # ------------------------------------------------------------------------
+    # buffer management
+
+    def _read(self):
+        """Read the next chunk from the stream into the buffer
+        """
+        if self._eof:
+            raise ValueError("Unexpected end of JSON stream")
+        data = self.fobj.read(self.chunk_size)
+        if not data:
+            self._eof = True
+            return
+        # drop what has already been decoded before extending the buffer
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+
+    def _peek(self):
+        """Return the next non-whitespace character without consuming it
+        """
+        while True:
+            self._pos = _re_whitespace.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            self._read()
+
+    def _expect(self, char):
+        c = self._peek()
+        if c != char:
+            raise ValueError("Expected %r at position %d of JSON stream, "
+                             "found %r" % (char, self._pos, c))
+        self._pos += 1
+
+    def _decode(self):
+        """Decode the next complete JSON value from the stream
+        """
+        self._peek()
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                self._read()
+                continue
+            # a number at the end of the buffer may have been truncated
+            if end == len(self._buffer) and not self._eof:
+                self._read()
+                continue
+            self._pos = end
+            return obj
+
+    # ------------------------------------------------------------------------
+    # iteration
+
+    def __iter__(self):
+        self._expect('{')
+        while True:
+            c = self._peek()
+            if c == '}':
+                self._pos += 1
+                return
+            elif c == ',':
+                self._pos += 1
+                continue
+            key = self._decode()
+            self._expect(':')
+            if key == self.key and self._peek() == '[':
+                self._pos += 1
+                while True:
+                    c = self._peek()
+                    if c == ']':
+                        self._pos += 1
+                        break
+                    elif c == ',':
+                        self._pos += 1
+                        continue
+                    yield self._decode()
+            else:
+                self.meta[key] = self._decode()
+
@@ -0,0 +1,552 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Per-phase timing of CIS requests and queries
+
+Every request made through `cis.connect` and every
+`~cis.channel.ChannelList.query` can be timed, phase by phase. Timing
+is off until a hook is registered with `add_hook`, at which point each
+completed request or query is passed to every hook as a `Timing`
+record. The simplest hook is a `TimingSummary`:
+
+>>> from cis import (timing, ChannelList)
+>>> with timing.collect() as summary:
+...     channels = ChannelList.query('L1:PSL-ISS')
+>>> print(summary)
+
+Phases of an HTTP request are:
+
+============  ==============================================================
+``connect``   opening the TCP connection, including the TLS handshake
+``auth``      Kerberos negotiation in response to a challenge
+``request``   sending the request and waiting for the response headers
+``transfer``  reading the response body off the wire
+============  ==============================================================
+
+and phases of a query are:
+
+==============  ============================================================
+``parse``       decoding JSON (including decompression)
+``construct``   building `~cis.channel.Channel` objects from records
+``parse_name``  splitting names into components and their descriptions
+``wait``        waiting for description requests to complete
+==============  ============================================================
+
+Phase durations are exclusive, e.g. the time taken to ``connect`` is
+not included in the ``request`` phase of the same request.
+"""
+
+import threading
+import time
+
+from . import version
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['Timing', 'TimingSummary', 'add_hook', 'remove_hook', 'collect',
+           'add_counter', 'remove_counter', 'incr']
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+# counters kept by each `Timing`
+COUNTERS = ('bytes', 'bytes_sent', 'redirects', 'auth_retries')
+
+_HOOKS = []
+_COUNTERS = []
+_HOOKS_LOCK = threading.Lock()
+_local = threading.local()
+
+
+def _thread_clock():
+    """Return a function giving the CPU time used by the calling thread
+    """
+    try:
+        import ctypes
+        import ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or None,
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        CLOCK_THREAD_CPUTIME_ID = 3
+        if clock_gettime(CLOCK_THREAD_CPUTIME_ID,
+                         ctypes.byref(timespec())) != 0:
+            raise OSError(ctypes.get_errno())
+    except (ImportError, AttributeError, OSError, TypeError):
+        # per-process CPU time is the best that can be done
+        return time.clock
+
+    def thread_clock():
+        ts = timespec()
+        clock_gettime(CLOCK_THREAD_CPUTIME_ID, ctypes.byref(ts))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    return thread_clock
+
+
+class _LazyClock(object):
+    # the thread clock is only built when a phase is first timed
+    def __call__(self):
+        global cpu_clock
+        cpu_clock = _thread_clock()
+        return cpu_clock()
+
+cpu_clock = _LazyClock()
+
+
+# -----------------------------------------------------------------------------
+# hooks
+
+def add_hook(hook):
+    """Register a function to be called with each completed `Timing`
+
+    Parameters
+    ----------
+    hook : `callable`
+        function taking a single `Timing` argument, this is called
+        from whichever thread completes the request or query, so
+        should be thread-safe
+    """
+    with _HOOKS_LOCK:
+        _HOOKS.append(hook)
+
+
+def remove_hook(hook):
+    """Unregister a function added with `add_hook`
+    """
+    with _HOOKS_LOCK:
+        _HOOKS.remove(hook)
+
+
+def enabled():
+    """Returns `True` if any hooks are registered, otherwise `False`
+    """
+    return bool(_HOOKS)
+
+
+def add_counter(sink):
+    """Register an object to receive all counter increments
+
+    Parameters
+    ----------
+    sink : `object`
+        any object with an ``incr(key, n)`` method, this is called
+        from whichever thread makes the increment, so should be
+        thread-safe
+    """
+    global _COUNTERS
+    # the list is replaced, not modified, so that `incr` can iterate
+    # over it without a lock
+    with _HOOKS_LOCK:
+        _COUNTERS = _COUNTERS + [sink]
+
+
+def remove_counter(sink):
+    """Unregister an object added with `add_counter`
+    """
+    global _COUNTERS
+    with _HOOKS_LOCK:
+        counters = list(_COUNTERS)
+        counters.remove(sink)
+        _COUNTERS = counters
+
+
+def incr(key, n=1):
+    """Increment a named counter, e.g. of objects constructed
+
+    Counters are only kept by the objects registered with
+    `add_counter`, so this does nothing unless one is registered.
+
+    Parameters
+    ----------
+    key : `str`
+        name of counter
+    n : `int`, optional
+        amount by which to increment the counter, default: ``1``
+    """
+    for sink in _COUNTERS:
+        sink.incr(key, n)
+
+
+class collect(object):
+    """Context manager that collects all timings in a `TimingSummary`
+
+    Parameters
+    ----------
+    summary : `TimingSummary`, optional
+        summary to add timings to, default: a new `TimingSummary`
+    """
+    def __init__(self, summary=None):
+        self.summary = summary if summary is not None else TimingSummary()
+
+    def __enter__(self):
+        add_hook(self.summary)
+        return self.summary
+
+    def __exit__(self, *exc):
+        remove_hook(self.summary)
+
+
+# -----------------------------------------------------------------------------
+# records
+
+class Timing(object):
+    """Timing record for a single request or query
+
+    Parameters
+    ----------
+    kind : `str`
+        type of record, ``'request'`` or ``'query'``
+    label : `str`
+        URL of the request, or name of the query
+    parent : `Timing`, optional
+        the query that made this request
+
+    Attributes
+    ----------
+    phases : `OrderedDict`
+        (phase, seconds) pairs of the time spent in each phase
+    cpu : `OrderedDict`
+        (phase, seconds) pairs of the CPU time used by each phase
+    bytes : `int`
+        number of bytes received over the wire, before decompression
+    bytes_sent : `int`
+        number of bytes sent over the wire
+    redirects : `int`
+        number of HTTP redirects followed
+    auth_retries : `int`
+        number of times Kerberos authentication was negotiated
+    elapsed : `float`
+        wall-clock seconds from start to finish, `None` until finished
+    status : `int`
+        HTTP status code of a request, `None` if no response was
+        received
+    requests : `list` of `Timing`
+        the requests made by this query
+    """
+    def __init__(self, kind, label, parent=None):
+        self.kind = kind
+        self.label = label
+        self.parent = parent
+        self.phases = OrderedDict()
+        self.cpu = OrderedDict()
+        self.bytes = 0
+        self.bytes_sent = 0
+        self.redirects = 0
+        self.auth_retries = 0
+        self.requests = []
+        self.start = time.time()
+        self.elapsed = None
+        self.status = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Timing(%s %r, elapsed=%s)>' % (self.kind, self.label,
+                                                 self.elapsed)
+
+    def add(self, phase, seconds, cpu=0.):
+        """Add time to a phase of this record
+        """
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.) + seconds
+            self.cpu[phase] = self.cpu.get(phase, 0.) + cpu
+
+    def count(self, attr, n=1):
+        """Increment one of the counters of this record
+        """
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + n)
+
+    def finish(self):
+        """Mark this record complete, and pass it to all hooks
+
+        Calling `finish` more than once has no effect.
+        """
+        with self._lock:
+            if self.elapsed is not None:
+                return
+            self.elapsed = time.time() - self.start
+        if self.parent is not None:
+            with self.parent._lock:
+                self.parent.requests.append(self)
+        for hook in list(_HOOKS):
+            hook(self)
+
+    def total(self):
+        """Combine the phases and counters of this record and its requests
+
+        Returns
+        -------
+        phases : `OrderedDict`
+            (phase, seconds) pairs summed over this record and all of
+            its requests
+        cpu : `OrderedDict`
+            (phase, CPU seconds) pairs summed over this record and all
+            of its requests
+        counters : `dict`
+            each of the `COUNTERS` summed over this record and all of
+            its requests
+        """
+        phases = OrderedDict()
+        cpu = OrderedDict()
+        counters = dict.fromkeys(COUNTERS, 0)
+        with self._lock:
+            records = [self] + self.requests
+        for record in records:
+            _sum(phases, record.phases)
+            _sum(cpu, record.cpu)
+            for key in counters:
+                counters[key] += getattr(record, key)
+        return phases, cpu, counters
+
+    def as_dict(self):
+        """Format this record as a `dict`
+        """
+        return {'kind': self.kind, 'label': self.label,
+                'elapsed': self.elapsed, 'phases': dict(self.phases),
+                'cpu': dict(self.cpu),
+                'status': self.status, 'bytes': self.bytes,
+                'bytes_sent': self.bytes_sent, 'redirects': self.redirects,
+                'auth_retries': self.auth_retries,
+                'requests': [r.as_dict() for r in self.requests]}
+
+
+class TimingSummary(object):
+    """Aggregate of many `Timing` records
+
+    A `TimingSummary` is a hook for `add_hook`, see `collect`.
+
+    Attributes
+    ----------
+    records : `list` of `Timing`
+        all records that were not made on behalf of a query, i.e. all
+        queries and any stand-alone requests
+    nrequests : `int`
+        total number of HTTP requests
+    nqueries : `int`
+        total number of queries
+    """
+    def __init__(self):
+        self.records = []
+        self.nrequests = 0
+        self.nqueries = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, timing):
+        with self._lock:
+            if timing.kind == 'request':
+                self.nrequests += 1
+            else:
+                self.nqueries += 1
+            if timing.parent is None:
+                self.records.append(timing)
+
+    def totals(self):
+        """Sum the phases and counters of all records
+
+        Returns
+        -------
+        phases : `OrderedDict`
+            (phase, seconds) pairs
+        cpu : `OrderedDict`
+            (phase, CPU seconds) pairs
+        counters : `dict`
+            totals of each of the `COUNTERS`
+        """
+        phases = OrderedDict()
+        cpu = OrderedDict()
+        counters = dict.fromkeys(COUNTERS, 0)
+        with self._lock:
+            records = list(self.records)
+        for record in records:
+            p, u, c = record.total()
+            _sum(phases, p)
+            _sum(cpu, u)
+            for key in counters:
+                counters[key] += c[key]
+        return phases, cpu, counters
+
+    def as_dict(self):
+        """Format this summary as a `dict`
+        """
+        phases, cpu, counters = self.totals()
+        out = {'requests': self.nrequests, 'queries': self.nqueries,
+               'phases': dict(phases), 'cpu': dict(cpu)}
+        out.update(counters)
+        return out
+
+    def __str__(self):
+        phases, cpu, counters = self.totals()
+        lines = ['%d queries, %d requests, %d bytes, %d redirects, '
+                 '%d auth retries' % (self.nqueries, self.nrequests,
+                                      counters['bytes'],
+                                      counters['redirects'],
+                                      counters['auth_retries'])]
+        total = sum(phases.values()) or 1.
+        for phase, seconds in phases.items():
+            lines.append('    %-12s %10.4f s %6.1f%%  (cpu %.4f s)'
+                         % (phase, seconds, seconds / total * 100,
+                            cpu.get(phase, 0.)))
+        return '\n'.join(lines)
+
+
+def _sum(total, phases):
+    for phase, seconds in phases.items():
+        total[phase] = total.get(phase, 0.) + seconds
+
+
+# -----------------------------------------------------------------------------
+# phases
+
+def current():
+    """Return the `Timing` active in this thread, or `None`
+    """
+    stack = getattr(_local, 'active', None)
+    return stack[-1] if stack else None
+
+
+def count(attr, n=1):
+    """Increment a counter of the `Timing` active in this thread, if any
+    """
+    timing = current()
+    if timing is not None:
+        timing.count(attr, n)
+
+
+class activate(object):
+    """Context manager that makes a `Timing` active in this thread
+
+    While active, any `phase` entered in this thread, without an
+    explicit record, is charged to this `Timing`.
+    """
+    def __init__(self, timing):
+        self.timing = timing
+
+    def __enter__(self):
+        if self.timing is not None:
+            try:
+                _local.active.append(self.timing)
+            except AttributeError:
+                _local.active = [self.timing]
+        return self.timing
+
+    def __exit__(self, *exc):
+        if self.timing is not None:
+            _local.active.pop()
+
+
+class _Phase(object):
+    __slots__ = ('timing', 'name', 'start', 'cpu')
+
+    def __init__(self, timing, name):
+        self.timing = timing
+        self.name = name
+
+    def __enter__(self):
+        now = time.time()
+        cpu = cpu_clock()
+        try:
+            stack = _local.phases
+        except AttributeError:
+            stack = _local.phases = []
+        if stack:  # pause the enclosing phase
+            outer = stack[-1]
+            outer.timing.add(outer.name, now - outer.start, cpu - outer.cpu)
+        self.start = now
+        self.cpu = cpu
+        stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        now = time.time()
+        cpu = cpu_clock()
+        stack = _local.phases
+        self.timing.add(self.name, now - self.start, cpu - self.cpu)
+        stack.pop()
+        if stack:  # resume the enclosing phase
+            stack[-1].start = now
+            stack[-1].cpu = cpu
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+_NULL_PHASE = _NullPhase()
+
+
+def phase(name, timing=None):
+    """Time a phase of a request or query
+
+    Parameters
+    ----------
+    name : `str`
+        name of phase
+    timing : `Timing`, optional
+        record to charge the time to, default: the `Timing` active in
+        this thread, if none is active, nothing is timed
+
+    Returns
+    -------
+    context : context manager
+        context that times its contents
+    """
+    if timing is None:
+        timing = current()
+        if timing is None:
+            return _NULL_PHASE
+    return _Phase(timing, name)
+
+
+class TimedResponse(object):
+    """`file`-like wrapper that times reading an HTTP response
+
+    The time spent in ``read()`` is charged to the ``transfer`` phase of
+    the given `Timing`, along with the number of bytes read, and the
+    `Timing` is finished when the body has been read completely, or the
+    response is closed.
+    """
+    def __init__(self, response, timing):
+        self.response = response
+        self.timing = timing
+
+    def __getattr__(self, attr):
+        return getattr(self.response, attr)
+
+    def read(self, size=-1):
+        with phase('transfer', self.timing):
+            data = self.response.read(size)
+        self.timing.count('bytes', len(data))
+        if not data or size is None or size < 0:
+            self.timing.finish()
+        return data
+
+    def close(self):
+        self.timing.finish()
+        self.response.close()
@@ -0,0 +1,1288 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) Duncan Macleod (2013)
+#
+# This file is part of LIGO-CIS
+#
+# LIGO-CIS is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# LIGO-CIS is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with LIGO-CIS.  If not, see <http://www.gnu.org/licenses/>
+
+"""Transports for HTTP requests to the CIS
+
+A `Transport` is responsible for getting a single response for a URL
+over the wire. All requests made by `cis.connect.Session`, and hence by
+`~cis.channel.ChannelList.query`, `~cis.channel.Channel.get_descriptions`
+and `~cis.description.Description.request`, go through a `Transport`:
+
+.. autosummary::
+   :nosignatures:
+
+   UrllibTransport
+   PooledTransport
+   FakeTransport
+   RecordingTransport
+   ReplayTransport
+   HedgedTransport
+   LimitedTransport
+
+Every transport returns `file`-like responses supporting ``read()``,
+``info()``, ``geturl()`` and ``code``, and raises
+:class:`urllib2.HTTPError` for HTTP error statuses, as
+:func:`urllib2.urlopen` does. Stalled connections raise
+:class:`socket.timeout` (or a :class:`urllib2.URLError` wrapping one)
+once the ``timeout`` given to `Transport.open` has passed.
+"""
+
+import os
+import stat
+import socket
+import httplib
+import urllib2
+import threading
+from contextlib import contextmanager
+
+from . import (version, connect, timing)
+
+__author__ = 'Duncan Macleod <duncan.macleod@ligo.org>'
+__credits__ = 'Scott Koranda <scott.koranda@ligo.org>'
+__version__ = version.__version__
+
+__all__ = ['Transport', 'UrllibTransport', 'PooledTransport',
+           'FakeTransport', 'RecordingTransport', 'ReplayTransport',
+           'HedgedTransport', 'LimitedTransport', 'AdaptiveLimiter']
+
+# number of threads used by default for asynchronous requests
+ASYNC_WORKERS = 8
+
+
+class Transport(object):
+    """Base class for HTTP transports
+
+    Sub-classes must implement `open`; `open_async` runs `open` on a
+    pool of `workers` threads owned by the transport.
+
+    Parameters
+    ----------
+    debug : `bool`, optional
+        print verbose HTTP connection status, default: `False`
+    workers : `int`, optional
+        number of threads for asynchronous requests,
+        default: `ASYNC_WORKERS`
+    """
+    def __init__(self, debug=False, workers=ASYNC_WORKERS):
+        self.debug = int(debug)
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self, url, headers=None, timeout=None):
+        """Request the given URL
+
+        Parameters
+        ----------
+        url : `str`
+            URL path for request
+        headers : `dict`, optional
+            extra HTTP headers to send with the request
+        timeout : `float`, optional
+            seconds to wait on a stalled connection, for each of
+            connecting, and each read of the response, default: the
+            global default of the :mod:`socket` module
+
+        Returns
+        -------
+        response : `file`-like
+            the (undecoded) HTTP response
+
+        Raises
+        ------
+        urllib2.HTTPError
+            if the server returns an HTTP error status
+        socket.timeout, urllib2.URLError
+            if the connection stalls for longer than ``timeout``
+        """
+        raise NotImplementedError("%s does not implement open()"
+                                  % type(self).__name__)
+
+    def open_async(self, url, headers=None, timeout=None, callback=None):
+        """Request the given URL in a background thread
+
+        Parameters
+        ----------
+        url : `str`
+            URL path for request
+        headers : `dict`, optional
+            extra HTTP headers to send with the request
+        timeout : `float`, optional
+            seconds to wait on a stalled connection
+        callback : `callable`, optional
+            function to call with the response when it is ready
+
+        Returns
+        -------
+        result : :class:`multiprocessing.pool.AsyncResult`
+            handle on the response, call ``result.get()`` to wait for it;
+            any error raised by `open` is re-raised from ``get()``
+        """
+        return self.pool.apply_async(self.open, (url,),
+                                     {'headers': headers, 'timeout': timeout},
+                                     callback=callback)
+
+    @property
+    def pool(self):
+        """Thread pool used for asynchronous requests
+
+        :type: :class:`multiprocessing.pool.ThreadPool`
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def close(self):
+        """Release any resources held by this transport
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
+
+
+# -----------------------------------------------------------------------------
+# urllib2
+
+class _TimedHTTPConnection(httplib.HTTPConnection):
+    def connect(self):
+        with timing.phase('connect'):
+            httplib.HTTPConnection.connect(self)
+
+    def send(self, data):
+        timing.count('bytes_sent', len(data))
+        httplib.HTTPConnection.send(self, data)
+
+
+class _TimedHTTPSConnection(httplib.HTTPSConnection):
+    def connect(self):
+        with timing.phase('connect'):
+            httplib.HTTPSConnection.connect(self)
+
+    def send(self, data):
+        timing.count('bytes_sent', len(data))
+        httplib.HTTPSConnection.send(self, data)
+
+
+class TimedHTTPHandler(urllib2.HTTPHandler):
+    """`urllib2.HTTPHandler` that times connection set-up
+    """
+    def http_open(self, req):
+        return self.do_open(_TimedHTTPConnection, req)
+
+
+class TimedHTTPSHandler(urllib2.HTTPSHandler):
+    """`urllib2.HTTPSHandler` that times connection set-up, including
+    the TLS handshake
+    """
+    def https_open(self, req):
+        return self.do_open(_TimedHTTPSConnection, req)
+
+
+class CountingRedirectHandler(urllib2.HTTPRedirectHandler):
+    """`urllib2.HTTPRedirectHandler` that counts redirects followed
+    """
+    def redirect_request(self, *args, **kwargs):
+        new = urllib2.HTTPRedirectHandler.redirect_request(
+            self, *args, **kwargs)
+        if new is not None:
+            timing.count('redirects')
+        return new
+
+
+class UrllibTransport(Transport):
+    """Transport using :mod:`urllib2` with LIGO.ORG SAML authentication
+
+    The cookie jar is loaded once when the transport is created and
+    shared by all requests, so that a LIGO.ORG login is negotiated once
+    for any number of requests. Each thread gets its own URL opener,
+    all sharing the same cookies. The cookie file is saved after any
+    response that changes the cookies, and is locked while it is read
+    or written, and replaced atomically, so many transports, in many
+    threads or processes, may share the same file.
+
+    Parameters
+    ----------
+    debug : `bool`, optional
+        print verbose HTTP connection status, default: `False`
+    cookiejar : `str`, optional
+        path of file in which to persist session cookies,
+        default: `cis.connect.COOKIE_JAR`
+    workers : `int`, optional
+        number of threads for asynchronous requests
+    auth : `bool`, optional
+        negotiate Kerberos authentication when challenged, default:
+        `True`, set to `False` to talk to a server that does not need
+        authentication without requiring the `kerberos` module
+    """
+    def __init__(self, debug=False, cookiejar=None, workers=ASYNC_WORKERS,
+                 auth=True):
+        super(UrllibTransport, self).__init__(debug=debug, workers=workers)
+        import cookielib
+        if cookiejar is None:
+            cookiejar = connect.COOKIE_JAR
+        self.cookiejar = cookiejar
+        self.auth = auth
+
+        # use a cookie jar to store session cookies
+        self.jar = cookielib.LWPCookieJar()
+
+        # if a cookier jar exists open it and read the cookies
+        # and make sure it has the right permissions
+        if cookiejar:
+            with _lock_cookies(cookiejar):
+                if os.path.exists(cookiejar):
+                    os.chmod(cookiejar, stat.S_IRUSR | stat.S_IWUSR)
+
+                    # set ignore_discard so that session cookies are
+                    # preserved
+                    self.jar.load(cookiejar, ignore_discard=True)
+        self._saved = _cookie_state(self.jar)
+
+        self._local = threading.local()
+
+    def _build_opener(self):
+
+        # need an instance of HTTPS handler to do HTTPS, the HTTP(S)
+        # handlers time connection set-up for `cis.timing`
+        httpshandler = TimedHTTPSHandler(debuglevel=self.debug)
+        httphandler = TimedHTTPHandler(debuglevel=self.debug)
+
+        # create a cookie handler from the cookier jar
+        cookiehandler = urllib2.HTTPCookieProcessor(self.jar)
+        # need a redirect handler to follow redirects
+        redirecthandler = CountingRedirectHandler()
+
+        handlers = [cookiehandler, httphandler, httpshandler,
+                    redirecthandler]
+
+        # need an auth handler that can do negotiation.
+        # input parameter is the Kerberos service principal.
+        if self.auth:
+            from .saml import HTTPNegotiateAuthHandler
+            principal = 'HTTP@%s' % connect.LIGO_LOGIN_URL
+            handlers.insert(0, HTTPNegotiateAuthHandler(
+                service_principal=principal))
+
+        # create the opener.
+        return urllib2.build_opener(*handlers)
+
+    @property
+    def opener(self):
+        """URL opener for the current thread
+
+        :type: :class:`urllib2.OpenerDirector`
+        """
+        try:
+            return self._local.opener
+        except AttributeError:
+            self._local.opener = self._build_opener()
+            return self._local.opener
+
+    def open(self, url, headers=None, timeout=None):
+
+        # prepare the request object
+        req = urllib2.Request(url, headers=headers or {})
+
+        # use the opener and the request object to make the request.
+        if timeout is None:
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+        try:
+            return self.opener.open(req, timeout=timeout)
+        finally:
+            # save new cookies (e.g. a LIGO.ORG login) as soon as they
+            # are set, so that other processes can use them
+            if self.cookiejar and _cookie_state(self.jar) != self._saved:
+                self.save()
+    open.__doc__ = Transport.open.__doc__
+
+    def save(self):
+        """Save the session cookies to the `cookiejar` file so that
+        they can be used again without having to authenticate
+        """
+        if not self.cookiejar:
+            return
+        with _lock_cookies(self.cookiejar):
+            # write a private copy, then move it into place, so that
+            # readers never see a partial file
+            tmp = '%s.%d.tmp' % (self.cookiejar, os.getpid())
+            os.close(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                             stat.S_IRUSR | stat.S_IWUSR))
+            # hold the jar's own lock, so that cookies set by requests in
+            # other threads do not change the jar while it is written
+            with self.jar._cookies_lock:
+                self.jar.save(tmp, ignore_discard=True)
+                self._saved = _cookie_state(self.jar)
+            os.rename(tmp, self.cookiejar)
+
+    def close(self):
+        """Close this transport, saving its cookies
+        """
+        super(UrllibTransport, self).close()
+        self.save()
+
+
+def _cookie_state(jar):
+    """Return a comparable snapshot of the cookies in a jar
+    """
+    with jar._cookies_lock:
+        return sorted((c.domain, c.path, c.name, c.value, c.expires)
+                      for c in jar)
+
+
+_COOKIE_LOCKS = {}
+_COOKIE_LOCKS_LOCK = threading.Lock()
+
+
+@contextmanager
+def _lock_cookies(path):
+    """Lock a cookie file against other threads and processes
+    """
+    with _COOKIE_LOCKS_LOCK:
+        lock = _COOKIE_LOCKS.setdefault(os.path.abspath(path),
+                                        threading.Lock())
+    with lock:
+        try:
+            import fcntl
+        except ImportError:  # no file locking on this platform
+            yield
+            return
+        fd = os.open('%s.lock' % path, os.O_WRONLY | os.O_CREAT,
+                     stat.S_IRUSR | stat.S_IWUSR)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the lock
+
+
+# -----------------------------------------------------------------------------
+# requests
+
+class PooledTransport(Transport):
+    """Transport using a pool of persistent HTTP connections
+
+    This transport keeps connections to each host open between
+    requests, saving a TCP and TLS handshake on every request after the
+    first. It requires the `requests <http://python-requests.org>`_
+    package, and `requests-kerberos` for LIGO.ORG authentication.
+
+    Parameters
+    ----------
+    debug : `bool`, optional
+        print verbose HTTP connection status, default: `False`
+    maxsize : `int`, optional
+        maximum number of connections to keep open per host
+    auth : `bool`, optional
+        negotiate Kerberos authentication when challenged, default:
+        `True`
+    workers : `int`, optional
+        number of threads for asynchronous requests, default: ``maxsize``
+    """
+    def __init__(self, debug=False, maxsize=10, auth=True, workers=None):
+        super(PooledTransport, self).__init__(debug=debug,
+                                              workers=workers or maxsize)
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+        except ImportError:
+            raise ImportError("PooledTransport requires the 'requests' "
+                              "package, please install it, or use the "
+                              "default UrllibTransport")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=maxsize,
+                              pool_maxsize=maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if auth:
+            try:
+                from requests_kerberos import (HTTPKerberosAuth, OPTIONAL)
+            except ImportError:
+                raise ImportError("PooledTransport authentication requires "
+                                  "the 'requests-kerberos' package, please "
+                                  "install it, or give auth=False")
+            # the Kerberos contexts of an auth object are not safe to
+            # share between threads, so each thread gets its own
+            self._auth = lambda: HTTPKerberosAuth(
+                mutual_authentication=OPTIONAL)
+        else:
+            self._auth = None
+        self._local = threading.local()
+
+    def open(self, url, headers=None, timeout=None):
+        import requests
+        if self.debug:
+            print("GET %s" % url)
+        # errors are raised as for `UrllibTransport`, so that callers
+        # recognise stalled and dropped connections in the same way;
+        # a `requests.ConnectTimeout` is both, and is raised as a timeout
+        try:
+            resp = self.session.get(url, headers=headers, stream=True,
+                                    timeout=timeout, auth=self.auth)
+        except requests.Timeout as e:
+            raise socket.timeout(str(e))
+        except requests.ConnectionError as e:
+            raise socket.error(str(e))
+        if resp.history:
+            timing.count('redirects', len(resp.history))
+        response = _RequestsResponse(resp)
+        if resp.status_code >= 400:
+            raise urllib2.HTTPError(resp.url, resp.status_code, resp.reason,
+                                    response.info(), response)
+        return response
+    open.__doc__ = Transport.open.__doc__
+
+    @property
+    def auth(self):
+        """Kerberos authentication for the current thread, or `None`
+        """
+        if self._auth is None:
+            return None
+        try:
+            return self._local.auth
+        except AttributeError:
+            self._local.auth = self._auth()
+            return self._local.auth
+
+    def close(self):
+        super(PooledTransport, self).close()
+        self.session.close()
+
+
+class _RequestsResponse(object):
+    """`urllib2`-style wrapper around a `requests.Response`
+
+    The body is read from the raw stream without decoding, so that the
+    content-encoding is handled by :func:`cis.connect.decode_response`
+    in the same way as for every other transport.
+    """
+    def __init__(self, response):
+        self.response = response
+        self.code = response.status_code
+        self.msg = response.reason
+
+    def info(self):
+        return self.response.headers
+
+    def geturl(self):
+        return self.response.url
+
+    def getcode(self):
+        return self.code
+
+    def read(self, size=-1):
+        from requests.packages.urllib3.exceptions import (
+            ReadTimeoutError, ProtocolError)
+        if size is None or size < 0:
+            size = None
+        try:
+            return self.response.raw.read(size, decode_content=False) or ''
+        except ReadTimeoutError as e:
+            raise socket.timeout(str(e))
+        except ProtocolError as e:
+            raise socket.error(str(e))
+
+    def close(self):
+        self.response.close()
+
+
+# -----------------------------------------------------------------------------
+# in-process fake
+
+class FakeTransport(Transport):
+    """Transport serving requests from an in-process fake CIS
+
+    No network connections (or Kerberos credentials) are needed, making
+    this transport suitable for tests and performance measurements of
+    everything above the wire.
+
+    Parameters
+    ----------
+    backend : `~cis.fake.FakeCIS`
+        the fake server that answers requests
+    workers : `int`, optional
+        number of threads for asynchronous requests
+
+    Examples
+    --------
+    >>> from cis.fake import FakeCIS
+    >>> transport = FakeTransport(FakeCIS.generate(1000))
+    >>> with connect.Session(transport=transport) as session:
+    ...     channels = ChannelList.query('H1:*', session=session)
+    """
+    def __init__(self, backend, debug=False, workers=ASYNC_WORKERS):
+        super(FakeTransport, self).__init__(debug=debug, workers=workers)
+        self.backend = backend
+
+    def open(self, url, headers=None, timeout=None):
+        if self.debug:
+            print("GET %s" % url)
+        code, msg, hdrs, body = self.backend.handle(url, headers=headers,
+                                                    timeout=timeout)
+        return _response(url, code, msg, hdrs, body)
+    open.__doc__ = Transport.open.__doc__
+
+
+# -----------------------------------------------------------------------------
+# record/replay
+
+class RecordingTransport(Transport):
+    """Transport that records every response from another transport
+
+    Each request/response pair is appended to a gzip-compressed file of
+    JSON lines (a 'cassette') as soon as the response has been read,
+    so that the cassette can be served later by a `ReplayTransport`.
+    Responses are passed on to the caller as they stream in, with the
+    body copied to a temporary file as it is read, so that recording
+    does not change the memory use or timing of the code it records.
+    Response bodies are stored exactly as received, still compressed if
+    the server compressed them. Redirects (including those through the
+    LIGO.ORG login service) are followed by the wrapped transport, and
+    the final URL is recorded with the response.
+
+    Parameters
+    ----------
+    filename : `str`
+        path of cassette file to write
+    transport : `Transport`, optional
+        transport that makes the real requests, default: a new
+        `UrllibTransport`; this is closed along with the
+        `RecordingTransport`
+    debug : `bool`, optional
+        print verbose HTTP connection status, default: `False`
+    workers : `int`, optional
+        number of threads for asynchronous requests
+    """
+    def __init__(self, filename, transport=None, debug=False,
+                 workers=ASYNC_WORKERS):
+        super(RecordingTransport, self).__init__(debug=debug,
+                                                 workers=workers)
+        import gzip
+        if transport is None:
+            transport = UrllibTransport(debug=debug)
+        self.transport = transport
+        self.filename = filename
+        self._fobj = gzip.open(filename, 'wb')
+        self._lock = threading.Lock()
+
+    def open(self, url, headers=None, timeout=None):
+        import time
+        start = time.time()
+        try:
+            response = self.transport.open(url, headers=headers,
+                                           timeout=timeout)
+        except urllib2.HTTPError as e:
+            # error bodies are small, so are recorded before raising
+            body = e.read()
+            record = _record(url, e)
+            self._write(record, [_escape(body)], time.time() - start)
+            return _response(record['final_url'], record['code'],
+                             record['msg'], record['headers'], body)
+        return _RecordedResponse(self, _record(url, response), response,
+                                 time.time() - start)
+    open.__doc__ = Transport.open.__doc__
+
+    def _write(self, record, body, elapsed):
+        """Append a record to the cassette
+
+        ``body`` is an iterable of JSON-escaped chunks of the response
+        body, written in place, so that it is never held in memory.
+        """
+        import json
+        head = json.dumps(record, separators=(',', ':'))[:-1]
+        with self._lock:
+            self._fobj.write('%s,"body":"' % head)
+            for chunk in body:
+                self._fobj.write(chunk)
+            self._fobj.write('","elapsed":%s}\n' % json.dumps(elapsed))
+
+    def close(self):
+        """Close this transport, and the transport it wraps, and
+        finish writing the cassette
+        """
+        super(RecordingTransport, self).close()
+        self.transport.close()
+        with self._lock:
+            self._fobj.close()
+
+
+class _RecordedResponse(object):
+    """`file`-like wrapper that copies a response body to a cassette
+
+    The body is returned to the caller as it is read, and spooled to a
+    temporary file, so that the record is written to the cassette once
+    the body has been read to the end, or the response is closed. The
+    recorded ``elapsed`` time only counts time spent waiting on the
+    wrapped transport, not time spent by the caller between reads.
+    """
+    def __init__(self, transport, record, response, elapsed):
+        import tempfile
+        self.transport = transport
+        self.record = record
+        self.response = response
+        self.code = response.code
+        self.msg = record['msg']
+        self._elapsed = elapsed
+        self._spool = tempfile.TemporaryFile()
+        self._done = False
+
+    def __getattr__(self, attr):
+        return getattr(self.response, attr)
+
+    def read(self, size=-1):
+        import time
+        start = time.time()
+        data = self.response.read(size)
+        self._elapsed += time.time() - start
+        if not self._done:
+            self._spool.write(_escape(data))
+            if not data or size is None or size < 0:
+                self._finish()
+        return data
+
+    def _finish(self):
+        from functools import partial
+        from .connect import CHUNK_SIZE
+        self._done = True
+        self._spool.seek(0)
+        try:
+            self.transport._write(self.record,
+                                  iter(partial(self._spool.read, CHUNK_SIZE),
+                                       ''), self._elapsed)
+        finally:
+            self._spool.close()
+
+    def close(self):
+        from .connect import CHUNK_SIZE
+        if not self._done:
+            # the rest of the body is recorded, so that it can be replayed
+            try:
+                while self.read(CHUNK_SIZE):
+                    pass
+            except Exception:  # an incomplete body is not recorded
+                self._done = True
+                self._spool.close()
+        self.response.close()
+
+
+def _record(url, response):
+    """Return the (body-less) cassette record of a response
+    """
+    return {'url': url, 'final_url': response.geturl(),
+            'code': response.code, 'msg': getattr(response, 'msg', ''),
+            'headers': dict(response.info().items())}
+
+
+def _escape(data):
+    """Escape a chunk of a response body for a JSON string
+    """
+    import json
+    return json.dumps(data.decode('latin-1'))[1:-1]
+
+
+class ReplayTransport(Transport):
+    """Transport serving responses from a recorded cassette
+
+    Parameters
+    ----------
+    filename : `str`
+        path of cassette file written by a `RecordingTransport`
+    latency : `float`, `callable`, `str`, optional
+        seconds to wait before answering each request, a function
+        returning that number of seconds, or ``'recorded'`` to wait as
+        long as the original request took, default: ``0``
+    debug : `bool`, optional
+        print verbose HTTP connection status, default: `False`
+    workers : `int`, optional
+        number of threads for asynchronous requests
+
+    Notes
+    -----
+    If a URL was recorded more than once, its responses are replayed
+    in the order in which they were recorded, the last one being
+    repeated for all further requests.
+
+    Examples
+    --------
+    >>> from cis import (connect, ChannelList)
+    >>> with connect.record('query.json.gz'):
+    ...     channels = ChannelList.query('L1:PSL-ISS')
+    >>> with connect.replay('query.json.gz', latency=0.05):
+    ...     channels = ChannelList.query('L1:PSL-ISS')
+    """
+    def __init__(self, filename, latency=0, debug=False,
+                 workers=ASYNC_WORKERS):
+        super(ReplayTransport, self).__init__(debug=debug, workers=workers)
+        import gzip
+        import json
+        self.filename = filename
+        self.latency = latency
+        self.responses = {}
+        with gzip.open(filename, 'rb') as fobj:
+            for line in fobj:
+                if line.strip():
+                    record = json.loads(line)
+                    self.responses.setdefault(record['url'], []).append(
+                        record)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def open(self, url, headers=None, timeout=None):
+        if self.debug:
+            print("GET %s" % url)
+        try:
+            records = self.responses[url]
+        except KeyError:
+            raise ValueError("No response recorded for URL '%s' in %s"
+                             % (url, self.filename))
+        with self._lock:
+            i = self._counts.get(url, 0)
+            self._counts[url] = i + 1
+        record = records[min(i, len(records) - 1)]
+        latency = self.latency
+        if latency == 'recorded':
+            latency = record.get('elapsed', 0)
+        wait(latency, timeout)
+        return _response(record['final_url'], record['code'], record['msg'],
+                         record['headers'], record['body'].encode('latin-1'))
+    open.__doc__ = Transport.open.__doc__
+
+    def rewind(self):
+        """Start replaying each URL from its first recorded response
+        """
+        with self._lock:
+            self._counts = {}
+
+
+# -----------------------------------------------------------------------------
+# hedging
+
+class HedgedTransport(Transport):
+    """Transport that hedges slow requests with a duplicate request
+
+    Each request is made through the wrapped ``transport``; if no
+    response has been received once the ``percentile`` of recently
+    observed latencies has passed, a second, identical, request is made,
+    and whichever response arrives first is used. The other response is
+    closed as soon as it arrives. All CIS API requests are idempotent
+    reads, so this is always safe, at the cost of a few extra requests.
+
+    Parameters
+    ----------
+    transport : `Transport`, optional
+        transport that makes the real requests, default: a new
+        `UrllibTransport`; this is closed along with the
+        `HedgedTransport`
+    percentile : `float`, optional
+        percentile (in the interval (0, 1)) of observed latency after
+        which to hedge, default: ``0.95``
+    delay : `float`, optional
+        seconds after which to hedge until ``min_samples`` latencies
+        have been observed, default: ``1``
+    min_delay : `float`, optional
+        least number of seconds to wait before hedging, default:
+        ``0.05``
+    window : `int`, optional
+        number of recent latencies from which to estimate the
+        percentile, default: ``200``
+    min_samples : `int`, optional
+        number of latencies to observe before using the percentile,
+        default: ``20``
+    debug : `bool`, optional
+        print verbose HTTP connection status, default: `False`
+    workers : `int`, optional
+        number of threads for asynchronous requests
+
+    Attributes
+    ----------
+    requests : `int`
+        number of requests made through this transport
+    hedged : `int`
+        number of requests for which a duplicate was sent
+    won : `int`
+        number of requests answered first by the duplicate
+
+    Examples
+    --------
+    >>> transport = HedgedTransport(UrllibTransport(), percentile=0.9)
+    >>> with connect.Session(transport=transport) as session:
+    ...     channels = ChannelList.query('L1:PSL-ISS', session=session)
+    """
+    def __init__(self, transport=None, percentile=0.95, delay=1.,
+                 min_delay=0.05, window=200, min_samples=20, debug=False,
+                 workers=ASYNC_WORKERS):
+        super(HedgedTransport, self).__init__(debug=debug, workers=workers)
+        from collections import deque
+        if not 0 < percentile < 1:
+            raise ValueError("percentile must be in the interval (0, 1)")
+        if transport is None:
+            transport = UrllibTransport(debug=debug)
+        self.transport = transport
+        self.percentile = percentile
+        self.delay = delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self._lock = threading.Lock()
+        self._hedge_pool = None
+
+    @property
+    def hedge_delay(self):
+        """Seconds after which a request is hedged
+
+        :type: `float`
+        """
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return self.delay
+            latencies = sorted(self.latencies)
+        idx = min(int(self.percentile * len(latencies)), len(latencies) - 1)
+        return max(latencies[idx], self.min_delay)
+
+    def _attempts(self):
+        # requests are raced on a pool of their own, so that hedging works
+        # for requests made from the threads of `pool`
+        with self._lock:
+            if self._hedge_pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._hedge_pool = ThreadPool(2 * self.workers)
+            return self._hedge_pool
+
+    def open(self, url, headers=None, timeout=None):
+        import time
+        from Queue import (Queue, Empty)
+        results = Queue()
+        state = {'done': False}
+        lock = threading.Lock()
+        parent = timing.current()
+        pool = self._attempts()
+
+        def attempt(i):
+            start = time.time()
+            try:
+                with timing.activate(parent):
+                    response = self.transport.open(url, headers=headers,
+                                                   timeout=timeout)
+            except urllib2.HTTPError as e:  # a real answer from the server
+                response, error = e, None
+            except Exception as e:
+                response, error = None, e
+            else:
+                error = None
+            if error is None:
+                with self._lock:
+                    self.latencies.append(time.time() - start)
+            with lock:
+                if not state['done']:
+                    results.put((i, response, error))
+                    return
+            if response is not None:  # the race has been lost
+                response.close()
+
+        delay = self.hedge_delay
+        with self._lock:
+            self.requests += 1
+        pool.apply_async(attempt, (0,))
+        running = 1
+        try:
+            i, response, error = results.get(timeout=delay)
+        except Empty:
+            with self._lock:
+                self.hedged += 1
+            timing.incr('hedge.issued')
+            pool.apply_async(attempt, (1,))
+            running = 2
+            i, response, error = results.get()
+        # if one attempt failed, wait for the other
+        if error is not None and running == 2:
+            i, response, error = results.get()
+        with lock:
+            state['done'] = True
+        # close any response that arrived at the same time
+        while not results.empty():
+            extra = results.get()[1]
+            if extra is not None:
+                extra.close()
+        # only a real response from the duplicate counts as a win
+        if (i == 1 and error is None and
+                not isinstance(response, urllib2.HTTPError)):
+            with self._lock:
+                self.won += 1
+            timing.incr('hedge.won')
+        if error is not None:
+            raise error
+        if isinstance(response, urllib2.HTTPError):
+            raise response
+        return response
+    open.__doc__ = Transport.open.__doc__
+
+    def close(self):
+        """Close this transport, and the transport it wraps
+        """
+        super(HedgedTransport, self).close()
+        with self._lock:
+            pool, self._hedge_pool = self._hedge_pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+        self.transport.close()
+
+
+# -----------------------------------------------------------------------------
+# adaptive concurrency
+
+# HTTP statuses that signal an overloaded (rather than a wrong) request
+TRANSIENT_STATUS = (429, 500, 502, 503, 504)
+
+_LIMITER = None
+_LIMITER_LOCK = threading.Lock()
+
+
+class AdaptiveLimiter(object):
+    """Adaptive limit on the number of concurrent requests to a server
+
+    The limit follows an additive-increase, multiplicative-decrease
+    (AIMD) rule, as used for TCP congestion control: every successful
+    request while the limit is in use raises it by ``increase / limit``
+    (so by ``increase`` for each full window of requests), and every
+    sign of overload multiplies it by ``decrease``. Overload signalled
+    by requests that started before the last decrease is ignored, so
+    that a burst of failures only shrinks the limit once.
+
+    Parameters
+    ----------
+    initial : `float`, optional
+        starting limit, default: `ASYNC_WORKERS`
+    minimum : `float`, optional
+        smallest limit, default: ``1``
+    maximum : `float`, optional
+        largest limit, default: ``64``
+    increase : `float`, optional
+        additive increase per window of successful requests,
+        default: ``1``
+    decrease : `float`, optional
+        multiplicative decrease on overload, in the interval (0, 1),
+        default: ``0.5``
+
+    Attributes
+    ----------
+    limit : `float`
+        current limit, requests are admitted while fewer than
+        ``int(limit)`` are in flight
+    inflight : `int`
+        number of requests in flight
+    """
+    def __init__(self, initial=ASYNC_WORKERS, minimum=1, maximum=64,
+                 increase=1., decrease=0.5):
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be in the interval (0, 1)")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.inflight = 0
+        self._epoch = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Wait until a request may be made
+
+        Parameters
+        ----------
+        timeout : `float`, optional
+            seconds to wait for the request to be admitted,
+            default: wait forever
+
+        Returns
+        -------
+        token : `int`
+            token to pass to `release` once the request is complete
+
+        Raises
+        ------
+        socket.timeout
+            if the request is not admitted within ``timeout``
+        """
+        import time
+        deadline = timeout is not None and time.time() + timeout or None
+        with self._cond:
+            while self.inflight >= max(int(self.limit), 1):
+                if deadline is None:
+                    self._cond.wait()
+                    continue
+                left = deadline - time.time()
+                if left <= 0:
+                    raise socket.timeout('timed out waiting for a request '
+                                         'slot')
+                self._cond.wait(left)
+            self.inflight += 1
+            return self._epoch
+
+    def release(self, token, overloaded=False):
+        """Record the outcome of a request admitted by `acquire`
+
+        Parameters
+        ----------
+        token : `int`
+            the token returned by `acquire`
+        overloaded : `bool`, optional
+            `True` if the request failed because the server is
+            overloaded, default: `False`
+        """
+        with self._cond:
+            if overloaded:
+                if token == self._epoch:
+                    self.limit = max(self.limit * self.decrease,
+                                     self.minimum)
+                    self._epoch += 1
+            # only grow the limit when it is the bottleneck
+            elif self.inflight >= self.limit / 2.:
+                self.limit = min(self.limit + self.increase / self.limit,
+                                 self.maximum)
+            self.inflight -= 1
+            self._cond.notify_all()
+
+
+def default_limiter():
+    """Return the `AdaptiveLimiter` shared by all `LimitedTransport`
+    objects created without one
+    """
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = AdaptiveLimiter()
+        return _LIMITER
+
+
+class LimitedTransport(Transport):
+    """Transport that adapts its concurrency to the capacity of the server
+
+    Every request is admitted through an `AdaptiveLimiter`, so that
+    many threads (e.g. those fetching descriptions) cannot overwhelm the
+    server. Requests that fail with a transient error (an HTTP status in
+    `TRANSIENT_STATUS`, or a refused or reset connection) shrink the
+    limit and are retried after an exponential backoff with full jitter,
+    or after the delay given by a ``Retry-After`` header. Other HTTP
+    errors, such as a 404 for a channel that does not exist, are raised
+    immediately. Stalled requests shrink the limit, but are not retried,
+    since they have already used their ``timeout``; the ``timeout`` given
+    to `open` bounds all attempts, so no retry is made once it has
+    passed.
+
+    Parameters
+    ----------
+    transport : `Transport`, optional
+        transport that makes the real requests, default: a new
+        `UrllibTransport`; this is closed along with the
+        `LimitedTransport`
+    limiter : `AdaptiveLimiter`, optional
+        limiter to admit requests through, default: a limiter shared by
+        all `LimitedTransport` objects in this process, see
+        `default_limiter`
+    retries : `int`, optional
+        number of times to retry a request after a transient error,
+        default: ``3``
+    backoff : `float`, optional
+        seconds of backoff before the first retry, doubled for each
+        later retry, default: ``0.1``
+    max_backoff : `float`, optional
+        longest backoff (seconds), including any ``Retry-After``,
+        default: ``10``
+    debug : `bool`, optional
+        print verbose HTTP connection status, default: `False`
+    workers : `int`, optional
+        number of threads for asynchronous requests, default: the
+        ``maximum`` of ``limiter``, so that the number of threads never
+        caps the number of requests in flight below the limit
+
+    Attributes
+    ----------
+    retried : `int`
+        number of retries made through this transport
+
+    Examples
+    --------
+    >>> transport = LimitedTransport(UrllibTransport(), retries=5)
+    >>> with connect.Session(transport=transport) as session:
+    ...     channels = ChannelList.query('L1:PSL-ISS', session=session)
+    """
+    def __init__(self, transport=None, limiter=None, retries=3, backoff=0.1,
+                 max_backoff=10., debug=False, workers=None):
+        if transport is None:
+            transport = UrllibTransport(debug=debug)
+        limiter = limiter or default_limiter()
+        super(LimitedTransport, self).__init__(
+            debug=debug, workers=workers or int(limiter.maximum))
+        self.transport = transport
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retried = 0
+
+    def open(self, url, headers=None, timeout=None):
+        import time
+        import random
+        # the timeout bounds all attempts, including the backoff between
+        deadline = timeout is not None and time.time() + timeout or None
+        attempt = 0
+        while True:
+            if deadline is not None and attempt:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    raise socket.timeout('timed out')
+            token = self.limiter.acquire(timeout)
+            try:
+                response = self.transport.open(url, headers=headers,
+                                               timeout=timeout)
+            except urllib2.HTTPError as e:
+                transient = e.code in TRANSIENT_STATUS
+                self.limiter.release(token, overloaded=transient)
+                if not transient or attempt >= self.retries:
+                    raise
+                delay = _retry_after(e)
+                e.close()
+                reason = 'http.%d' % e.code
+            except Exception as e:
+                stalled = _is_timeout(e)
+                transient = stalled or _is_connection_error(e)
+                self.limiter.release(token, overloaded=transient)
+                if stalled or not transient or attempt >= self.retries:
+                    raise
+                delay = None
+                reason = 'connection'
+            else:
+                self.limiter.release(token)
+                return response
+            if delay is None:
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+            delay = min(delay, self.max_backoff)
+            if deadline is not None:
+                left = deadline - time.time()
+                if left <= 0:
+                    raise socket.timeout('timed out')
+                delay = min(delay, left)
+            attempt += 1
+            self.retried += 1
+            timing.incr('retry.%s' % reason)
+            if self.debug:
+                print("Retrying %s in %.2f seconds (%s)" % (url, delay,
+                                                            reason))
+            time.sleep(delay)
+    open.__doc__ = Transport.open.__doc__
+
+    def close(self):
+        """Close this transport, and the transport it wraps
+        """
+        super(LimitedTransport, self).close()
+        self.transport.close()
+
+
+def _retry_after(error):
+    """Return the seconds given by the ``Retry-After`` header of an
+    `~urllib2.HTTPError`, or `None`
+    """
+    try:
+        return max(float(error.info().getheader('Retry-After')), 0)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _is_timeout(error):
+    """Returns `True` if the given error is from a socket timeout
+    """
+    if isinstance(error, urllib2.URLError):
+        error = getattr(error, 'reason', error)
+    # SSL sockets raise `ssl.SSLError('The read operation timed out')`
+    return (isinstance(error, socket.timeout) or
+            isinstance(error, IOError) and 'timed out' in str(error))
+
+
+def _is_connection_error(error):
+    """Returns `True` if the given error is from a refused, reset, or
+    dropped connection
+    """
+    if isinstance(error, urllib2.URLError):
+        error = getattr(error, 'reason', error)
+    return isinstance(error, (socket.error, httplib.BadStatusLine))
+
+
+def wait(latency, timeout=None):
+    """Emulate the latency of a request, respecting a timeout
+
+    Parameters
+    ----------
+    latency : `float`, `callable`
+        seconds to wait, or a function returning that number of seconds
+    timeout : `float`, optional
+        seconds after which to give up waiting
+
+    Raises
+    ------
+    socket.timeout
+        if the ``latency`` is longer than the ``timeout``
+    """
+    import time
+    if callable(latency):
+        latency = latency()
+    if timeout is not None and latency > timeout:
+        time.sleep(timeout)
+        raise socket.timeout('timed out')
+    if latency:
+        time.sleep(latency)
+
+
+def _response(url, code, msg, headers, body):
+    """Build a response for `Transport.open` from its parts
+
+    Raises
+    ------
+    urllib2.HTTPError
+        if ``code`` is an HTTP error status
+    """
+    import urllib
+    import urllib2
+    from StringIO import StringIO
+    hdrs = _message(headers)
+    if code >= 400:
+        raise urllib2.HTTPError(url, code, msg, hdrs, StringIO(body))
+    response = urllib.addinfourl(StringIO(body), hdrs, url, code)
+    response.msg = msg
+    return response
+
+
+def _message(headers):
+    """Format a `dict` of headers as a :class:`mimetools.Message`
+    """
+    import mimetools
+    from StringIO import StringIO
+    return mimetools.Message(StringIO(''.join(
+        '%s: %s\r\n' % item for item in headers.items()) + '\r\n'))